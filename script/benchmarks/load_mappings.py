@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+'''
+Time loading mappings with the pure Python YAML parser, with libyaml and
+from a snapshot.
+
+Generates a mapping directory with --articles articles in the format the
+bot writes, unless --mappings points at a real one.
+'''
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import yaml
+
+from docmap.store import YAMLMappingStore
+
+def generate(mapping_dir, articles):
+    '''Write a synthetic mapping directory'''
+    folders = max(1, articles // 10)
+    categories = max(1, folders // 10)
+    content = {
+        'articles': {
+            aid: {
+                'title': 'Article number {}'.format(aid),
+                'parent': aid % folders + 1,
+                'sha1': '{:040x}'.format(aid),
+                'source_sha1': '{:040x}'.format(aid * 7),
+                'renderer': 'markdown;markdown=2.6.11',
+                'freshdesk': {
+                    'id': 6000020000 + aid,
+                    'folder_id': 6000110000 + aid % folders,
+                    'category_id': 6000070000 + aid % categories,
+                },
+            } for aid in range(1, articles + 1)
+        },
+        'folders': {
+            fid: {
+                'title': 'Folder number {}'.format(fid),
+                'parent': fid % categories + 1,
+                'freshdesk': {
+                    'id': 6000110000 + fid,
+                    'category_id': 6000070000 + fid % categories,
+                },
+            } for fid in range(1, folders + 1)
+        },
+        'categories': {
+            cid: {
+                'title': 'Category number {}'.format(cid),
+                'freshdesk': {'id': 6000070000 + cid},
+            } for cid in range(1, categories + 1)
+        },
+        'counters': {
+            'article': articles, 'folder': folders, 'category': categories
+        },
+    }
+    for mapping, records in content.items():
+        with open(os.path.join(mapping_dir, '{}.yaml'.format(mapping)), 'w') as f:
+            f.write(yaml.dump(records, default_flow_style=None))
+
+def best_of(repeat, load):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        load()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mappings', help='Existing mapping directory')
+    parser.add_argument('--articles', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mapping_dir = args.mappings
+        if mapping_dir is None:
+            mapping_dir = os.path.join(tmp, 'mappings')
+            os.makedirs(mapping_dir)
+            generate(mapping_dir, args.articles)
+
+        mappings = ['articles', 'folders', 'categories', 'counters']
+
+        def load_with(loader):
+            for mapping in mappings:
+                with open(os.path.join(mapping_dir, '{}.yaml'.format(mapping))) as f:
+                    yaml.load(f, Loader=loader)
+
+        results = [('yaml.SafeLoader', best_of(
+            args.repeat, lambda: load_with(yaml.SafeLoader)
+        ))]
+        if hasattr(yaml, 'CSafeLoader'):
+            results.append(('yaml.CSafeLoader', best_of(
+                args.repeat, lambda: load_with(yaml.CSafeLoader)
+            )))
+        else:
+            print('libyaml not available, skipping CSafeLoader')
+
+        store = YAMLMappingStore(mapping_dir, os.path.join(tmp, 'snapshots'))
+        for mapping in mappings:
+            # Prime the snapshots
+            store.load(mapping)
+        results.append(('YAMLMappingStore snapshot', best_of(
+            args.repeat, lambda: [store.load(m) for m in mappings]
+        )))
+
+        baseline = results[0][1]
+        for name, seconds in results:
+            print('{:<28} {:8.2f}ms {:8.1f}x'.format(
+                name, seconds * 1000, baseline / seconds
+            ))
+
+if __name__ == '__main__':
+    main()
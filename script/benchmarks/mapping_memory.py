@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+'''
+Compare the memory held by mappings kept as nested dicts with a deep
+copied snapshot (how DocumentMap used to hold them) against records with
+a fingerprint snapshot, on a large synthetic tree.
+'''
+
+import argparse
+import copy
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from docmap.fingerprint import Fingerprints, FIELDS
+from docmap.records import from_dicts
+from docmap.store import YAMLMappingStore
+from load_mappings import generate
+
+MAPPINGS = ['articles', 'folders', 'categories']
+
+def measure(build):
+    '''Bytes still allocated by what build returns, and how long it took'''
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = build()
+    seconds = time.perf_counter() - start
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return size, seconds
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--articles', type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        generate(tmp, args.articles)
+        store = YAMLMappingStore(tmp)
+
+        def dicts():
+            content = {mapping: store.load(mapping) for mapping in MAPPINGS}
+            return content, copy.deepcopy(content)
+
+        def records():
+            kept = {}
+            for mapping in MAPPINGS:
+                content = from_dicts(mapping, store.load(mapping))
+                kept[mapping] = (
+                    content, Fingerprints(FIELDS[mapping], content)
+                )
+            return kept
+
+        results = [
+            ('dicts + deepcopy', measure(dicts)),
+            ('records + fingerprints', measure(records)),
+        ]
+
+    print('{} articles'.format(args.articles))
+    baseline = results[0][1][0]
+    for name, (size, seconds) in results:
+        print('{:<24} {:8.1f}MB {:6.0f}% {:8.2f}s'.format(
+            name, size / 1024 / 1024, 100 * size / baseline, seconds
+        ))
+
+if __name__ == '__main__':
+    main()
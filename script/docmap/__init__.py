@@ -6,14 +6,16 @@
 """
 
 import logging
-import re
 import os
-import yaml
-import copy
+import subprocess
 from hashlib import sha1
-from markdown import markdown
-from markdown.extensions import tables
-from . import imagelinkrewrite
+from .render import render_all, backend_config, RenderTimings
+from .blobstore import BlobStore
+from .store import YAMLMappingStore
+from .fingerprint import Fingerprints, FIELDS, changed_fields, flag_update
+from .records import KIND_TYPES, from_dicts, to_dicts
+from .tree import scan_tree
+from .gitdiff import head_commit, changed_paths
 
 log = logging.getLogger()
 
@@ -27,52 +29,9 @@ class DocumentMap:
     various systems
     '''
 
-    # Define a regular expression to use to parse out internal Document IDs
-    docid_check = re.compile(
-        '''
-        ^(.*{sep})*                 # Ignore directory path
-        [^{sep2}]+--DOCID\d+(\.[Mm][Dd])?$  # DOCID Delimiter for quick check
-        '''.format(sep=os.sep,sep2=os.sep),
-        re.VERBOSE
-    )
-
-    # Only parse out title
-    title_re = re.compile(
-        '''
-        ^(.*{sep})*                 # Ignore directory path
-        (?P<title>.*?)              # Parse out the title
-        (?P<extension>\.[Mm][Dd])?$ # Get the extension (case is important)
-        '''.format(sep=os.sep),
-        re.VERBOSE
-    )
-
-    # Parse out title AND docid
-    docid_re = re.compile(
-        '''
-        ^(.*{sep})*    # Ignore directory path
-        (?P<title>.*)  # Parse out the title
-        --DOCID        # DOCID delimiter
-        (?P<docid>\d+) # Parse out internal DOCID if it exists
-        (\.[Mm][Dd])?$ # Ignore .md file extension
-        '''.format(sep=os.sep),
-        re.VERBOSE
-    )
-
-    # Parse parent and document DOCIDs
-    parentid_re = re.compile(
-        '''
-        ^.*                   # Ignore up to DOCID
-        --DOCID               # DOCID delimiter
-        (?P<parent_docid>\d+) # Parse out parent DOCID
-        .*
-        --DOCID               # DOCID delimiter
-        (?P<docid>\d+)        # Parse out item DOCID
-        .*
-        ''',
-        re.VERBOSE
-    )
-
-    def __init__(self, mapping_dir, article_dir):
+    def __init__(self, mapping_dir, article_dir, render_cache=None,
+                 render_workers=1, renderer='markdown', republish_limit=None,
+                 store=None):
         '''
         mapping_dir is a path to directory with the following files:
             articles.yaml
@@ -85,8 +44,14 @@ class DocumentMap:
         # Articles
         1:
             title: Title
+            parent: <folder DOCID>
+            sha1: <sha1 of rendered HTML, kept in html/>
+            source_sha1: <sha1 of the markdown source>
+            renderer: <renderer the HTML was made with>
             freshdesk:
-                <info from freshdesk api>
+                id: <Freshdesk article ID>
+                folder_id: <Freshdesk folder ID>
+                category_id: <Freshdesk category ID>
 
 
         Folders YAML
@@ -94,8 +59,10 @@ class DocumentMap:
         # Folders
         1:
             title: Title
+            parent: <category DOCID>
             freshdesk:
-                <info from freshdesk api>
+                id: <Freshdesk folder ID>
+                category_id: <Freshdesk category ID>
 
         Categories YAML
         ---
@@ -103,7 +70,7 @@ class DocumentMap:
         1:
             title: blah
             freshdesk:
-                <info from freshdesk api>
+                id: <Freshdesk category ID>
 
         Counters YAML
         ---
@@ -113,10 +80,52 @@ class DocumentMap:
         folder: 1
         article: 1
 
+        html/
+        ---
+        Rendered article HTML, content addressed by sha1 (see
+        docmap.blobstore)
+
+        Sync YAML (optional)
+        ---
+        # Last commit the articles were synchronised from, used to only
+        # look at the paths that changed since
+        commit: <sha1>
+
+        Once loaded, the articles, folders and categories are kept as
+        docmap.records Article, Folder and Category records keyed by DOCID.
+
         article_dir is the full path to the directory containing articles.
+
+        render_cache is an optional RenderCache used to skip rendering
+        articles whose source hasn't changed.
+
+        render_workers is the number of processes articles are rendered
+        in.
+
+        renderer is the name of the rendering backend, see docmap.render.
+
+        republish_limit caps how many articles whose HTML only changed
+        because the renderer did are republished per run, the rest wait
+        for later runs. None means no limit.
+
+        store is the MappingStore the mappings are kept in, by default the
+        YAML files above (see docmap.store). The HTML blobs always live in
+        mapping_dir.
         '''
         self.mapping_dir = mapping_dir
+        self.store = store if store is not None\
+            else YAMLMappingStore(mapping_dir)
         self.article_dir = article_dir
+        self.blobs = BlobStore(os.path.join(mapping_dir, 'html'))
+        self.render_cache = render_cache
+        self.render_workers = render_workers
+        self.renderer = renderer
+        # Everything about the renderer that changes its output, for cache
+        # keys
+        self.render_config = backend_config(renderer)
+        self.render_timings = RenderTimings()
+        self.republish_limit = republish_limit
+        self.republish_pending = 0
         self.articles = None
         self.orig_articles = None
         self.folders = None
@@ -124,6 +133,7 @@ class DocumentMap:
         self.categories = None
         self.orig_categories = None
         self.counters = None
+        self.sync_state = None
         self.require_change = False
 
         # Create tracking arrays for creations, deletions, updates
@@ -135,6 +145,8 @@ class DocumentMap:
         self.article_deletions = {}
         self.folder_deletions = {}
 
+        # Updates are {DOCID: fields}, the set of title, body and parent
+        # that changed, or True for the whole record
         self.category_updates = {}
         self.article_updates = {}
         self.folder_updates = {}
@@ -143,39 +155,77 @@ class DocumentMap:
         self.load_mappings()
 
     def load_mappings(self):
-        '''Load all mapping.yaml files'''
+        '''Load all mappings from the store'''
         for mapping in ['articles', 'folders', 'categories', 'counters']:
-            with open('%s/%s.yaml' % (self.mapping_dir, mapping), 'r') as f:
-                content = yaml.load(f)
+            content = self.store.load(mapping)
+            self._migrate(mapping, content)
+            self._save_origin(mapping, content)
 
-            if content is None:
-                content = {}
+        # Sync state is optional, without it we do a full scan
+        self.sync_state = self.store.load('sync')
 
-            self._save_origin(mapping, content)
+    def _migrate(self, mapping, content):
+        '''Bring records written by older versions up to date'''
+        if mapping == 'articles':
+            self._migrate_html(content)
+
+    def _migrate_html(self, articles):
+        '''
+        Move HTML still kept inline in article records into the blob store.
+
+        Older records hashed something other than the HTML they carry, so
+        the sha1 is set to that of the HTML that was actually published.
+        '''
+        migrated = 0
+        for article in articles.values():
+            html = article.pop('html', None)
+            if html is not None:
+                article['sha1'] = self.blobs.put(html)
+                migrated += 1
+
+        if migrated:
+            log.info('Moved HTML of %s articles into the blob store' % migrated)
+            self.require_change = True
 
     def _save_origin(self, mapping, content):
-        # Create an original version to compare against
+        if mapping in FIELDS:
+            content = from_dicts(mapping, content)
+
+        # Fingerprint the original version to compare against
         if mapping == 'articles':
             self.articles = content
-            self.orig_articles = copy.deepcopy(self.articles)
+            self.orig_articles = Fingerprints(FIELDS[mapping], content)
         elif mapping == 'folders':
             self.folders = content
-            self.orig_folders = self.folders.copy()
+            self.orig_folders = Fingerprints(FIELDS[mapping], content)
         elif mapping == 'categories':
             self.categories = content
-            self.orig_categories = self.categories.copy()
+            self.orig_categories = Fingerprints(FIELDS[mapping], content)
         elif mapping == 'counters':
             self.counters = content
 
     def save_articles(self):
-        '''Save articles into articles.yaml'''
-        with open('{}/articles.yaml'.format(self.mapping_dir), 'w') as f:
-            f.write(yaml.dump(self.articles))
+        '''
+        Save articles, dropping unreferenced HTML. Returns whether the
+        articles changed.
+        '''
+        changed = self.store.save('articles', self.mapping_content('articles'))
+
+        self.blobs.prune({
+            article.sha1 for article in self.articles.values() if article.sha1
+        })
+        return changed
 
     def save_folders(self):
-        '''Save folders into folders.yaml'''
-        with open('{}/folders.yaml'.format(self.mapping_dir), 'w') as f:
-            f.write(yaml.dump(self.folders))
+        '''Save folders, returns whether they changed'''
+        return self.store.save('folders', self.mapping_content('folders'))
+
+    def mapping_content(self, mapping):
+        '''Mapping in the form it is stored in'''
+        content = getattr(self, mapping)
+        if mapping in FIELDS:
+            return to_dicts(content)
+        return content
 
     def purge_deleted_records(self):
         '''
@@ -195,470 +245,302 @@ class DocumentMap:
             del(self.categories[i])
 
     def save_categories(self):
-        '''Save categories into categories.yaml'''
-        with open('{}/categories.yaml'.format(self.mapping_dir), 'w') as f:
-            f.write(yaml.dump(self.categories))
+        '''Save categories, returns whether they changed'''
+        return self.store.save('categories', self.mapping_content('categories'))
 
     def save_counters(self):
-        '''Save counters into counters.yaml'''
-        with open('{}/counters.yaml'.format(self.mapping_dir), 'w') as f:
-            f.write(yaml.dump(self.counters))
+        '''Save counters, returns whether they changed'''
+        return self.store.save('counters', self.counters)
 
-    def update_articles(self):
+    def save_sync_state(self):
         '''
-        Updates articles, folders and categories
+        Save the last synced commit
+
+        NOTE: Only worth saving alongside a change, an older commit just
+        means a larger diff next time
         '''
+        return self.store.save('sync', self.sync_state)
 
-        # Find all characters that are not the os dir separator
-        base_depth = self.article_dir.count(os.sep)
-
-        # Loop through articles directory to find categories, folders and
-        # articles.
-        for cat in os.walk(self.article_dir, topdown=False):
-            cat_string = str(cat[0])
-
-            # Don't worry about the top level directory
-            if cat_string == self.article_dir:
-                continue
-
-            # Check if the category already has an ID
-            current_depth = cat_string.count(os.sep) - base_depth
-            matches = self.docid_check.search(cat_string)
-            if matches:
-                # We have an ID, parse out title and ID
-                parsed_name = self.docid_re.search(cat_string)
-
-                if current_depth == 1:
-                    # Check the DOCID exists
-                    category_info = self.categories.get(
-                        int(parsed_name.group('docid'))
-                    )
-                    if category_info:
-                        # Change the title if there is a discrepancy
-                        if category_info['title'] != parsed_name.group('title'):
-                            category_info['title'] = parsed_name.group('title')
-                            # NOTE = Any consumer should change title
-                            # to new 'title'
-                            category_info['action'] = {'action': 'TITLE_CHANGE'}
-                    else:
-                        # Unknown DOCID - add it in
-                        self.categories[parsed_name.group('docid')] = {
-                            'title': parsed_name.group('title'),
-                            'action': {'action': 'TITLE_CHANGE'}
-                        }
-
-                elif current_depth == 2:
-                    # Folder
-
-                    # Check the DOCID exists
-                    folder_info = self.folders.get(
-                        int(parsed_name.group('docid'))
+    def _changed_paths(self):
+        '''
+        Paths below article_dir that changed since the last synced commit,
+        or None if we need to do a full scan
+        '''
+        since = self.sync_state.get('commit')
+        if not since:
+            log.info('No previous sync recorded, doing a full scan')
+            return None
+
+        try:
+            changes = changed_paths(self.article_dir, since)
+        except (subprocess.CalledProcessError, OSError) as e:
+            log.warning(
+                'Could not diff against %s, doing a full scan: %s' % (since, e)
+            )
+            return None
+
+        paths = set()
+        for status, old_path, new_path in changes:
+            paths.add(old_path)
+            paths.add(new_path)
+
+        log.info('%s paths changed since %s' % (len(paths), since))
+        return paths
+
+    def update_articles(self, incremental=False):
+        '''
+        Updates articles, folders and categories
+
+        If incremental is set, only the paths that changed in git since the
+        last synced commit are looked at, falling back to a full scan when
+        that isn't possible.
+        '''
+        paths = self._changed_paths() if incremental else None
+
+        # Articles waiting on a renderer republish aren't in any diff
+        if paths is not None and self._stale_renderer_ids():
+            log.info('Republish after renderer change pending, doing a full scan')
+            paths = None
+
+        # One pass over the article directory, everything after this
+        # queries the tree rather than the filesystem
+        tree = scan_tree(self.article_dir, paths)
+
+        # Remember where we got to for the next incremental run
+        commit = head_commit(self.article_dir)
+        if commit:
+            self.sync_state['commit'] = commit
+
+        # Make sure everything in the tree has a DOCID, renaming new
+        # categories, folders and articles on disk as we go
+        for category in tree.categories:
+            self._check_entry(
+                tree, category, 'category', self.categories,
+                self.category_creations, self.category_updates
+            )
+            for folder in category.folders:
+                self._check_entry(
+                    tree, folder, 'folder', self.folders,
+                    self.folder_creations, self.folder_updates
+                )
+                for article in folder.articles:
+                    self._check_entry(
+                        tree, article, 'article', self.articles,
+                        self.article_creations, self.article_updates
                     )
-                    if folder_info:
-                        # Change the title if there is a discrepancy
-                        if folder_info['title'] != parsed_name.group('title'):
-                            folder_info['title'] = parsed_name.group('title')
-                            # NOTE = Any consumer should change title
-                            # to new 'title'
-                            folder_info['action'] = {'action': 'TITLE_CHANGE'}
-                    else:
-                        # Unknown DOCID - add it in
-                        self.folders[int(parsed_name.group('docid'))] = {
-                            'title': parsed_name.group('title'),
-                            'action': {'action': 'TITLE_CHANGE'}
-                        }
-
-                    # Now, get the files in this folder, and check their names
-                    for listing in os.walk(cat_string, topdown=False):
-                        directory = cat_string
-                        articles = listing[2]
-
-                        for article in articles:
-                            got_id = self.docid_check.search(article)
-                            if got_id:
-                                # We have an ID, parse out title and ID
-
-                                article_info = self.docid_re.search(article)
-
-                                # Check the DOCID exists
-                                article_dict = self.articles.get(
-                                    int(article_info.group('docid'))
-                                )
-                                if article_dict:
-                                    # Change the title if there is a discrepancy
-                                    if article_dict['title'] != article_info.group('title'):
-                                        article_dict['title'] = article_info.group('title')
-                                        # NOTE = Any consumer should change title to new 'title'
-                                        article_dict['action'] = {'action': 'TITLE_CHANGE'}
-                                else:
-                                    # Unknown DOCID - add it in
-                                    self.articles[int(parsed_name.group('docid'))] = {
-                                        'title': article_info.group('title'),
-                                        'action': {'action': 'TITLE_CHANGE'}
-                                    }
-
-                            else:
-                                # No ID, need a new one
-                                # Flag that we need to update
-
-                                article_info = self.title_re.search(article)
-
-                                # Ignore any files that aren'd Markdown
-                                if article_info.group('extension'):
-                                    # Update the latest article ID
-                                    self.counters['article'] += 1
-
-                                    # Flag renaming Category
-                                    old_name = '{dir}{sep}{title}{extension}'.format(
-                                        dir=directory,
-                                        sep=os.sep,
-                                        title=article_info.group('title'),
-                                        extension=article_info.group('extension')
-                                    )
-
-                                    new_name = '{dir}{sep}{title}--DOCID{docid}{extension}'\
-                                        .format(
-                                            dir=directory,
-                                            sep=os.sep,
-                                            title=article_info.group('title'),
-                                            docid=self.counters['article'],
-                                            extension=article_info.group('extension')
-                                        )
-
-                                    # Add information about this article
-                                    self.articles[self.counters['article']] = {
-                                        'title': article_info.group('title'),
-                                        'action': {
-                                            'action': 'CREATE',
-                                            'from': old_name,
-                                            'to': new_name
-                                        }
-                                    }
 
+        # Now that all IDS have been assigned, we can map parent IDS properly
+        for folder in tree.folders():
+            self.folders[folder.docid].parent = folder.category.docid
+
+        articles = list(tree.articles())
+        for article in articles:
+            self.articles[article.docid].parent = article.folder.docid
+
+        # Render everything in one go so it can be spread over processes
+        republish = []
+        for article, (html, source_sha1) in zip(
+            articles, self._render_articles(articles)
+        ):
+            html_sha1 = sha1(html.encode('utf-8')).hexdigest()
+            if self._renderer_only_change(article.docid, html_sha1, source_sha1):
+                republish.append((article.docid, html, html_sha1, source_sha1))
             else:
-                # No ID, just a title
-                # XXX Debugging
-
-                # Get the current relative depth
-                # 1 = Category
-                # 2 = Folder
+                self._set_rendered(article.docid, html, html_sha1, source_sha1)
 
-                parsed_name = self.title_re.search(cat_string)
-                if current_depth == 1:
-                    # Category
+        self._throttle_republish(republish)
 
-                    # Flag that we need to update
-                    # Update the latest cat ID
-                    self.counters['category'] += 1
+        if self.render_cache:
+            log.info('Render cache: %s hits, %s misses' % (
+                self.render_cache.hits, self.render_cache.misses
+            ))
+            self.render_cache.prune()
 
-                    # Flag renaming Category
-                    new_name = '{oldname}--DOCID{docid}'.format(
-                        oldname=cat_string,
-                        docid=self.counters['category']
-                    )
-
-                    # Add information about this category
-                    self.categories[self.counters['category']] = {
-                        'title': parsed_name.group('title'),
-                        'action': {
-                            'action': 'CREATE',
-                            'from': cat_string,
-                            'to': new_name
-                        }
-                    }
-
-                elif current_depth == 2:
-                    # Folder
-
-                    # Flag that we need to update
-                    # Update the latest folder ID
-                    self.counters['folder'] += 1
-
-                    # Flag renaming Category
-                    new_name = '{oldname}--DOCID{docid}'.format(
-                        oldname=cat_string,
-                        docid=self.counters['folder']
-                    )
-
-                    # Add information about this folder
-                    self.folders[self.counters['folder']] = {
-                        'title': parsed_name.group('title'),
-                        'action': {
-                            'action': 'CREATE',
-                            'from': cat_string,
-                            'to': new_name
-                        }
-                    }
-
-                    # Now, get the files in this folder, and check their names
-                    for listing in os.walk(cat_string, topdown=False):
-                        directory = cat_string
-                        articles = listing[2]
-
-                        for article in articles:
-                            got_id = self.docid_check.search(article)
-                            if got_id:
-                                # We have an ID, parse out title and ID
-                                article_info = self.docid_re.search(article)
-
-                                # Check the DOCID exists
-                                article_dict = self.articles.get(
-                                    int(article_info.group('docid'))
-                                )
-                                if article_dict:
-                                    # Change the title if there is a discrepancy
-                                    if article_dict['title'] != article_info.group('title'):
-                                        article_dict['title'] = article_info.group('title')
-                                        # NOTE = Any consumer should change title to
-                                        # new 'title'
-                                        article_dict['action'] = {'action': 'TITLE_CHANGE'}
-                                else:
-                                    # Unknown DOCID - add it in
-                                    self.articles[article_info.group('docid')] = {
-                                        'title': article_info.group('title'),
-                                        'action': {'action': 'TITLE_CHANGE'}
-                                    }
-                            else:
-                                # No ID, need a new one
-                                # Flag that we need to update
-
-                                article_info = self.title_re.search(article)
-
-                                if article_info.group('extension'):
-                                    # Update the latest article ID
-                                    self.counters['article'] += 1
-                                    # Flag renaming Article
-                                    oldname = '{dir}{sep}{title}'.format(
-                                        dir=directory,
-                                        sep=os.sep,
-                                        title=article_info.group('title')
-                                    )
-
-                                    article_name =\
-                                        '{oldname}--DOCID{docid}{extension}'\
-                                        .format(
-                                            oldname=oldname,
-                                            docid=self.counters['article'],
-                                            extension=article_info.group('extension')
-                                        )
-
-                                    # Add information about this article
-                                    self.articles[self.counters['article']] = {
-                                        'title': article_info.group('title'),
-                                        'action': {
-                                            'action': 'CREATE',
-                                            'from': '{name}{extension}'.format(
-                                                name=oldname,
-                                                extension=article_info.group('extension')
-                                            ),
-                                            'to': article_name
-                                        }
-                                    }
-
-                else:
-                    # Too deep, ignore
-                    pass
-
-        # We now have all the information required to rename files and folders
-
-        # Start with articles
-        for aid, article in self.articles.items():
-            # Check if there is an action
-            action = article.get('action')
-            if action:
-                # Need to create a branch
-                self.require_change = True
-                # If it is a new file, we need to rename it with the new
-                # DOCID
-                if action['action'] == 'CREATE':
-                    os.rename(
-                        action['from'],
-                        action['to']
-                    )
-                    self.article_creations[aid] = True
-                    self.require_change = True
-                elif action['action'] == 'TITLE_CHANGE':
-                    self.article_updates[aid] = True
-                    self.require_change = True
-
-        # Delete the actions
-        for i in self.article_creations:
-            del(self.articles[i]['action'])
-        for i in self.article_updates:
-            del(self.articles[i]['action'])
-
-        # Then to folders
-        for fid, folder in self.folders.items():
-            # Check if there is an action
-            action = folder.get('action')
-            if action:
-                # Need to create a branch
-                self.require_change = True
-                # If it is a new file, we need to rename it with the new
-                # DOCID
-                if action['action'] == 'CREATE':
-                    os.rename(
-                        action['from'],
-                        action['to']
-                    )
-                    self.folder_creations[fid] = True
-                    self.require_change = True
-                if action['action'] == 'TITLE_CHANGE':
-                    self.folder_updates[fid] = True
-                    self.require_change = True
+        # Find the deleted and updated items
+        self._find_changes(tree)
 
-        # Delete the actions
-        for i in self.folder_creations:
-            del(self.folders[i]['action'])
-        for i in self.folder_updates:
-            del(self.folders[i]['action'])
-
-        # Finally Categories
-        category_creations = []
-        for cid, category in self.categories.items():
-            # Check if there is an action
-            action = category.get('action')
-            if action:
-                # Need to create a branch
-                self.require_change = True
+    def _check_entry(self, tree, entry, kind, records, creations, updates):
+        '''
+        Make sure a tree entry has a DOCID and a record with a matching
+        title, flagging creations and updates
+        '''
+        if entry.docid is None:
+            # No ID, need a new one
+            docid = self.store.next_id(kind, self.counters[kind])
+            self.counters[kind] = docid
+            tree.assign_docid(entry, docid)
+
+            records[docid] = KIND_TYPES[kind](entry.title)
+            creations[docid] = True
+            self.require_change = True
+            return
+
+        record = records.get(entry.docid)
+        if record is None:
+            # Unknown DOCID - add it in
+            records[entry.docid] = KIND_TYPES[kind](entry.title)
+            updates[entry.docid] = True
+            self.require_change = True
+        elif record.title != entry.title:
+            # Change the title if there is a discrepancy
+            # NOTE = Any consumer should change title to new 'title'
+            record.title = entry.title
+            flag_update(updates, entry.docid, ['title'])
+            self.require_change = True
+
+    def _render_articles(self, articles):
+        '''
+        Render article files in the tree into HTML, in order. Returns a
+        list of (html, sha1 of the markdown source).
+        '''
+        htmls = [None] * len(articles)
+        source_sha1s = [None] * len(articles)
+        jobs = []
+        keys = []
+        for i, article in enumerate(articles):
+            with open(article.path, 'r') as f:
+                source = f.read()
+            source_sha1s[i] = sha1(source.encode('utf-8')).hexdigest()
+
+            # Need to convert the file system path to an encoded URL
+            image_url = article.folder.path.replace(self.article_dir, 'articles')
+
+            if self.render_cache:
+                key = self.render_cache.key(
+                    source, image_url, self.render_config
+                )
+                htmls[i] = self.render_cache.get(key)
+                if htmls[i] is not None:
+                    continue
+                keys.append(key)
+
+            jobs.append((i, (source, image_url)))
+
+        rendered = render_all(
+            [job for i, job in jobs],
+            self.render_workers,
+            self.render_timings,
+            self.renderer
+        )
+        log.info('Rendering: %s' % self.render_timings)
+        for n, (i, job) in enumerate(jobs):
+            htmls[i] = rendered[n]
+            if self.render_cache:
+                self.render_cache.put(keys[n], rendered[n])
+
+        return list(zip(htmls, source_sha1s))
+
+    def _set_rendered(self, aid, html, html_sha1, source_sha1):
+        '''Store freshly rendered HTML and point an article record at it'''
+        article = self.articles[aid]
+        if (article.source_sha1, article.renderer)\
+        != (source_sha1, self.render_config):
+            # The mappings change and need committing, even if the HTML
+            # came out the same
+            self.require_change = True
+        article.sha1 = self.blobs.put(html, html_sha1)
+        article.source_sha1 = source_sha1
+        article.renderer = self.render_config
+
+    def _stale_renderer_ids(self):
+        '''Articles last rendered by a different, known renderer'''
+        return [
+            aid for aid, article in self.articles.items()
+            if article.renderer not in (None, self.render_config)
+        ]
+
+    def _renderer_only_change(self, aid, html_sha1, source_sha1):
+        '''
+        Whether the HTML of an article changed only because the renderer
+        did, i.e. its source, title and parent are what was last published.
 
-                # If it is a new file, we need to rename it with the new
-                # DOCID
-                if action['action'] == 'CREATE':
-                    os.rename(
-                        action['from'],
-                        action['to']
-                    )
-                    self.category_creations[cid] = True
-                if action['action'] == 'TITLE_CHANGE':
-                    self.category_updates[cid] = True
+        Records that predate source_sha1 can't be told apart from a
+        content change, so they are never treated as renderer only.
+        '''
+        orig = self.orig_articles.get(aid)
+        if orig is None\
+        or aid in self.article_creations\
+        or aid in self.article_updates:
+            return False
+
+        article = self.articles[aid]
+        return\
+            orig.get('sha1') != html_sha1\
+            and\
+            orig.get('source_sha1') == source_sha1\
+            and\
+            orig.get('renderer') != self.render_config\
+            and\
+            article.title == orig['title']\
+            and\
+            article.parent == orig['parent']
+
+    def _throttle_republish(self, republish):
+        '''
+        Accept up to republish_limit of the (aid, html, html_sha1,
+        source_sha1) renderer only changes, lowest DOCID first. The rest
+        keep their old HTML and renderer so they come up again next run.
+        '''
+        republish.sort(key=lambda r: r[0])
+        limit = len(republish) if self.republish_limit is None\
+            else self.republish_limit
 
-        # Delete the actions
-        for i in self.category_creations:
-            del(self.categories[i]['action'])
-        for i in self.category_updates:
-            del(self.categories[i]['action'])
+        for aid, html, html_sha1, source_sha1 in republish[:limit]:
+            self._set_rendered(aid, html, html_sha1, source_sha1)
 
-        # Now that all IDS have been assigned, we can map parent IDS properly
-        for cat in os.walk(self.article_dir, topdown=False):
-            cat_string = str(cat[0])
-
-            # Don't worry about the top level directory
-            if cat_string == self.article_dir:
-                continue
-
-            # Check if the category already has an ID
-            current_depth = cat_string.count(os.sep) - base_depth
-            if current_depth == 1:
-                # Categories don't have parents, but we need to record that
-                # we found it for deletions.
-                matches = self.docid_re.search(cat_string)
-                self.categories[int(matches.group('docid'))]['found'] = True
-            elif current_depth == 2:
-                # Folder
-                matches = self.parentid_re.search(cat_string)
-
-                # Set the folder parent
-                folder_info = self.folders.get(int(matches.group('docid')))
-                folder_info['parent'] = int(matches.group('parent_docid'))
-                folder_info['found'] = True
-
-                # Now, get the files in this folder, and check their names
-                for listing in os.walk(cat_string, topdown=False):
-                    directory = cat_string
-                    articles = listing[2]
-
-                    for article in articles:
-                        article_info = self.docid_re.search(article)
-
-                        # Only process if it is actually an article
-                        # COULD be a .gitignore file/other file that
-                        # we don't handle
-                        if article_info:
-                            # Add the parent folder...
-                            tmp_article = self.articles[
-                                int(article_info.group('docid'))
-                            ]
-                            tmp_article['parent'] = int(matches.group('docid'))
-                            tmp_article['found'] = True
-
-                            # Add a sha1sum of the file
-                            with open(
-                                '{directory}{sep}{name}'.format(
-                                    directory=cat_string,
-                                    sep=os.sep,
-                                    name=article
-                                ),
-                                'r'
-                            ) as f:
-                                # Set up our extension
-                                # Need to convert the file system path to an encoded URL
-                                image_url = directory.replace(self.article_dir, 'articles')
-                                image_ext = imagelinkrewrite.ImageLinkRewriteExtension(
-                                    image_file_path=image_url
-                                )
-                                table_ext = tables.TableExtension()
-                                temp=f.read()
-                                tmp_article['html'] =\
-                                    markdown(
-                                        temp,
-                                        extensions=[image_ext, table_ext],
-                                        output_format='html5'
-                                    )
-                                tmp_article['sha1'] =\
-                                    sha1(tmp_article['html'].encode('utf-8')).hexdigest()
+        self.republish_pending = len(republish[limit:])
+        if republish:
+            log.info(
+                'Renderer changed: republishing %s articles, %s left for '
+                'later runs' % (len(republish[:limit]), self.republish_pending)
+            )
 
-        # Find the deleted and updated items
 
-        # Categories
-        for cid, cat in self.categories.items():
-            if cat.get('found'):
-                del(cat['found'])
-                if not cid in self.category_creations:
-                    # Check for updates
-                    if cat['title'] != self.orig_categories[cid]['title']:
-                        self.category_updates[cid] = True
-                        self.require_change = True
-            else:
+    def _find_changes(self, tree):
+        '''
+        Compare the records against the tree and their original versions
+        to find deletions and updates
+        '''
+        # Categories, checking for title changes
+        found = tree.category_ids()
+        changed = self.orig_categories.changed(self.categories)
+        for cid in self.categories:
+            if cid in found:
+                if cid in changed and not cid in self.category_creations:
+                    flag_update(self.category_updates, cid, changed_fields(
+                        self.orig_categories, cid, self.categories[cid]
+                    ))
+                    self.require_change = True
+            elif tree.covers('category', cid):
                 self.category_deletions[cid] = True
                 self.require_change = True
 
-        # Folders
-        for fid, folder in self.folders.items():
-            if folder.get('found'):
-                del(folder['found'])
-                if not fid in self.folder_creations:
-                    # Check title and parent change
-                    if\
-                    folder['title'] != self.orig_folders[fid]['title']\
-                    or\
-                    folder['parent'] != self.orig_folders[fid]['parent']:
-                        self.folder_updates[fid] = True
-                        self.require_change = True
-            else:
+        # Folders, checking for title and parent changes
+        found = tree.folder_ids()
+        changed = self.orig_folders.changed(self.folders)
+        for fid in self.folders:
+            if fid in found:
+                if fid in changed and not fid in self.folder_creations:
+                    flag_update(self.folder_updates, fid, changed_fields(
+                        self.orig_folders, fid, self.folders[fid]
+                    ))
+                    self.require_change = True
+            elif tree.covers('folder', fid):
                 # Deletion
                 self.folder_deletions[fid] = True
                 self.require_change = True
 
-        # Articles
-        for aid, article in self.articles.items():
-            if article.get('found'):
-                del(article['found'])
-                if not aid in self.article_creations:
-                    log.debug('Got to here.... 1')
-                    # Check for updates to content, title and parent
-                    if\
-                    article['sha1'] != self.orig_articles[int(aid)]['sha1']\
-                    or\
-                    article['title'] != self.orig_articles[int(aid)]['title']\
-                    or\
-                    article['parent'] != self.orig_articles[int(aid)]['parent']:
-                        log.debug('Got to here.... 2')
-                        self.article_updates[aid] = True
-                        self.require_change = True
-                else:
-                    log.debug('Got to here.... 3')
-            else:
+        # Articles, checking for content, title and parent changes
+        found = tree.article_ids()
+        fields = ('title', 'parent', 'sha1')
+        changed = self.orig_articles.changed(self.articles, fields)
+        for aid in self.articles:
+            if aid in found:
+                if aid in changed and not aid in self.article_creations:
+                    flag_update(self.article_updates, aid, changed_fields(
+                        self.orig_articles, aid, self.articles[aid], fields
+                    ))
+                    self.require_change = True
+            elif tree.covers('article', aid):
                 self.article_deletions[aid] = True
                 self.require_change = True
-
@@ -0,0 +1,147 @@
+"""
+    docmap.aiofreshdesk
+    ~~~~~~~~~~~~~~~~~~~
+
+    Asyncio Freshdesk client, needs aiohttp
+
+    AsyncFreshDesk has the same methods as FreshDesk, as coroutines, so a
+    large republish can keep many calls in flight on one event loop
+    instead of a thread each. It builds its calls the same way and shares
+    the rate limiter and retry policy, only the HTTP requests differ. See
+    FreshDeskDocumentMap.synchronize_freshdesk_async.
+"""
+
+import asyncio
+import base64
+import json
+import logging
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from .freshdesk import FreshDesk, FreshDeskError
+
+log = logging.getLogger()
+
+def basic_auth(auth):
+    '''Authorization header for a (user, password) tuple'''
+    return 'Basic ' + base64.b64encode(':'.join(auth).encode()).decode()
+
+class Reply:
+    '''The parts of an aiohttp response FreshDesk looks at'''
+
+    def __init__(self, status_code, headers, body):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+class AsyncFreshDesk(FreshDesk):
+    '''
+    FreshDesk with coroutine API methods, use as an async context manager
+    to open and close its connections
+    '''
+
+    def __init__(self, api_url, api_token, blobs=None, connections=10,
+                 **kwargs):
+        '''
+        As per FreshDesk, keeping up to connections connections open.
+        Needs aiohttp.
+        '''
+        if aiohttp is None:
+            raise FreshDeskError('The asyncio Freshdesk client needs aiohttp')
+        super().__init__(api_url, api_token, blobs, **kwargs)
+        self.connections = connections
+        self.sleep = asyncio.sleep
+
+    @classmethod
+    def like(cls, client, connections=10):
+        '''An AsyncFreshDesk set up as per a FreshDesk client'''
+        return cls(
+            client.api_url, client.api_token, client.blobs,
+            connections=connections, timeout=client.timeout,
+            limiter=client.limiter, retries=client.retries,
+            backoff=client.backoff, max_backoff=client.max_backoff
+        )
+
+    @staticmethod
+    def new_session():
+        # Opened by __aenter__, in the event loop
+        return None
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    @staticmethod
+    def client_timeout(timeout):
+        '''A requests style timeout as an aiohttp.ClientTimeout'''
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+    async def request(self, method, url, auth, timeout=None, headers=None,
+                      data=None):
+        '''As per FreshDesk.request'''
+        attempt = 0
+        while True:
+            wait = self.limiter.reserve()
+            if wait > 0:
+                await self.sleep(wait)
+
+            try:
+                async with self.session.request(
+                    method.upper(), url,
+                    timeout=self.client_timeout(timeout),
+                    headers=dict(headers or {}, Authorization=basic_auth(auth)),
+                    data=data
+                ) as response:
+                    reply = Reply(
+                        response.status,
+                        response.headers.copy(),
+                        await response.read()
+                    )
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries or not self._retryable(method, e):
+                    raise FreshDeskError('{} {} failed after {} retries: {}'\
+                        .format(method.upper(), url, attempt, e))
+                reason = type(e).__name__
+                wait = True
+            else:
+                self.limiter.update(reply.headers)
+                if self._done(method, url, attempt, reply):
+                    return reply
+                reason = reply.status_code
+                # The limiter already waits out a Retry-After
+                wait = 'Retry-After' not in reply.headers
+
+            attempt += 1
+            await self.sleep(self._backoff(method, url, attempt, reason, wait))
+
+    @staticmethod
+    def _retryable(method, error):
+        '''As per FreshDesk._retryable'''
+        if isinstance(error, (
+            aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError
+        )):
+            return True
+        return not (isinstance(error, asyncio.TimeoutError) and method == 'post')
+
+    async def call(self, method, url, payload=None, source=None, action=None):
+        '''As per FreshDesk.call'''
+        reply = await self.request(
+            method, url, **self.call_args(method, payload)
+        )
+        return self.result(method, reply, source, action)
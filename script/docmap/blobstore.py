@@ -0,0 +1,93 @@
+"""
+    docmap.blobstore
+    ~~~~~~~~~~~~~~~~
+
+    Content addressed store for rendered article HTML
+
+    Each blob lives in <directory>/<first two hex digits>/<sha1>.html, where
+    sha1 is the hash of its UTF-8 encoding. Article records only keep the
+    sha1, and the HTML is read back when it is actually pushed.
+"""
+
+import os
+import tempfile
+from hashlib import sha1
+
+class BlobStoreError(Exception):
+    '''Custom exception for blob store issues'''
+    pass
+
+class BlobStore:
+    '''Rendered HTML keyed by its sha1'''
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    @staticmethod
+    def digest(html):
+        '''Key html is stored under'''
+        return sha1(html.encode('utf-8')).hexdigest()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest[:2], '{}.html'.format(digest))
+
+    def __contains__(self, digest):
+        return os.path.isfile(self._path(digest))
+
+    def put(self, html, digest=None):
+        '''Store html, returns its digest. Existing blobs aren't rewritten.'''
+        if digest is None:
+            digest = self.digest(html)
+
+        path = self._path(digest)
+        if os.path.isfile(path):
+            return digest
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            # newline='' so the bytes on disk are the bytes we hashed
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                f.write(html)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest):
+        '''HTML stored under digest'''
+        try:
+            with open(self._path(digest), 'r', encoding='utf-8', newline='') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise BlobStoreError(
+                'No HTML stored for {}, rerun with --fullsync to '
+                'rerender'.format(digest)
+            )
+
+    def size(self, digest):
+        '''Bytes of the HTML stored under digest, without reading it'''
+        try:
+            return os.path.getsize(self._path(digest))
+        except OSError:
+            return 0
+
+    def prune(self, keep):
+        '''Remove every blob whose digest isn't in keep, returns the count'''
+        if not os.path.isdir(self.directory):
+            return 0
+
+        removed = 0
+        for directory in os.scandir(self.directory):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                digest, extension = os.path.splitext(entry.name)
+                if extension == '.html' and digest not in keep:
+                    os.unlink(entry.path)
+                    removed += 1
+            if not os.listdir(directory.path):
+                os.rmdir(directory.path)
+        return removed
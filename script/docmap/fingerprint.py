@@ -0,0 +1,114 @@
+"""
+    docmap.fingerprint
+    ~~~~~~~~~~~~~~~~~~
+
+    Compact snapshot of mapping records as they were loaded
+
+    Change detection only ever looks at a few fields of each record, so
+    instead of copying whole records we keep a tuple of those fields per
+    DOCID. The tuples share their strings with the records, and comparing
+    a whole mapping is a single set difference.
+"""
+
+# Fields compared for each mapping
+FIELDS = {
+    'articles': ('title', 'parent', 'sha1', 'source_sha1', 'renderer'),
+    'folders': ('title', 'parent'),
+    'categories': ('title',),
+}
+
+# What a change to each field means for the published version
+CHANGES = {'title': 'title', 'parent': 'parent', 'sha1': 'body'}
+
+class Fingerprints:
+    '''Fingerprint tuple of every record in a mapping, keyed by DOCID'''
+
+    __slots__ = ('fields', 'index', 'fingerprints')
+
+    def __init__(self, fields, records):
+        self.fields = fields
+        self.index = {field: i for i, field in enumerate(fields)}
+        self.fingerprints = {
+            docid: self.fingerprint(record, fields)
+            for docid, record in records.items()
+        }
+
+    @staticmethod
+    def fingerprint(record, fields):
+        return tuple(getattr(record, field) for field in fields)
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def __contains__(self, docid):
+        return docid in self.fingerprints
+
+    def get(self, docid):
+        '''Fingerprinted fields of a record as a dict, or None'''
+        fingerprint = self.fingerprints.get(docid)
+        if fingerprint is None:
+            return None
+        return dict(zip(self.fields, fingerprint))
+
+    def update(self, docid, record):
+        '''Take record as the original version of DOCID'''
+        self.fingerprints[docid] = self.fingerprint(record, self.fields)
+
+    def discard(self, docid):
+        self.fingerprints.pop(docid, None)
+
+    def diff(self, docid, record, fields=None):
+        '''
+        Which fields (all fingerprinted fields by default) of record differ
+        from the snapshot of DOCID, None if there is none
+        '''
+        original = self.fingerprints.get(docid)
+        if original is None:
+            return None
+        return [
+            field for field in fields or self.fields
+            if getattr(record, field) != original[self.index[field]]
+        ]
+
+    def changed(self, records, fields=None):
+        '''
+        DOCIDs of records that are new or whose fields (all fingerprinted
+        fields by default) differ from the snapshot
+        '''
+        if fields is None or tuple(fields) == self.fields:
+            original = self.fingerprints.items()
+            fields = self.fields
+        else:
+            indices = [self.index[field] for field in fields]
+            original = {
+                (docid, tuple(fingerprint[i] for i in indices))
+                for docid, fingerprint in self.fingerprints.items()
+            }
+
+        current = {
+            (docid, self.fingerprint(record, fields))
+            for docid, record in records.items()
+        }
+        return {docid for docid, fingerprint in current - original}
+
+def changed_fields(fingerprints, docid, record, fields=None):
+    '''
+    What changed about a record for Freshdesk, a list of title, body and
+    parent, or True for all of it when it wasn't there before
+    '''
+    diff = fingerprints.diff(docid, record, fields)
+    if diff is None:
+        return True
+    return [CHANGES[field] for field in diff if field in CHANGES]
+
+def flag_update(updates, docid, fields):
+    '''Add fields (or True for all of them) to the updates of a record'''
+    current = updates.get(docid)
+    if current is True or fields is True:
+        updates[docid] = True
+    else:
+        updates[docid] = (current or set()) | set(fields)
+
+def update_fields(update):
+    '''The set of fields of an update, None for all of them'''
+    return None if update is True else set(update)
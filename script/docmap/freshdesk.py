@@ -1,21 +1,145 @@
+import asyncio
 import logging
-import requests
 import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
 
 from . import DocumentMap
+from .session import make_session, DEFAULT_TIMEOUT
+from .ratelimit import RateLimiter
+from .records import MAPPING_TYPES, MAPPING_KINDS
+from .remote import fetch_snapshot
+from .fingerprint import flag_update, update_fields
 
 log = logging.getLogger()
 
+class FreshDeskError(Exception):
+    '''Custom exception for Freshdesk calls that couldn't be made'''
+    pass
+
+def transient_status(status_code):
+    '''Whether a reply with status_code is worth retrying'''
+    return status_code == 429 or status_code >= 500
+
 class FreshDesk:
-    def __init__(self, api_url, api_token):
-        '''Get the basic information'''
+    def __init__(self, api_url, api_token, blobs=None, session=None,
+                 timeout=DEFAULT_TIMEOUT, limiter=None, retries=4,
+                 backoff=1.0, max_backoff=30.0):
+        '''
+        Get the basic information
+
+        blobs is the BlobStore article HTML is loaded from
+
+        session is the requests.Session calls go through, by default a
+        new pooled one (see docmap.session), and timeout is the requests
+        timeout for each call
+
+        limiter is the RateLimiter every call waits on, share one between
+        clients using the same Freshdesk account
+
+        Calls that time out, fail to connect or get a 5xx or 429 reply are
+        retried up to retries times, waiting a random time of up to
+        backoff seconds, doubling each retry up to max_backoff
+        '''
         self.api_url = api_url
+        self.blobs = blobs
+        self.session = session if session is not None else self.new_session()
+        self.timeout = timeout
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = time.sleep
+        # Retries made over the life of the client
+        self.retried = 0
+        self._retried_lock = threading.Lock()
+        # Bytes left out of update payloads as they hadn't changed
+        self.saved_bytes = 0
 
         # Set up the requests auth tuple
         self.api_token = api_token
         self.auth = (self.api_token, 'X')
         self.headers = {'Content-type': 'application/json'}
 
+    @staticmethod
+    def new_session():
+        '''Session to use when none is given'''
+        return make_session()
+
+    def article_body(self, article):
+        '''Rendered HTML of an article, only loaded when it is sent'''
+        return self.blobs.get(article.sha1)
+
+    def _saved(self, full, payload):
+        '''Count the bytes between a full payload size and the one sent'''
+        with self._retried_lock:
+            self.saved_bytes += max(0, full - len(json.dumps(payload)))
+
+    def request(self, method, url, **kwargs):
+        '''
+        Make an API call within the rate limit, retrying transient
+        failures. Client errors (4xx) are returned straight away. Raises
+        FreshDeskError if no reply could be had.
+        '''
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                reply = getattr(self.session, method)(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.retries or not self._retryable(method, e):
+                    raise FreshDeskError('{} {} failed after {} retries: {}'\
+                        .format(method.upper(), url, attempt, e))
+                reason = type(e).__name__
+                wait = True
+            else:
+                self.limiter.update(reply.headers)
+                if self._done(method, url, attempt, reply):
+                    return reply
+                reason = reply.status_code
+                # The limiter already waits out a Retry-After
+                wait = 'Retry-After' not in reply.headers
+
+            attempt += 1
+            self.sleep(self._backoff(method, url, attempt, reason, wait))
+
+    def _done(self, method, url, attempt, reply):
+        '''Whether a reply is final rather than one to retry'''
+        if attempt < self.retries and transient_status(reply.status_code):
+            return False
+        if attempt:
+            log.info('%s %s: %s after %s retries' % (
+                method.upper(), url, reply.status_code, attempt
+            ))
+        return True
+
+    def _backoff(self, method, url, attempt, reason, wait):
+        '''Count a retry, returns the seconds to wait before making it'''
+        with self._retried_lock:
+            self.retried += 1
+
+        delay = random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        ) if wait else 0
+        log.warning('%s %s: %s, retry %s of %s in %.1fs' % (
+            method.upper(), url, reason, attempt, self.retries, delay
+        ))
+        return delay
+
+    @staticmethod
+    def _retryable(method, error):
+        '''
+        Whether a failed call can be made again. A POST that timed out
+        waiting for its reply may have created something already.
+        '''
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        return not (isinstance(error, requests.ReadTimeout) and method == 'post')
+
     def log_action(self, source, action, reply):
         '''Log result of an action done to a source'''
         if reply.status_code in [200, 201]:
@@ -25,14 +149,46 @@ class FreshDesk:
             log.error('Status code: %s' % reply.status_code)
             log.error('Headers: %s' % reply.headers)
 
+    def call(self, method, url, payload=None, source=None, action=None):
+        '''
+        Make an API call, returning the reply JSON if it worked (True for
+        deletions) or None. Changes are logged as action on source.
+
+        Every API method below goes through here, so a client that
+        overrides it (see docmap.aiofreshdesk) gets them all.
+        '''
+        reply = self.request(method, url, **self.call_args(method, payload))
+        return self.result(method, reply, source, action)
+
+    def call_args(self, method, payload):
+        '''Keyword arguments for request'''
+        kwargs = {'auth': self.auth, 'timeout': self.timeout}
+        if method != 'get':
+            kwargs['headers'] = self.headers
+        if payload is not None:
+            kwargs['data'] = json.dumps(payload)
+        return kwargs
+
+    def result(self, method, reply, source=None, action=None):
+        '''What call returns for a reply'''
+        if source is not None:
+            self.log_action(source, action, reply)
+        if reply.status_code == (201 if method == 'post' else 200):
+            return True if method == 'delete' else reply.json()
+
     def get_solution_categories(self):
         '''Get all current categories'''
-        # FIXME: never called?
-        r = requests.get(
-            '{}/solution/categories.json'.format(self.api_url),
-            auth=self.auth
+        return self.call(
+            'get',
+            '{}/solution/categories.json'.format(self.api_url)
+        )
+
+    def get_solution_category(self, category_id):
+        '''Get a category, with its folders'''
+        return self.call(
+            'get',
+            '{}/solution/categories/{}.json'.format(self.api_url, category_id)
         )
-        return r.json()
 
     def get_solutions_in_folder(self, folder):
         '''
@@ -40,129 +196,125 @@ class FreshDesk:
 
         NOTE: Folder is currently a folder json
         '''
-        r = requests.get(
+        return self.call(
+            'get',
             '{}/solution/categories/{}/folders/{}.json'\
             .format(
                 self.api_url,
                 folder.get('category_id'),
                 folder.get('id')
-            ),
-            auth=self.auth
+            )
         )
-        return r.json()
 
     def create_category(self, category):
         '''Create a new category in freshdesk'''
         payload = {
             'solution_category': {
-                'name': category['title'],
-                'description': category['title']
+                'name': category.title,
+                'description': category.title
             }
         }
-        reply = requests.post(
+        return self.call(
+            'post',
             '{}/solution/categories.json'.format(self.api_url),
-            data=json.dumps(payload),
-            headers=self.headers,
-            auth=self.auth
+            payload,
+            'category %s' % category.title,
+            'Creation'
         )
 
-        self.log_action('category %s' % category['title'], 'Creation', reply)
-        if reply.status_code == 201: return reply.json()
-
     def update_category(self, category):
         '''Update category in freshdesk'''
 
         payload = {
             'solution_category': {
-                'name': category['title'],
+                'name': category.title,
             }
         }
 
         url = '{url}'\
         '/solution/categories/{cat_id}.json'.format(
             url=self.api_url,
-            cat_id=category['freshdesk']['fd_attributes']['category']['id'],
+            cat_id=category.fd_id,
         )
 
-        reply = requests.put(
-            url,
-            headers=self.headers,
-            auth=self.auth,
-            data=json.dumps(payload)
+        return self.call(
+            'put', url, payload, 'category %s' % category.title, 'Update'
         )
 
-        self.log_action('category %s' % category['title'], 'Update', reply)
-        if reply.status_code == 200: return reply.json()
-
     def delete_category(self, category):
         '''Remove category from freshdesk'''
         url = '{url}'\
         '/solution/categories/{cat_id}.json'\
         .format(
             url=self.api_url,
-            cat_id=category['freshdesk']['fd_attributes']['category']['id']
+            cat_id=category.fd_id
         )
 
         # Use the delete API
-        reply = requests.delete(
-            url,
-            headers=self.headers,
-            auth=self.auth
+        return self.call(
+            'delete', url, None, 'category %s' % category.title, 'Deletion'
         )
 
-        self.log_action('category %s' % category['title'], 'Deletion', reply)
-
     def create_folder(self, folder, freshdesk_cid):
         '''Create a new folder in freshdesk'''
         payload = {
             "solution_folder": {
-                "name": folder['title'],
+                "name": folder.title,
                 "visibility": 1,
-                "description": folder['title']
+                "description": folder.title
             }
         }
-        reply = requests.post(
+        return self.call(
+            'post',
             '{}/solution/categories/{}/folders.json'.format(
                 self.api_url,
                 freshdesk_cid
             ),
-            data=json.dumps(payload),
-            headers=self.headers,
-            auth=self.auth
+            payload,
+            'folder %s' % folder.title,
+            'Creation'
         )
 
-        self.log_action('folder %s' % folder['title'], 'Creation', reply)
-        if reply.status_code == 201: return reply.json()
+    def update_folder(self, folder, freshdesk_cid=None, fields=None):
+        '''
+        Update folder in freshdesk, moving it into category freshdesk_cid
+        if given. The URL still has the category it is in now.
 
-    def update_folder(self, folder):
-        '''Update folder in freshdesk'''
+        fields is the set of changed fields to send (only title matters
+        here), everything by default
+        '''
 
         payload = {
-            'solution_article': {
-                'name': folder['title'],
-                'description': folder['title'],
+            'solution_folder': {
+                'name': folder.title,
+                'description': folder.title,
                 'visibility': 1
             }
         }
+        if freshdesk_cid is not None:
+            payload['solution_folder']['category_id'] = freshdesk_cid
+
+        if fields is not None:
+            full = len(json.dumps(payload))
+            content = payload['solution_folder']
+            del content['visibility']
+            if 'title' not in fields:
+                del content['name'], content['description']
+            self._saved(full, payload)
 
         url = '{url}'\
         '/solution/categories/{cat_id}'\
         '/folders/{folder_id}.json'.format(
             url=self.api_url,
-            cat_id=folder['freshdesk']['fd_attributes']['folder']['category_id'],
-            folder_id=folder['freshdesk']['fd_attributes']['folder']['id'],
+            cat_id=folder.fd_category_id,
+            folder_id=folder.fd_id,
         )
 
-        reply = requests.put(
-            url,
-            headers=self.headers,
-            auth=self.auth,
-            data=json.dumps(payload)
+        return self.call(
+            'put', url, payload, 'folder %s' % folder.title,
+            'Update' if freshdesk_cid is None else 'Move'
         )
 
-        self.log_action('folder %s' % folder['title'], 'Update', reply)
-        if reply.status_code == 200: return reply.json()
-
     def delete_folder(self, folder):
         '''Remove folder from freshdesk'''
         url = '{url}'\
@@ -170,28 +322,24 @@ class FreshDesk:
         '/folders/{folder_id}.json'\
         .format(
             url=self.api_url,
-            cat_id=folder['freshdesk']['fd_attributes']['folder']['category_id'],
-            folder_id=folder['freshdesk']['fd_attributes']['folder']['id']
+            cat_id=folder.fd_category_id,
+            folder_id=folder.fd_id
         )
 
         # Use the delete API
-        reply = requests.delete(
-            url,
-            headers=self.headers,
-            auth=self.auth
+        return self.call(
+            'delete', url, None, 'folder %s' % folder.title, 'Deletion'
         )
 
-        self.log_action('folder %s' % folder['title'], 'Deletion', reply)
-
     def create_article(self, article, freshdesk_cid, freshdesk_fid):
         '''Create a new article in freshdesk'''
         payload = {
             'solution_article': {
-                'title': article['title'],
+                'title': article.title,
                 'status': 2,
                 'art_type': 1,
                 'folder_id': freshdesk_fid,
-                'description': article['html']
+                'description': self.article_body(article)
             },
             'tags': {}
         }
@@ -204,46 +352,53 @@ class FreshDesk:
             folder_id=freshdesk_fid
         )
 
-        reply = requests.post(
-            url,
-            data=json.dumps(payload),
-            headers=self.headers,
-            auth=self.auth
+        return self.call(
+            'post', url, payload, 'Article %s' % article.title, 'Creation'
         )
 
-        self.log_action('Article %s' % article['title'], 'Creation', reply)
-        if reply.status_code == 201: return reply.json()
+    def update_article(self, article, freshdesk_fid=None, fields=None):
+        '''
+        Update article in freshdesk, moving it into folder freshdesk_fid if
+        given. The URL still has the folder it is in now.
 
-    def update_article(self, article):
-        '''Update article in freshdesk'''
+        fields is the set of changed fields to send (title and body),
+        everything by default. The HTML is only loaded when it is sent.
+        '''
 
-        payload = {
-            'solution_article': {
-                'title': article['title'],
-                'description': article['html']
-            }
-        }
+        content = {'title': article.title}
+        if freshdesk_fid is not None:
+            content['folder_id'] = freshdesk_fid
+        payload = {'solution_article': content}
+
+        if fields is None or 'body' in fields:
+            content['description'] = self.article_body(article)
+            full = len(json.dumps(payload)) if fields is not None else 0
+        else:
+            # What the body would have cost, without reading it
+            full = len(json.dumps({'solution_article': dict(
+                content, description=''
+            )})) + (self.blobs.size(article.sha1) if self.blobs else 0)
+
+        if fields is not None:
+            if 'title' not in fields:
+                del content['title']
+            self._saved(full, payload)
 
         url = '{url}'\
         '/solution/categories/{cat_id}'\
         '/folders/{folder_id}'\
         '/articles/{article_id}.json'.format(
             url=self.api_url,
-            cat_id=article['freshdesk']['fd_attributes']['article']['folder']['parent_id'],
-            folder_id=article['freshdesk']['fd_attributes']['article']['folder']['id'],
-            article_id=article['freshdesk']['fd_attributes']['article']['id']
+            cat_id=article.fd_category_id,
+            folder_id=article.fd_folder_id,
+            article_id=article.fd_id
         )
 
-        reply = requests.put(
-            url,
-            headers=self.headers,
-            auth=self.auth,
-            data=json.dumps(payload)
+        return self.call(
+            'put', url, payload, 'Article %s' % article.title,
+            'Update' if freshdesk_fid is None else 'Move'
         )
 
-        self.log_action('Article %s' % article['title'], 'Update', reply)
-        if reply.status_code == 200: return reply.json()
-
     def delete_article(self, article):
         '''Remove article from freshdesk'''
         url = '{url}'\
@@ -251,188 +406,879 @@ class FreshDesk:
         '/folders/{folder_id}'\
         '/articles/{article_id}.json'.format(
             url=self.api_url,
-            cat_id=article['freshdesk']['fd_attributes']['article']['folder']['parent_id'],
-            folder_id=article['freshdesk']['fd_attributes']['article']['folder']['id'],
-            article_id=article['freshdesk']['fd_attributes']['article']['id']
+            cat_id=article.fd_category_id,
+            folder_id=article.fd_folder_id,
+            article_id=article.fd_id
         )
 
-        reply = requests.delete(
-            url,
-            headers=self.headers,
-            auth=self.auth
+        return self.call(
+            'delete', url, None, 'Article %s' % article.title, 'Deletion'
         )
 
-        self.log_action('Article %s' % article['title'], 'Deletion', reply)
+def compact_category(reply):
+    '''The parts of a category API reply we keep in categories.yaml'''
+    return {'id': reply['category']['id']}
+
+def compact_folder(reply):
+    '''The parts of a folder API reply we keep in folders.yaml'''
+    return {
+        'id': reply['folder']['id'],
+        'category_id': reply['folder']['category_id'],
+    }
+
+def compact_article(reply, category_id=None):
+    '''
+    The parts of an article API reply we keep in articles.yaml. Replies
+    without the enclosing folder need category_id passed in.
+    '''
+    article = reply['article']
+    return {
+        'id': article['id'],
+        'folder_id': article['folder_id'],
+        'category_id': article.get('folder', {}).get('category_id', category_id),
+    }
+
+# Mapping of the records inside each kind of container
+CHILD_MAPPINGS = {'categories': 'folders', 'folders': 'articles'}
 
 class FreshDeskDocumentMap(DocumentMap):
     '''Adds FreshDesk document mapping functionality to DocumentMap'''
 
-    def __init__(self, mapping_dir, article_dir, api_url, api_token):
-        '''Initialize as per super, then add FreshDesk Mappings'''
-        super().__init__(mapping_dir, article_dir)
-        self.fdapi = FreshDesk(api_url, api_token)
+    def __init__(self, mapping_dir, article_dir, api_url, api_token,
+                 render_cache=None, render_workers=1, renderer='markdown',
+                 republish_limit=None, store=None, session=None,
+                 timeout=DEFAULT_TIMEOUT, push_workers=1, limiter=None,
+                 retries=4, journal=None, remote=None):
+        '''
+        Initialize as per super, then add FreshDesk Mappings. session,
+        timeout, limiter and retries are passed on to FreshDesk.
+
+        journal is an optional Journal successful Freshdesk operations are
+        recorded in, anything left in it by a run that didn't finish is
+        replayed straight away.
+
+        remote is an optional RemoteState kept current with what Freshdesk
+        replies, for reconcile_freshdesk to tell edits made there.
+
+        push_workers is the number of Freshdesk calls made at once.
+        '''
+        super().__init__(
+            mapping_dir, article_dir, render_cache, render_workers, renderer,
+            republish_limit, store
+        )
+        self.push_workers = push_workers
+        self.fdapi = FreshDesk(
+            api_url, api_token, self.blobs, session=session, timeout=timeout,
+            limiter=limiter, retries=retries
+        )
+        # Seconds the last synchronisation spent waiting on the rate limit,
+        # and the bytes it left out of updates
+        self.throttled = 0.0
+        self.saved_bytes = 0
+
+        self.remote = remote
+        self.cascades = {}
+        self.uncascaded = []
+        # {(mapping, DOCID): Freshdesk IDs} of records being moved
+        self.moves = {}
+        # {(mapping, (parent Freshdesk ID,) or ()): {title: reply}} of
+        # objects already in Freshdesk, and how many creates they saved
+        self.listings = {}
+        self.adopted = 0
+        self.journal = journal
+        if journal is not None:
+            self.replay_journal()
+
+    def _migrate(self, mapping, content):
+        '''
+        As per super, and cut full API replies kept by older versions down to
+        the IDs we use
+        '''
+        super()._migrate(mapping, content)
+
+        compact = {
+            'categories': compact_category,
+            'folders': compact_folder,
+            'articles': compact_article,
+        }.get(mapping)
+        if compact is None:
+            return
+
+        migrated = 0
+        for record in content.values():
+            freshdesk = record.get('freshdesk')
+            if freshdesk and 'fd_attributes' in freshdesk:
+                record['freshdesk'] = compact(freshdesk['fd_attributes'])
+                migrated += 1
+
+        if migrated:
+            log.info('Compacted Freshdesk attributes of %s %s' % (
+                migrated, mapping
+            ))
+            self.require_change = True
+
+    def _push(self, mapping, operations, ids=None):
+        '''
+        Run ((action, DOCID), call, args) Freshdesk operations on records
+        of mapping, spread over push_workers threads, and return
+        [((action, DOCID), reply)] in the order given. ids(DOCID, reply)
+        gives the Freshdesk IDs of a created object.
+
+        Only the API calls (and journalling them) run in the pool. Callers
+        merge the replies into the mappings afterwards, in this thread.
+        '''
+        if self.push_workers <= 1 or len(operations) <= 1:
+            return [
+                (key, self._operation(mapping, key, call, args, ids))
+                for key, call, args in operations
+            ]
+
+        with ThreadPoolExecutor(max_workers=self.push_workers) as pool:
+            futures = [
+                (key, pool.submit(
+                    self._operation, mapping, key, call, args, ids
+                ))
+                for key, call, args in operations
+            ]
+            return [(key, future.result()) for key, future in futures]
+
+    def _operation(self, mapping, key, call, args, ids):
+        '''Make an API call, journalling it if it went through'''
+        try:
+            reply = call(*args)
+        except FreshDeskError as e:
+            # Calls that got no reply count as failed
+            log.error(e)
+            return None
+
+        self._journal(mapping, key, reply, ids)
+        return reply
+
+    def _journal(self, mapping, key, reply, ids):
+        '''Record an operation that went through in the journal'''
+        if reply is None or self.journal is None:
+            return
+
+        action, docid = key
+        record = None
+        if action != 'delete':
+            record = getattr(self, mapping)[docid].to_dict()
+        if action == 'create':
+            record['freshdesk'] = ids(docid, reply)
+        elif action == 'move':
+            record['freshdesk'] = self.moves[(mapping, docid)]
+        elif action == 'update':
+            # It made it this time
+            record.get('freshdesk', {}).pop('pending', None)
+        self.journal.record(mapping, action, docid, record)
+
+    def _merge(self, mapping, results, ids):
+        '''
+        Merge the replies to ((action, DOCID), reply) operations on records
+        of mapping, keeping the IDs of created objects
+        '''
+        records = getattr(self, mapping)
+        for (action, docid), reply in results:
+            if action == 'delete':
+                if reply is not None:
+                    self._cascaded(mapping, docid)
+                else:
+                    # Freshdesk didn't delete what went with it either
+                    self.uncascaded.extend(
+                        self.cascades.get((mapping, docid), [])
+                    )
+                # Deleted records are purged whether or not it worked
+                self.require_change = True
+                continue
+
+            moved = self.moves.pop((mapping, docid), None)
+            if reply == None and action == 'create':
+                # We have an error, delete freshdesk key
+                records[docid].clear_freshdesk()
+                continue
+            elif reply == None:
+                # Still where it was in Freshdesk, keep its IDs so it is
+                # updated or moved from there next time
+                records[docid].set_pending(True)
+                self.require_change = True
+                continue
+
+            if action == 'move':
+                self._moved(mapping, docid, moved)
+            records[docid].set_pending(False)
+
+            if action == 'create':
+                records[docid].set_freshdesk(ids(docid, reply))
+                # Nothing to adopt in what we just created
+                child = CHILD_MAPPINGS.get(mapping)
+                if child is not None:
+                    self.listings[(child, (records[docid].fd_id,))] = {}
+            self._remember(mapping, records[docid], reply)
+            self.require_change = True
+
+    def _cascaded(self, mapping, docid):
+        '''
+        Note a deletion that went through, along with the records Freshdesk
+        deleted with it
+        '''
+        for child, child_id in self.cascades.get((mapping, docid), []):
+            self._journal(child, ('delete', child_id), True, None)
+            if self.remote is not None:
+                self.remote.forget(child, getattr(self, child)[child_id].fd_id)
+
+        if self.remote is not None:
+            self.remote.forget(mapping, getattr(self, mapping)[docid].fd_id)
+
+    def _moved(self, mapping, docid, ids):
+        '''
+        Take the new parent IDs of a record that moved. Articles in a folder
+        that moved go along with it.
+        '''
+        getattr(self, mapping)[docid].set_freshdesk(ids)
+        if mapping != 'folders':
+            return
+
+        for aid, article in self.articles.items():
+            if self._parent_id(article) == docid and article.freshdesk:
+                article.fd_category_id = ids['category_id']
+                self._journal('articles', ('update', aid), True, None)
+
+    def _remember(self, mapping, record, reply):
+        '''Keep the updated_at of an object we just changed'''
+        if self.remote is None:
+            return
+        content = reply.get(MAPPING_KINDS[mapping]) \
+            if isinstance(reply, dict) else None
+        self.remote.seen(
+            mapping, record.fd_id, (content or {}).get('updated_at')
+        )
+
+    def reconcile_freshdesk(self):
+        '''
+        Compare what Freshdesk holds against the mappings, and queue what
+        drifted from them for synchronize_freshdesk. Objects missing from
+        Freshdesk are created again. Ones with another title or parent, or
+        edited there since we last changed them, are updated, moving them
+        back from where they are. Returns the number of drifted records.
+
+        Records in a category or folder that couldn't be listed are left
+        as they are, and nothing is done if the categories couldn't be.
+        '''
+        try:
+            snapshot = fetch_snapshot(self.fdapi, self.push_workers)
+        except FreshDeskError as e:
+            log.error('Not reconciling with Freshdesk: %s' % e)
+            return 0
+        self._list_snapshot(snapshot)
+        unlisted = snapshot['unlisted']
+
+        drifted = 0
+        for mapping, updates, parent_id, unknown in [
+            ('categories', self.category_updates,
+             lambda record: None, lambda record: False),
+            ('folders', self.folder_updates,
+             lambda record: record.fd_category_id,
+             lambda record: record.fd_category_id in unlisted['categories']),
+            ('articles', self.article_updates,
+             lambda record: record.fd_folder_id,
+             lambda record: record.fd_folder_id in unlisted['folders']
+                 or record.fd_category_id in unlisted['categories']),
+        ]:
+            remote = snapshot[mapping]
+            known = set()
+            for docid, record in getattr(self, mapping).items():
+                if not record.freshdesk:
+                    continue
+                known.add(record.fd_id)
+
+                found = remote.get(record.fd_id)
+                if found is None and unknown(record):
+                    continue
+                elif found is None:
+                    log.warning('%s %s (%s) is missing from Freshdesk' % (
+                        MAPPING_KINDS[mapping], docid, record.fd_id
+                    ))
+                    record.clear_freshdesk()
+                    self.require_change = True
+                elif found['title'] != record.title\
+                or found['parent'] != parent_id(record)\
+                or self._edited(mapping, record.fd_id, found['updated_at']):
+                    log.info('%s %s (%s) drifted in Freshdesk' % (
+                        MAPPING_KINDS[mapping], docid, record.fd_id
+                    ))
+                    if found['parent'] != parent_id(record):
+                        self._reparent(mapping, record, found['parent'],
+                            snapshot)
+                    updates[docid] = True
+                else:
+                    continue
+                drifted += 1
+
+            for fd_id in set(remote) - known:
+                log.warning('Freshdesk %s %s is not in the mappings' % (
+                    MAPPING_KINDS[mapping], fd_id
+                ))
+
+            # Edits from here on are measured against what we just saw
+            if self.remote is not None:
+                for fd_id, found in remote.items():
+                    self.remote.seen(mapping, fd_id, found['updated_at'])
+                if unlisted['categories'] or unlisted['folders']:
+                    # What we didn't see may still be there
+                    continue
+                for fd_id in list(self.remote.updated[mapping]):
+                    if int(fd_id) not in remote:
+                        self.remote.forget(mapping, fd_id)
+
+        log.info('%s records drifted from Freshdesk' % drifted)
+        return drifted
+
+    def _reparent(self, mapping, record, parent, snapshot):
+        '''
+        Take the parent an object has in Freshdesk, so the push moves it
+        from there rather than updating it where it no longer is
+        '''
+        if mapping == 'folders':
+            record.fd_category_id = parent
+        elif mapping == 'articles':
+            record.fd_folder_id = parent
+            record.fd_category_id = snapshot['folders'][parent]['parent']
+        self.require_change = True
+
+    def _list_snapshot(self, snapshot):
+        '''Take the listings creates adopt from from a snapshot'''
+        self.listings[('categories', ())] = {
+            category['title']: {'category': {'id': cid}}
+            for cid, category in snapshot['categories'].items()
+        }
+        # Unlisted parents are left to be listed again if need be
+        unlisted = snapshot['unlisted']
+        for cid in snapshot['categories']:
+            if cid not in unlisted['categories']:
+                self.listings[('folders', (cid,))] = {}
+        for fid, folder in snapshot['folders'].items():
+            self.listings[('folders', (folder['parent'],))][folder['title']] = \
+                {'folder': {'id': fid, 'category_id': folder['parent']}}
+            if fid not in unlisted['folders']:
+                self.listings[('articles', (fid,))] = {}
+        for aid, article in snapshot['articles'].items():
+            fid = article['parent']
+            self.listings[('articles', (fid,))][article['title']] = \
+                {'article': {
+                    'id': aid, 'folder_id': fid,
+                    'folder': {'category_id': snapshot['folders'][fid]['parent']}
+                }}
+
+    def _edited(self, mapping, fd_id, updated_at):
+        '''Whether an object changed in Freshdesk since we last did'''
+        if self.remote is None or updated_at is None:
+            return False
+        known = self.remote.get(mapping, fd_id)
+        return known is not None and known != updated_at
+
+    def replay_journal(self):
+        '''
+        Apply the operations a previous run made but didn't get to save,
+        so they aren't made again
+        '''
+        entries = self.journal.entries()
+        for entry in entries:
+            mapping, docid = entry['mapping'], entry['docid']
+            records = getattr(self, mapping)
+            origin = getattr(self, 'orig_' + mapping)
+            if entry['action'] == 'delete':
+                records.pop(docid, None)
+                origin.discard(docid)
+                continue
+
+            # Both the record and what it is compared against are now
+            # what Freshdesk has
+            record = MAPPING_TYPES[mapping].from_dict(entry['record'])
+            records[docid] = record
+            origin.update(docid, record)
+
+            # DOCIDs handed out by the previous run
+            kind = MAPPING_KINDS[mapping]
+            self.counters[kind] = max(self.counters.get(kind, 0), docid)
+
+        if entries:
+            log.info('Replayed %s Freshdesk operations from %s' % (
+                len(entries), self.journal.path
+            ))
+            self.require_change = True
+
+    def clear_journal(self):
+        '''Call once the mappings are saved'''
+        if self.journal is not None:
+            self.journal.clear()
 
     def synchronize_freshdesk(self):
-        '''Push all changes up to freshdesk'''
+        '''
+        Push all changes up to freshdesk
+
+        Categories go first, then folders, then articles, so parents
+        always exist before their children. Deletions run the other way
+        round. The operations within each level run concurrently.
+        '''
+        throttled = self.fdapi.limiter.throttled
+        retried = self.fdapi.retried
+        saved_bytes = self.fdapi.saved_bytes
+
+        for mapping, operations, ids in self._levels(self.fdapi):
+            self._merge(mapping, self._push(mapping, operations, ids), ids)
+
+        self._synchronized(self.fdapi, throttled, retried, saved_bytes)
+
+    async def synchronize_freshdesk_async(self, concurrency=10):
+        '''
+        As per synchronize_freshdesk, with the calls of each level made
+        on an AsyncFreshDesk, up to concurrency at once
+        '''
+        from .aiofreshdesk import AsyncFreshDesk
+
+        async with AsyncFreshDesk.like(self.fdapi, concurrency) as fdapi:
+            throttled = fdapi.limiter.throttled
+            retried = fdapi.retried
+            saved_bytes = fdapi.saved_bytes
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def operation(mapping, key, call, args, ids):
+                async with semaphore:
+                    try:
+                        reply = await call(*args)
+                    except FreshDeskError as e:
+                        log.error(e)
+                        return None
+                self._journal(mapping, key, reply, ids)
+                return reply
+
+            for mapping, operations, ids in self._levels(fdapi):
+                replies = await asyncio.gather(*[
+                    operation(mapping, key, call, args, ids)
+                    for key, call, args in operations
+                ])
+                self._merge(
+                    mapping,
+                    [(key, reply) for (key, _, _), reply
+                     in zip(operations, replies)],
+                    ids
+                )
+
+            self._synchronized(fdapi, throttled, retried, saved_bytes)
+
+    def _synchronized(self, fdapi, throttled, retried, saved_bytes):
+        '''Purge deleted records and log what the push cost'''
+        # Purge the deleted items from our data structure
+        self.purge_deleted_records()
+
+        if self.remote is not None:
+            self.remote.save()
+
+        if self.adopted:
+            log.info('Adopted %s objects already in Freshdesk instead of '
+                'creating them again' % self.adopted)
+
+        self.saved_bytes = fdapi.saved_bytes - saved_bytes
+        log.info('Left %s unchanged bytes out of updates' % self.saved_bytes)
+
+        self.throttled = fdapi.limiter.throttled - throttled
+        log.info(
+            'Spent %.1fs throttled by the Freshdesk rate limit, retried %s '
+            'calls' % (self.throttled, fdapi.retried - retried)
+        )
+
+    def _levels(self, fdapi):
+        '''
+        Generate (mapping, operations, ids) for each level of the push in
+        turn, see _push. Each level is only worked out once the replies to
+        the one before have been merged, as it needs their IDs.
+        '''
         # Add Any known IDS in categories, folders or articles that are
         # already known, but aren't uploaded to FD yet
 
+        # Likewise updates and moves that didn't make it last time
+
         # Categories
         for i,j in self.categories.items():
-            if not j.get('freshdesk'):
+            if not j.freshdesk:
                 self.category_creations[i] = True
+            elif j.pending:
+                self.category_updates[i] = True
 
         # Folders
         for i,j in self.folders.items():
-            if not j.get('freshdesk'):
+            if not j.freshdesk:
                 self.folder_creations[i] = True
+            elif j.pending:
+                self.folder_updates[i] = True
 
         # Articles
         for i,j in self.articles.items():
-            if not j.get('freshdesk'):
+            if not j.freshdesk:
                 self.article_creations[i] = True
+            elif j.pending:
+                self.article_updates[i] = True
 
         # Category Creations and Updates
+        operations = []
         for cid in self.category_updates.keys():
-            # Update Category in Freshdesk
             # If we don't already have a freshdesk key here, it is actually a
             # NEW FD category (i.e. previous push didn't work...)
-            if self.categories[cid].get('freshdesk'):
-                self.categories[cid]['freshdesk'] = {
-                    'fd_attributes': self.fdapi.update_category(
-                        self.categories[cid]
-                    )
-                }
-                if self.categories[cid]['freshdesk']['fd_attributes'] == None:
-                    # We have an error, delete freshdesk key
-                    del(self.categories[cid]['freshdesk'])
-                else:
-                    self.require_change = True
+            if self.categories[cid].freshdesk:
+                operations.append((
+                    ('update', cid),
+                    fdapi.update_category,
+                    (self.categories[cid],)
+                ))
             else:
                 self.category_creations[cid] = True
 
+        ids = lambda cid, reply: compact_category(reply)
+        claimed = self._prefetch_listings(
+            'categories', [()] if self.category_creations else []
+        )
         for cid in self.category_creations.keys():
-            # Create a new Category in Freshdesk
-            self.categories[cid]['freshdesk'] = {
-                'fd_attributes': self.fdapi.create_category(self.categories[cid])
-            }
+            if self._adopt('categories', cid, None, claimed, ids):
+                continue
 
-            if self.categories[cid]['freshdesk']['fd_attributes'] == None:
-                # We have an error, delete freshdesk key
-                del(self.categories[cid]['freshdesk'])
-            else:
-                self.require_change = True
+            operations.append((
+                ('create', cid),
+                fdapi.create_category,
+                (self.categories[cid],)
+            ))
+
+        yield 'categories', operations, ids
+
+        # Folders Freshdesk has in another category, e.g. moved into one
+        # that couldn't be created when they were
+        for fid, folder in self.folders.items():
+            fd_cat_id = self._parent_category_id(fid)
+            if folder.freshdesk and fd_cat_id is not None\
+            and folder.fd_category_id != fd_cat_id\
+            and fid not in self.folder_deletions:
+                flag_update(self.folder_updates, fid, ['parent'])
 
         # Folder Creations and Updates
+        operations = []
         for fid in self.folder_updates.keys():
-            try:
-                fd_cat_id = self.categories[int(self.folders[fid]['parent'])]['freshdesk']['fd_attributes']['category']['id']
-            except KeyError:
+            if self._parent_category_id(fid) is None:
                 # This just means the parent category isn't in FD yet
                 continue
-            except TypeError:
-                continue
 
             # If we don't already have a freshdesk key here, it is actually a
             # NEW FD folder (i.e. previous push didn't work...)
-            if self.folders[fid].get('freshdesk'):
-                self.folders[fid]['freshdesk'] = {
-                    'fd_attributes': self.fdapi.update_folder(self.folders[fid])
+            folder = self.folders[fid]
+            fd_cat_id = self._parent_category_id(fid)
+            fields = update_fields(self.folder_updates[fid])
+            if folder.freshdesk and folder.fd_category_id != fd_cat_id:
+                # Moved to another category, keeping its Freshdesk ID
+                self.moves[('folders', fid)] = {
+                    'id': folder.fd_id, 'category_id': fd_cat_id
                 }
-                if self.folders[fid]['freshdesk']['fd_attributes'] == None:
-                    # We have an error, delete freshdesk key
-                    del(self.folders[fid]['freshdesk'])
-                else:
-                    self.require_change = True
+                operations.append((
+                    ('move', fid),
+                    fdapi.update_folder,
+                    (folder, fd_cat_id, fields)
+                ))
+            elif folder.freshdesk:
+                if fields is not None and 'title' not in fields:
+                    # Nothing Freshdesk has changed
+                    continue
+                operations.append((
+                    ('update', fid),
+                    fdapi.update_folder,
+                    (folder, None, fields)
+                ))
             else:
                 self.folder_creations[fid] = True
 
-
+        ids = lambda fid, reply: compact_folder(reply)
+        claimed = self._prefetch_listings('folders', [
+            (self._parent_category_id(fid),) for fid in self.folder_creations
+        ])
         for fid in self.folder_creations.keys():
-            try:
-                fd_cat_id = self.categories[int(self.folders[fid]['parent'])]['freshdesk']['fd_attributes']['category']['id']
-            except KeyError:
-                # This just means the parent category isn't in FD yet
+            fd_cat_id = self._parent_category_id(fid)
+            if fd_cat_id is None:
                 continue
-            except TypeError:
+            if self._adopt('folders', fid, fd_cat_id, claimed, ids):
                 continue
 
-            self.folders[fid]['freshdesk'] = {
-                'fd_attributes': self.fdapi.create_folder(
-                    self.folders[fid],
-                    fd_cat_id
-                )
-            }
-            if self.folders[fid]['freshdesk']['fd_attributes'] == None:
-                # We have an error, delete freshdesk key
-                del(self.folders[fid]['freshdesk'])
-            else:
-                self.require_change = True
+            operations.append((
+                ('create', fid),
+                fdapi.create_folder,
+                (self.folders[fid], fd_cat_id)
+            ))
+
+        yield 'folders', operations, ids
+
+        # Likewise articles Freshdesk has in another folder
+        for aid, article in self.articles.items():
+            folder = self._parent_folder(aid)
+            if article.freshdesk and folder is not None\
+            and article.fd_folder_id != folder.fd_id\
+            and aid not in self.article_deletions:
+                flag_update(self.article_updates, aid, ['parent'])
 
-        # Article Creations, Updates and Deletions
+        # Article Creations and Updates
+        operations = []
         for aid in self.article_updates.keys():
-            # Update Article in Freshdesk
             # If we don't already have a freshdesk key here, it is actually a
             # NEW FD article (i.e. previous push didn't work...)
-            if self.articles[aid].get('freshdesk'):
-                self.articles[aid]['freshdesk'] = {
-                    'fd_attributes': self.fdapi.update_article(self.articles[aid])
+            article = self.articles[aid]
+            folder = self._parent_folder(aid)
+            fields = update_fields(self.article_updates[aid])
+            if article.freshdesk and folder is not None\
+            and article.fd_folder_id != folder.fd_id:
+                # Moved to another folder, keeping its Freshdesk ID
+                self.moves[('articles', aid)] = {
+                    'id': article.fd_id,
+                    'folder_id': folder.fd_id,
+                    'category_id': folder.fd_category_id,
                 }
-
-                if self.articles[aid]['freshdesk']['fd_attributes'] == None:
-                    # We have an error, delete freshdesk key
-                    del(self.articles[aid]['freshdesk'])
-                else:
-                    self.require_change = True
+                operations.append((
+                    ('move', aid),
+                    fdapi.update_article,
+                    (article, folder.fd_id, fields)
+                ))
+            elif article.freshdesk:
+                if fields is not None and not fields & {'title', 'body'}:
+                    # Nothing Freshdesk has changed
+                    continue
+                operations.append((
+                    ('update', aid),
+                    fdapi.update_article,
+                    (article, None, fields)
+                ))
             else:
                 self.article_creations[aid] = True
 
+        category_ids = {}
+        ids = lambda aid, reply: compact_article(reply, category_ids[aid])
+        folders = [self._parent_folder(aid) for aid in self.article_creations]
+        claimed = self._prefetch_listings('articles', [
+            (folder.fd_category_id, folder.fd_id)
+            for folder in folders if folder is not None
+        ])
         for aid in self.article_creations.keys():
-            try:
-                fd_folder_id = self.folders[int(self.articles[aid]['parent'])]['freshdesk']['fd_attributes']['folder']['id']
-                fd_cat_id = self.folders[int(self.articles[aid]['parent'])]['freshdesk']['fd_attributes']['folder']['category_id']
-            # except TypeError:
-            #     continue
-            except KeyError:
+            folder = self._parent_folder(aid)
+            if folder is None:
                 continue
 
-            self.articles[aid]['freshdesk'] = {
-                'fd_attributes': self.fdapi.create_article(
-                    self.articles[aid],
-                    fd_cat_id,
-                    fd_folder_id
-                )
-            }
+            category_ids[aid] = folder.fd_category_id
+            if self._adopt('articles', aid, folder.fd_id, claimed, ids):
+                # Only the title is known to match, it may hold another
+                # body (a stale create, or one made by hand)
+                operations.append((
+                    ('update', aid),
+                    fdapi.update_article,
+                    (self.articles[aid], None, {'body'})
+                ))
+                continue
 
-            if self.articles[aid]['freshdesk']['fd_attributes'] == None:
-                # We have an error, delete freshdesk key
-                del(self.articles[aid]['freshdesk'])
+            operations.append((
+                ('create', aid),
+                fdapi.create_article,
+                (self.articles[aid], folder.fd_category_id, folder.fd_id)
+            ))
+
+        yield 'articles', operations, ids
+
+        # Article Deletions, then Folders, then Categories, leaving out
+        # what goes with a deleted folder or category anyway
+        deletions = self._fold_deletions()
+        for mapping, call in [
+            ('articles', fdapi.delete_article),
+            ('folders', fdapi.delete_folder),
+            ('categories', fdapi.delete_category),
+        ]:
+            docids = deletions[mapping]
+            records = getattr(self, mapping)
+            yield mapping, [
+                (('delete', docid), call, (records[docid],))
+                for docid in docids
+            ], None
+
+        # What went with a deletion that failed is deleted on its own
+        for mapping, call in [
+            ('articles', fdapi.delete_article),
+            ('folders', fdapi.delete_folder),
+        ]:
+            docids = [
+                docid for child, docid in self.uncascaded if child == mapping
+            ]
+            if not docids:
+                continue
+            log.warning('Deleting %s %s on their own' % (len(docids), mapping))
+            records = getattr(self, mapping)
+            yield mapping, [
+                (('delete', docid), call, (records[docid],))
+                for docid in docids
+            ], None
+
+    def _fold_deletions(self):
+        '''
+        Deleting a category or folder in Freshdesk deletes everything in
+        it, so only the highest deleted ancestor needs a call. Returns
+        {mapping: [DOCID]} of the deletions to make, and keeps the records
+        that go along with each in self.cascades, {(mapping, DOCID):
+        [(mapping, DOCID)]}. If the deletion they go with fails, _merge
+        puts them in self.uncascaded to be deleted on their own. All
+        deleted records are still purged.
+        '''
+        self.cascades = {}
+        self.uncascaded = []
+        deletions = {'articles': [], 'folders': [], 'categories': []}
+
+        for cid in self.category_deletions:
+            if self.categories[cid].freshdesk:
+                deletions['categories'].append(cid)
+
+        # Deleted folders, and the deletion they go with
+        folders = {}
+        for fid in self.folder_deletions:
+            folder = self.folders[fid]
+            if not folder.freshdesk:
+                continue
+            cid = self._parent_id(folder)
+            if cid in self.category_deletions\
+            and self.categories[cid].freshdesk:
+                folders[fid] = ('categories', cid)
             else:
-                self.require_change = True
+                folders[fid] = ('folders', fid)
+                deletions['folders'].append(fid)
 
-        for aid in self.article_deletions.keys():
-            try:
-                fd_folder_id = self.folders[self.articles[aid]['parent']]['freshdesk']['fd_attributes']['folder']['id']
-                fd_cat_id = self.folders[self.articles[aid]['parent']]['freshdesk']['fd_attributes']['folder']['category_id']
-            except TypeError:
+        for aid in self.article_deletions:
+            article = self.articles[aid]
+            fid = self._parent_id(article)
+            if fid in folders:
+                owner = folders[fid]
+            elif self._parent_folder(aid) is not None and article.freshdesk:
+                deletions['articles'].append(aid)
                 continue
-            except KeyError:
+            else:
                 continue
+            self.cascades.setdefault(owner, []).append(('articles', aid))
 
-            self.fdapi.delete_article(self.articles[aid])
-            self.require_change = True
+        for fid, owner in folders.items():
+            if owner[0] == 'categories':
+                self.cascades.setdefault(owner, []).append(('folders', fid))
 
-        # Folder Deletions
-        for fid in self.folder_deletions.keys():
-            # Delete folder in Freshdesk
-            self.fdapi.delete_folder(self.folders[fid])
-            self.require_change = True
+        folded = sum(len(records) for records in self.cascades.values())
+        if folded:
+            log.info('Leaving %s deletions to Freshdesk to cascade' % folded)
+        return deletions
 
-        # Category Deletions
-        for cid in self.category_deletions.keys():
-            # Delete Category in Freshdesk
-            self.fdapi.delete_category(self.categories[cid])
-            self.require_change = True
+    @staticmethod
+    def _parent_id(record):
+        '''DOCID of the parent of a record, or None'''
+        try:
+            return int(record.parent)
+        except (TypeError, ValueError):
+            return None
 
-        # Purge the deleted items from our data structure
-        self.purge_deleted_records()
+    def _prefetch_listings(self, mapping, parents):
+        '''
+        Fetch what Freshdesk has in each parent not already listed, on up to
+        push_workers threads. parents are () for categories, (category ID,)
+        for folders and (category ID, folder ID) for articles. Returns the
+        Freshdesk IDs already taken by records of mapping.
+        '''
+        missing = []
+        for parent in set(parents):
+            if None in parent or (mapping, parent[-1:]) in self.listings:
+                continue
+            missing.append(parent)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.push_workers) as pool:
+                for parent, listing in zip(missing, pool.map(
+                    lambda parent: self._fetch_listing(mapping, parent),
+                    missing
+                )):
+                    self.listings[(mapping, parent[-1:])] = listing
+
+        return {
+            record.fd_id for record in getattr(self, mapping).values()
+            if record.freshdesk
+        }
+
+    def _fetch_listing(self, mapping, parent):
+        '''{title: reply} of what Freshdesk has in a parent, see _adopt'''
+        try:
+            if mapping == 'categories':
+                return {
+                    reply['category']['name']: {'category': {
+                        'id': reply['category']['id']
+                    }}
+                    for reply in self.fdapi.get_solution_categories() or []
+                }
+
+            if mapping == 'folders':
+                (cid,) = parent
+                reply = self.fdapi.get_solution_category(cid) or {}
+                return {
+                    folder['name']: {'folder': {
+                        'id': folder['id'], 'category_id': cid
+                    }}
+                    for folder in reply.get('category', {}).get('folders', [])
+                }
+
+            cid, fid = parent
+            reply = self.fdapi.get_solutions_in_folder(
+                {'id': fid, 'category_id': cid}
+            ) or {}
+            return {
+                article['title']: {'article': {
+                    'id': article['id'], 'folder_id': fid,
+                    'folder': {'category_id': cid}
+                }}
+                for article in reply.get('folder', {}).get('articles', [])
+            }
+        except FreshDeskError as e:
+            # Not being able to check only costs a possible duplicate
+            log.warning('Could not list Freshdesk %s: %s' % (mapping, e))
+            return {}
+
+    def _adopt(self, mapping, docid, parent, claimed, ids):
+        '''
+        Take on an object with the same title already in the parent in
+        Freshdesk, rather than creating another (when a create went through
+        but its reply or the mappings got lost). Returns whether there was
+        one. parent is the Freshdesk ID of the category or folder, or None.
+        '''
+        record = getattr(self, mapping)[docid]
+        listing = self.listings.get((mapping, (parent,) if parent else ()))
+        reply = (listing or {}).get(record.title)
+        if reply is None:
+            return False
+
+        found = ids(docid, reply)
+        if found['id'] in claimed:
+            # Already someone else's
+            return False
+
+        log.info('Adopting Freshdesk %s %s for %s %s' % (
+            MAPPING_KINDS[mapping], found['id'], MAPPING_KINDS[mapping], docid
+        ))
+        del listing[record.title]
+        claimed.add(found['id'])
+        record.set_freshdesk(found)
+        self._journal(mapping, ('create', docid), reply, ids)
+        self.adopted += 1
+        self.require_change = True
+        return True
+
+    def _parent_category_id(self, fid):
+        '''Freshdesk ID of the category of a folder, or None'''
+        try:
+            return self.categories[int(self.folders[fid].parent)].fd_id
+        except (KeyError, TypeError):
+            return None
+
+    def _parent_folder(self, aid):
+        '''Folder record of an article if it is in Freshdesk, or None'''
+        try:
+            folder = self.folders[int(self.articles[aid].parent)]
+        except (KeyError, TypeError):
+            return None
+        return folder if folder.freshdesk else None
@@ -0,0 +1,62 @@
+"""
+    docmap.gitdiff
+    ~~~~~~~~~~~~~~
+
+    Find out which article paths changed between two commits
+"""
+
+import logging
+import subprocess
+
+log = logging.getLogger()
+
+def head_commit(path):
+    '''Commit currently checked out in the repository containing path'''
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=path,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True
+        ).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+def parse_name_status(output):
+    '''
+    Parse the NUL separated output of git diff --name-status -z into a
+    list of (status, old_path, new_path) tuples.
+
+    Renames and copies (R<score>, C<score>) carry both paths, every other
+    status uses the same path for old and new.
+    '''
+    changes = []
+    fields = iter(output.split('\0'))
+    for status in fields:
+        if not status:
+            continue
+        old_path = next(fields)
+        if status[0] in 'RC':
+            changes.append((status[0], old_path, next(fields)))
+        else:
+            changes.append((status[0], old_path, old_path))
+    return changes
+
+def changed_paths(path, since, until='HEAD'):
+    '''
+    Changes under path between the commits since and until, with rename
+    detection. Paths are relative to path.
+
+    Raises subprocess.CalledProcessError if git can't produce the diff
+    (e.g. since is no longer in the history).
+    '''
+    output = subprocess.check_output(
+        [
+            'git', 'diff', '--name-status', '-z', '-M', '--relative',
+            since, until, '--', '.'
+        ],
+        cwd=path,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+    return parse_name_status(output)
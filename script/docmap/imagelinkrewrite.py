@@ -1,6 +1,6 @@
 from markdown.preprocessors import Preprocessor
 import markdown.inlinepatterns as ilp
-from markdown.inlinepatterns import ImagePattern, handleAttributes
+from markdown.inlinepatterns import ImagePattern, handleAttributes, dequote
 from markdown.extensions import Extension
 import markdown
 from markdown import util, odict
@@ -14,6 +14,8 @@ try:  # pragma: no cover
 except ImportError:  # pragma: no cover
     import htmlentitydefs as entities
 
+from .imagelinks import REVISION, BASE_GITHUB_URL, rewrite_image_url
+
 NOBRACKET = ilp.NOBRACKET
 BRK = ilp.BRK
 IMAGE_LINK_RE = ilp.IMAGE_LINK_RE
@@ -21,11 +23,15 @@ IMAGE_LINK_RE = ilp.IMAGE_LINK_RE
 class RewriteImagePattern(ImagePattern):
     '''Replace image links with references to GITHUB'''
 
-    def __init__(self, pattern, directory_url, markdown_instance):
+    def __init__(self, pattern, extension, markdown_instance):
         """ Replaces matches with some text. """
-        self.directory_url = directory_url
+        self.extension = extension
         super(RewriteImagePattern, self).__init__(pattern, markdown_instance)
 
+    @property
+    def directory_url(self):
+        return self.extension.directory_url
+
     def handleMatch(self, m):
         el = util.etree.Element("img")
         src_parts = m.group(9).split()
@@ -35,19 +41,7 @@ class RewriteImagePattern(ImagePattern):
                 src = src[1:-1]
             # Now we parse relative directories and make them into
             # full links
-            relative_link_re = re.compile(
-                '''
-                ^images/.*$|
-                ^image/.*$
-                ''',
-                re.VERBOSE
-            )
-            if relative_link_re.match(src):
-                # Test replacement for image files
-                src = '{}/{}?raw=true'.format(
-                    self.directory_url,
-                    src
-                )
+            src = rewrite_image_url(src, self.directory_url)
 
             el.set('src', self.sanitize_url(self.unescape(src)))
         else:
@@ -66,31 +60,26 @@ class RewriteImagePattern(ImagePattern):
 class ImageReferencePreprocessor(Preprocessor):
     """ Rewrite Image references to point to github """
 
-    def __init__(self, directory_url, markdown_instance):
+    def __init__(self, extension, markdown_instance):
         """ Replaces matches with some text. """
-        self.directory_url = directory_url
+        self.extension = extension
         super(ImageReferencePreprocessor, self).__init__(markdown_instance)
 
-    def run(self, lines):
-        relative_link_re = re.compile(
-            '''
-            ^images/.*$|
-            ^image/.*$
-            ''',
-            re.VERBOSE
-        )
+    @property
+    def directory_url(self):
+        return self.extension.directory_url
 
+    def run(self, lines):
         # Loop through references, munge image links
         for k in self.markdown.references.keys():
-            if relative_link_re.match(self.markdown.references[k][0]):
-                # Replace with path to file in GitHub
-                self.markdown.references[k] = (
-                    '{}/{}?raw=true'.format(
-                        self.directory_url,
-                        self.markdown.references[k][0]
-                    ),
-                    self.markdown.references[k][1]
-                )
+            # Replace with path to file in GitHub
+            self.markdown.references[k] = (
+                rewrite_image_url(
+                    self.markdown.references[k][0],
+                    self.directory_url
+                ),
+                self.markdown.references[k][1]
+            )
 
         # Doesn't do anything to text
         return lines
@@ -100,31 +89,37 @@ class ImageLinkRewriteExtension(Extension):
     def __init__(self, **kwargs):
         self.config = {
             'base_github_url' : [
-                'https://github.com/NeCTAR-RC/nectarcloud-tier0doco/blob/master',
+                BASE_GITHUB_URL,
                 'URL for GitHub master branch'
             ],
             'image_file_path' : ['', 'Path to image (URL escaped)']
         }
         super(ImageLinkRewriteExtension, self).__init__(**kwargs)
 
-    def extendMarkdown(self, md, md_globals):
-        ''' Replace inbuilt image parsers with our own '''
-
-        directory_url = '{}/{}'.format(
+    @property
+    def directory_url(self):
+        ''' URL relative image links are rewritten against '''
+        return '{}/{}'.format(
             self.getConfig('base_github_url'),
             self.getConfig('image_file_path')
         )
+
+    def set_image_file_path(self, image_file_path):
+        ''' Point image links somewhere else without rebuilding Markdown '''
+        self.setConfig('image_file_path', image_file_path)
+
+    def extendMarkdown(self, md, md_globals):
+        ''' Replace inbuilt image parsers with our own '''
         md.inlinePatterns['image_link'] = RewriteImagePattern(
             IMAGE_LINK_RE,
-            directory_url,
+            self,
             md
         )
         md.preprocessors.add(
             'munge_image_urls',
-            ImageReferencePreprocessor(directory_url, md),
+            ImageReferencePreprocessor(self, md),
             '>reference'
         )
 
 def makeExtension(*args, **kwargs):
     return ImageLinkRewriteExtension(*args, **kwargs)
-
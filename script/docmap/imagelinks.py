@@ -0,0 +1,80 @@
+"""
+    docmap.imagelinks
+    ~~~~~~~~~~~~~~~~~
+
+    Rewriting relative image links in articles to point at GitHub
+
+    Nothing here needs Python-Markdown, so the commonmark renderer works
+    without it. The Python-Markdown extension is in imagelinkrewrite.
+"""
+
+import re
+
+# Bump whenever a change here changes the rendered HTML, so that
+# republishing because of it can be throttled
+REVISION = 1
+
+BASE_GITHUB_URL = 'https://github.com/NeCTAR-RC/nectarcloud-tier0doco/blob/master'
+
+# Relative links into an article's image directory
+relative_link_re = re.compile(
+    '''
+    ^images/.*$|
+    ^image/.*$
+    ''',
+    re.VERBOSE
+)
+
+def rewrite_image_url(src, directory_url):
+    ''' Point a relative image link at the image in GitHub '''
+    if relative_link_re.match(src):
+        return '{}/{}?raw=true'.format(directory_url, src)
+    return src
+
+class CommonMarkImageLinkRewrite:
+    """
+    Rewrite image links to point to github, as a markdown-it plugin
+
+    Reference definitions are rewritten before inline parsing, the same as
+    ImageReferencePreprocessor, then inline images are rewritten once the
+    inline tokens exist.
+    """
+
+    def __init__(self, base_github_url=BASE_GITHUB_URL, image_file_path=''):
+        self.base_github_url = base_github_url
+        self.image_file_path = image_file_path
+
+    @property
+    def directory_url(self):
+        ''' URL relative image links are rewritten against '''
+        return '{}/{}'.format(self.base_github_url, self.image_file_path)
+
+    def set_image_file_path(self, image_file_path):
+        ''' Point image links somewhere else without rebuilding the parser '''
+        self.image_file_path = image_file_path
+
+    def __call__(self, md):
+        ''' Install our rules into a MarkdownIt instance '''
+        md.core.ruler.after(
+            'block', 'munge_image_references', self.rewrite_references
+        )
+        md.core.ruler.after(
+            'inline', 'munge_image_urls', self.rewrite_images
+        )
+
+    def rewrite_references(self, state):
+        for reference in state.env.get('references', {}).values():
+            reference['href'] = rewrite_image_url(
+                reference['href'],
+                self.directory_url
+            )
+
+    def rewrite_images(self, state):
+        for token in state.tokens:
+            for child in token.children or []:
+                if child.type == 'image':
+                    child.attrs['src'] = rewrite_image_url(
+                        child.attrs['src'],
+                        self.directory_url
+                    )
+
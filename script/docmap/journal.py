@@ -0,0 +1,73 @@
+"""
+    docmap.journal
+    ~~~~~~~~~~~~~~
+
+    Append-only journal of Freshdesk operations that went through
+
+    The mappings are only saved once a whole update is done. Each
+    successful create, update and delete is also appended here as it
+    happens, one JSON object per line, so that if the bot dies part way
+    the next run can replay what Freshdesk already has into the mappings
+    instead of doing it again. The journal is cleared once the mappings
+    are saved.
+"""
+
+import json
+import logging
+import os
+import threading
+
+log = logging.getLogger()
+
+class Journal:
+    '''Journal file of {mapping, action, docid, record} entries'''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def record(self, mapping, action, docid, record=None):
+        '''
+        Append an operation, with the stored form of the record as it now
+        is in Freshdesk. Returns once the entry is on disk.
+        '''
+        line = json.dumps({
+            'mapping': mapping,
+            'action': action,
+            'docid': docid,
+            'record': record,
+        }, sort_keys=True) + '\n'
+
+        with self.lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def entries(self):
+        '''Entries in the order they were made'''
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return []
+
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # Only the last entry can be cut short by a crash
+                log.warning('Ignoring incomplete journal entry: %r' % line)
+        return entries
+
+    def clear(self):
+        '''Forget everything, once the mappings have been saved'''
+        with self.lock:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
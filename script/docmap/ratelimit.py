@@ -0,0 +1,105 @@
+"""
+    docmap.ratelimit
+    ~~~~~~~~~~~~~~~~
+
+    Keep Freshdesk API calls within quota
+
+    A token bucket holds a per minute budget of calls and refills
+    continuously. Freshdesk tells us how many calls we really have left
+    (X-RateLimit-Remaining) and how long to back off once we are out
+    (Retry-After), and the bucket follows it when it does.
+"""
+
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+log = logging.getLogger()
+
+DEFAULT_PER_MINUTE = 100
+
+class RateLimiter:
+    '''Token bucket shared between threads making API calls'''
+
+    def __init__(self, per_minute=DEFAULT_PER_MINUTE, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.blocked_until = 0.0
+        self.throttled = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def acquire(self):
+        '''Wait until a call may be made, returns the seconds waited'''
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def reserve(self):
+        '''
+        Take a call from the budget without waiting, returns the seconds
+        to wait before making it
+        '''
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            # Take the token now, going into debt if need be, so waiting
+            # callers are served in turn
+            self.tokens -= 1
+            wait = max(
+                -self.tokens / self.rate if self.tokens < 0 else 0.0,
+                self.blocked_until - now
+            )
+            if wait > 0:
+                self.throttled += wait
+
+        if wait > 0:
+            log.debug('Rate limited, waiting %.2fs' % wait)
+        return wait
+
+    def update(self, headers):
+        '''Adapt to the rate limit headers of a reply'''
+        remaining = headers.get('X-RateLimit-Remaining')
+        retry_after = headers.get('Retry-After')
+        with self.lock:
+            now = self.clock()
+            self._refill(now)
+            if remaining is not None:
+                try:
+                    self.tokens = min(self.tokens, float(remaining))
+                except ValueError:
+                    pass
+
+            if retry_after is not None:
+                seconds = retry_seconds(retry_after)
+                if seconds is not None:
+                    log.warning(
+                        'Freshdesk rate limit hit, backing off %ss' % seconds
+                    )
+                    self.tokens = min(self.tokens, 0.0)
+                    self.blocked_until = max(self.blocked_until, now + seconds)
+
+def retry_seconds(value):
+    '''Seconds from a Retry-After header, either a delay or a date'''
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
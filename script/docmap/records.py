@@ -0,0 +1,187 @@
+"""
+    docmap.records
+    ~~~~~~~~~~~~~~
+
+    Category, folder and article records
+
+    Records keep their fields in __slots__ rather than nested dicts, with
+    the Freshdesk IDs flattened into fd_* fields. from_dict and to_dict
+    convert to and from the format the mappings are stored in (see
+    DocumentMap), keeping any keys they don't know about as is.
+"""
+
+class Record:
+    '''Base for records, subclasses list their fields'''
+
+    __slots__ = ('title', 'fd_id', 'extra')
+
+    # Stored key for each field, in addition to title
+    fields = ()
+
+    # Stored freshdesk key for each fd_* field, in addition to id
+    fd_fields = ()
+
+    def __init__(self, title, fd_id=None, extra=None, **fields):
+        self.title = title
+        self.fd_id = fd_id
+        self.extra = extra
+        for field in self.fields + tuple(self.fd_fields.values()):
+            setattr(self, field, fields.pop(field, None))
+        if fields:
+            raise TypeError('Unknown fields {}'.format(', '.join(fields)))
+
+    @property
+    def freshdesk(self):
+        '''Whether the record has been pushed to Freshdesk'''
+        return self.fd_id is not None
+
+    def set_freshdesk(self, ids):
+        '''Take Freshdesk IDs from a compacted API reply'''
+        self.fd_id = ids['id']
+        for key, field in self.fd_fields.items():
+            setattr(self, field, ids.get(key))
+
+    def clear_freshdesk(self):
+        '''Forget the Freshdesk IDs, e.g. after a failed push'''
+        self.fd_id = None
+        for field in self.fd_fields.values():
+            setattr(self, field, None)
+        if self.extra:
+            self.extra.pop('freshdesk', None)
+
+    @property
+    def pending(self):
+        '''Whether Freshdesk missed a change to the record'''
+        return bool(self.extra and self.extra.get('freshdesk', {}).get('pending'))
+
+    def set_pending(self, pending):
+        '''
+        Note that a change didn't make it to Freshdesk, or that it has,
+        kept with the Freshdesk IDs so later pushes make it again
+        '''
+        extra = dict(self.extra or {})
+        freshdesk = dict(extra.pop('freshdesk', {}))
+        if pending:
+            freshdesk['pending'] = True
+        else:
+            freshdesk.pop('pending', None)
+        if freshdesk:
+            extra['freshdesk'] = freshdesk
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, content):
+        '''Record from its stored form'''
+        content = dict(content)
+        fields = {
+            field: content.pop(field, None) for field in ('title',) + cls.fields
+        }
+
+        freshdesk = content.pop('freshdesk', None)
+        if freshdesk:
+            freshdesk = dict(freshdesk)
+            fields['fd_id'] = freshdesk.pop('id', None)
+            for key, field in cls.fd_fields.items():
+                fields[field] = freshdesk.pop(key, None)
+            if freshdesk:
+                # Freshdesk keys we don't know about
+                content['freshdesk'] = freshdesk
+
+        return cls(extra=content or None, **fields)
+
+    def to_dict(self):
+        '''Stored form of the record'''
+        content = {'title': self.title}
+        for field in self.fields:
+            value = getattr(self, field)
+            if value is not None:
+                content[field] = value
+
+        extra = dict(self.extra) if self.extra else {}
+        freshdesk = extra.pop('freshdesk', {})
+        if self.fd_id is not None:
+            freshdesk = dict(freshdesk, id=self.fd_id)
+            for key, field in self.fd_fields.items():
+                freshdesk[key] = getattr(self, field)
+        if freshdesk:
+            content['freshdesk'] = freshdesk
+
+        content.update(extra)
+        return content
+
+    def __eq__(self, other):
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(
+            getattr(self, slot) == getattr(other, slot)
+            for slot in self._all_slots()
+        )
+
+    @classmethod
+    def _all_slots(cls):
+        return [
+            slot for klass in cls.__mro__
+            for slot in getattr(klass, '__slots__', ())
+        ]
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(slot, getattr(self, slot))
+            for slot in self._all_slots()
+            if getattr(self, slot) is not None
+        ))
+
+class Category(Record):
+    '''A category, the top level directories of the article tree'''
+
+    __slots__ = ()
+    fields = ()
+    fd_fields = {}
+
+class Folder(Record):
+    '''A folder, the directories in categories'''
+
+    __slots__ = ('parent', 'fd_category_id')
+    fields = ('parent',)
+    fd_fields = {'category_id': 'fd_category_id'}
+
+class Article(Record):
+    '''An article, the markdown files in folders'''
+
+    __slots__ = (
+        'parent', 'sha1', 'source_sha1', 'renderer',
+        'fd_folder_id', 'fd_category_id'
+    )
+    fields = ('parent', 'sha1', 'source_sha1', 'renderer')
+    fd_fields = {
+        'folder_id': 'fd_folder_id',
+        'category_id': 'fd_category_id',
+    }
+
+# Record type of each mapping and tree entry kind
+MAPPING_TYPES = {
+    'categories': Category,
+    'folders': Folder,
+    'articles': Article,
+}
+
+KIND_TYPES = {
+    'category': Category,
+    'folder': Folder,
+    'article': Article,
+}
+
+MAPPING_KINDS = {
+    'categories': 'category',
+    'folders': 'folder',
+    'articles': 'article',
+}
+
+def from_dicts(mapping, content):
+    '''Records of a stored mapping, keyed by DOCID'''
+    cls = MAPPING_TYPES[mapping]
+    return {docid: cls.from_dict(record) for docid, record in content.items()}
+
+def to_dicts(records):
+    '''Stored form of records keyed by DOCID'''
+    return {docid: record.to_dict() for docid, record in records.items()}
@@ -0,0 +1,150 @@
+"""
+    docmap.remote
+    ~~~~~~~~~~~~~
+
+    What Freshdesk actually holds, for finding drift from the mappings
+
+    fetch_snapshot reads every category, folder and article back from
+    Freshdesk, {mapping: {Freshdesk ID: {title, parent, updated_at}}} where
+    parent is the Freshdesk ID of the category or folder it is in.
+
+    RemoteState keeps the updated_at of every object as we last left it
+    between runs, so objects edited in the helpdesk since show up as
+    drifted. It is kept current from the replies to our own calls, so our
+    own changes don't.
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from .store import atomic_write
+
+log = logging.getLogger()
+
+class RemoteState:
+    '''Cache of {mapping: {Freshdesk ID: updated_at}} kept in a JSON file'''
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.updated = json.load(f)
+        except FileNotFoundError:
+            self.updated = {}
+        except ValueError:
+            log.warning('Ignoring unreadable Freshdesk state %s' % path)
+            self.updated = {}
+        for mapping in ['categories', 'folders', 'articles']:
+            self.updated.setdefault(mapping, {})
+        self.changed = False
+
+    def get(self, mapping, fd_id):
+        '''updated_at of an object as we last left it, or None'''
+        return self.updated[mapping].get(str(fd_id))
+
+    def seen(self, mapping, fd_id, updated_at):
+        if self.updated[mapping].get(str(fd_id)) != updated_at:
+            self.updated[mapping][str(fd_id)] = updated_at
+            self.changed = True
+
+    def forget(self, mapping, fd_id):
+        if self.updated[mapping].pop(str(fd_id), None) is not None:
+            self.changed = True
+
+    def save(self):
+        '''Write the cache out, if anything changed'''
+        if not self.changed:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        atomic_write(
+            self.path, json.dumps(self.updated, sort_keys=True).encode()
+        )
+        self.changed = False
+
+def fetch_snapshot(fdapi, workers=1):
+    '''
+    Everything in Freshdesk, fetching the folders of each category and
+    the articles of each folder on up to workers threads
+
+    The snapshot also has unlisted, {'categories': {Freshdesk ID},
+    'folders': {Freshdesk ID}} of those whose contents couldn't be
+    fetched, so are unknown rather than empty. Raises FreshDeskError if
+    the categories couldn't be.
+    '''
+    from .freshdesk import FreshDeskError
+
+    def listing(fetch, *args):
+        try:
+            return fetch(*args)
+        except FreshDeskError as e:
+            log.warning('Could not list Freshdesk contents: %s' % e)
+            return None
+
+    snapshot = {'categories': {}, 'folders': {}, 'articles': {}}
+    unlisted = {'categories': set(), 'folders': set()}
+    snapshot['unlisted'] = unlisted
+
+    replies = listing(fdapi.get_solution_categories)
+    if replies is None:
+        raise FreshDeskError('Could not list the Freshdesk categories')
+    categories = [reply['category'] for reply in replies]
+    for category in categories:
+        snapshot['categories'][category['id']] = {
+            'title': category.get('name'),
+            'parent': None,
+            'updated_at': category.get('updated_at'),
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        # Listings normally include the folders, fetch them if not
+        missing = [c for c in categories if 'folders' not in c]
+        for category, reply in zip(missing, pool.map(
+            lambda category: listing(
+                fdapi.get_solution_category, category['id']
+            ),
+            missing
+        )):
+            if reply is None:
+                unlisted['categories'].add(category['id'])
+                continue
+            category['folders'] = reply.get('category', {}).get('folders', [])
+
+        folders = [
+            dict(folder, category_id=category['id'])
+            for category in categories
+            for folder in category.get('folders') or []
+        ]
+        for folder in folders:
+            snapshot['folders'][folder['id']] = {
+                'title': folder.get('name'),
+                'parent': folder['category_id'],
+                'updated_at': folder.get('updated_at'),
+            }
+
+        for folder, reply in zip(folders, pool.map(
+            lambda folder: listing(fdapi.get_solutions_in_folder, folder),
+            folders
+        )):
+            if reply is None:
+                unlisted['folders'].add(folder['id'])
+                continue
+            for article in reply.get('folder', {}).get('articles', []):
+                snapshot['articles'][article['id']] = {
+                    'title': article.get('title'),
+                    'parent': folder['id'],
+                    'updated_at': article.get('updated_at'),
+                }
+
+    log.info('Freshdesk holds %s categories, %s folders and %s articles' % (
+        len(snapshot['categories']), len(snapshot['folders']),
+        len(snapshot['articles'])
+    ))
+    if unlisted['categories'] or unlisted['folders']:
+        log.warning('Could not list %s categories and %s folders' % (
+            len(unlisted['categories']), len(unlisted['folders'])
+        ))
+    return snapshot
@@ -0,0 +1,219 @@
+"""
+    docmap.render
+    ~~~~~~~~~~~~~
+
+    Render article markdown into the HTML published to Freshdesk
+
+    Rendering goes through a backend, either the Python-Markdown pipeline
+    we have always used ('markdown') or markdown-it's CommonMark parser
+    ('commonmark', needs markdown-it-py). Both rewrite relative image links
+    to point at GitHub (see docmap.imagelinks).
+"""
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import markdown_it
+    from markdown_it import MarkdownIt
+except ImportError:  # pragma: no cover
+    markdown_it = None
+
+from . import imagelinks
+
+# Fewer jobs than this are rendered in this process, starting workers
+# costs more than rendering a handful of articles
+PARALLEL_MIN_JOBS = 16
+
+class RenderError(Exception):
+    '''Custom exception for rendering issues'''
+    pass
+
+class RenderTimings:
+    '''Running totals of how long rendering took'''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+
+    def add(self, seconds):
+        '''Record one render'''
+        self.count += 1
+        self.total += seconds
+        self.slowest = max(self.slowest, seconds)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __str__(self):
+        return '{} renders in {:.3f}s (mean {:.4f}s, slowest {:.4f}s)'.format(
+            self.count, self.total, self.mean, self.slowest
+        )
+
+class MarkdownBackend:
+    '''
+    Python-Markdown with image link rewriting and tables
+
+    Python-Markdown is only imported once the backend is used, our
+    extension needs 2.x and the commonmark backend doesn't need it at all
+    '''
+
+    name = 'markdown'
+
+    @staticmethod
+    def config():
+        '''Everything about the backend that changes its output'''
+        from markdown import version as markdown_version
+        return 'markdown={};extensions=imagelinkrewrite-{},tables;'\
+            'output_format=html5'.format(
+                markdown_version,
+                imagelinks.REVISION
+            )
+
+    def __init__(self):
+        from markdown import Markdown
+        from markdown.extensions import tables
+        from . import imagelinkrewrite
+
+        self.image_ext = imagelinkrewrite.ImageLinkRewriteExtension()
+        self.md = Markdown(
+            extensions=[self.image_ext, tables.TableExtension()],
+            output_format='html5'
+        )
+
+    def convert(self, source, image_path):
+        self.image_ext.set_image_file_path(image_path)
+        self.md.reset()
+        return self.md.convert(source)
+
+class CommonMarkBackend:
+    '''markdown-it CommonMark parser with image link rewriting and tables'''
+
+    name = 'commonmark'
+
+    @staticmethod
+    def config():
+        '''Everything about the backend that changes its output'''
+        return 'markdown-it={};preset=commonmark;rules=table;'\
+            'plugins=imagelinkrewrite-{}'.format(
+                markdown_it.__version__ if markdown_it else None,
+                imagelinks.REVISION
+            )
+
+    def __init__(self):
+        if markdown_it is None:
+            raise RenderError('The commonmark renderer needs markdown-it-py')
+
+        self.image_rewrite = imagelinks.CommonMarkImageLinkRewrite()
+        self.md = MarkdownIt('commonmark').enable('table')
+        self.md.use(self.image_rewrite)
+
+    def convert(self, source, image_path):
+        self.image_rewrite.set_image_file_path(image_path)
+        return self.md.render(source)
+
+BACKENDS = {
+    MarkdownBackend.name: MarkdownBackend,
+    CommonMarkBackend.name: CommonMarkBackend,
+}
+
+def backend_config(backend):
+    '''Description of everything that affects the output of backend'''
+    try:
+        config = BACKENDS[backend].config
+    except KeyError:
+        raise RenderError('Unknown renderer {}'.format(backend))
+    return '{};{}'.format(backend, config())
+
+class Renderer:
+    '''
+    A configured rendering pipeline that is built once and reused for many
+    documents, with the image base path swapped in per document
+    '''
+
+    def __init__(self, backend='markdown'):
+        try:
+            self.backend = BACKENDS[backend]()
+        except KeyError:
+            raise RenderError('Unknown renderer {}'.format(backend))
+        self.timings = RenderTimings()
+
+    def render(self, source, image_path):
+        '''
+        Render markdown source, pointing relative image links at image_path
+        in GitHub
+        '''
+        start = time.perf_counter()
+        html = self.backend.convert(source, image_path)
+        self.timings.add(time.perf_counter() - start)
+        return html
+
+# One renderer per thread (and so per worker process), Markdown instances
+# aren't safe to share
+_local = threading.local()
+
+def get_renderer(backend='markdown'):
+    '''The Renderer for backend in the current thread'''
+    renderers = getattr(_local, 'renderers', None)
+    if renderers is None:
+        renderers = _local.renderers = {}
+    if backend not in renderers:
+        renderers[backend] = Renderer(backend)
+    return renderers[backend]
+
+def render_markdown(source, image_path, backend='markdown'):
+    '''
+    Render markdown source, pointing relative image links at image_path
+    in GitHub
+    '''
+    return get_renderer(backend).render(source, image_path)
+
+def _render_job(job):
+    '''
+    Render one (source, image_path, backend) job, runs in the worker
+    processes. Returns the HTML and how long it took.
+    '''
+    start = time.perf_counter()
+    html = render_markdown(*job)
+    return html, time.perf_counter() - start
+
+def _pool_context():
+    '''
+    Start method for render workers. We run in threads of the webhook
+    server, and forking a threaded process can deadlock on locks other
+    threads held.
+    '''
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context(
+        'forkserver' if 'forkserver' in methods else 'spawn'
+    )
+
+def render_all(jobs, workers=1, timings=None, backend='markdown'):
+    '''
+    Render a list of (source, image_path) jobs with backend, returning the
+    HTML for each in the same order. Render times are added to timings if
+    given.
+
+    With more than one worker and at least PARALLEL_MIN_JOBS jobs, they
+    are spread over a process pool. The output is identical to rendering
+    them one after another.
+    '''
+    jobs = [(source, image_path, backend) for source, image_path in jobs]
+    if workers <= 1 or len(jobs) < PARALLEL_MIN_JOBS:
+        results = [_render_job(job) for job in jobs]
+    else:
+        # Hand out work in chunks so small articles don't drown in IPC
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=_pool_context()
+        ) as pool:
+            results = list(pool.map(_render_job, jobs, chunksize=chunksize))
+
+    if timings is not None:
+        for html, seconds in results:
+            timings.add(seconds)
+    return [html for html, seconds in results]
@@ -0,0 +1,113 @@
+"""
+    docmap.rendercache
+    ~~~~~~~~~~~~~~~~~~
+
+    Persistent cache of rendered article HTML
+
+    Entries are keyed by a hash of everything that goes into a render (the
+    raw markdown, the image path and the renderer configuration), so an
+    entry never needs invalidating, only evicting. Files are written to a
+    temporary name and renamed into place, and eviction tolerates entries
+    disappearing underneath it, so several bot instances on the same host
+    can share one cache directory.
+"""
+
+import logging
+import os
+import tempfile
+from hashlib import sha1
+
+log = logging.getLogger()
+
+class RenderCache:
+    '''Size bounded, least recently used on disk cache of rendered HTML'''
+
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(source, image_path, config):
+        '''Cache key for a markdown source rendered with config'''
+        digest = sha1()
+        for part in (config, image_path, source):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], '{}.html'.format(key))
+
+    def get(self, key):
+        '''Cached HTML for key, or None'''
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                html = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        # Mark as recently used for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+        self.hits += 1
+        return html
+
+    def put(self, key, html):
+        '''Store HTML for key'''
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Write somewhere private, then atomically move into place so that
+        # no reader ever sees a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(html)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def prune(self):
+        '''Evict least recently used entries until under max_bytes'''
+        entries = []
+        total = 0
+        for directory in os.scandir(self.cache_dir):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if not entry.name.endswith('.html'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        evicted = 0
+        for mtime, size, path in sorted(entries):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Another instance got there first
+                pass
+            total -= size
+            evicted += 1
+            if total <= self.max_bytes:
+                break
+
+        log.info('Evicted %s entries from render cache' % evicted)
+        return evicted
@@ -0,0 +1,29 @@
+"""
+    docmap.session
+    ~~~~~~~~~~~~~~
+
+    Pooled HTTP sessions for the Freshdesk and Gerrit clients
+
+    Going through one requests.Session keeps connections alive between
+    calls, so a sync pays for the TCP and TLS handshakes once per host
+    rather than once per category, folder and article.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) seconds, requests waits forever by default
+DEFAULT_TIMEOUT = (10, 60)
+
+def make_session(pool_size=10, keep_alive=True):
+    '''
+    A requests.Session keeping up to pool_size connections per host. With
+    keep_alive off, every request asks the server to close its connection.
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
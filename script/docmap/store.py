@@ -0,0 +1,442 @@
+"""
+    docmap.store
+    ~~~~~~~~~~~~
+
+    Where DocumentMap keeps its mappings
+
+    A mapping is one of articles, folders and categories ({DOCID: record}),
+    counters ({kind: highest DOCID handed out}) or sync (see
+    DocumentMap.save_sync_state).
+"""
+
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from hashlib import sha1
+
+import yaml
+
+log = logging.getLogger()
+
+# libyaml is an order of magnitude faster, when it's there
+Loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+Dumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+def atomic_write(path, data):
+    '''
+    Write bytes to path through a temporary file renamed into place, so a
+    crash never leaves a partial file behind
+    '''
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.', suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+RECORD_MAPPINGS = ['articles', 'folders', 'categories']
+
+def repository_cache_dir(cache_dir, mapping_dir):
+    '''
+    Directory in cache_dir for what belongs to the mappings in mapping_dir
+    alone, so bots for different repositories can share cache_dir
+    '''
+    key = sha1(os.path.abspath(mapping_dir).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, 'repositories', key)
+
+class MappingStore:
+    '''
+    Interface between DocumentMap and its mappings. Subclasses implement
+    load and save, the per record and counter methods work through them
+    unless a backend can do better.
+    '''
+
+    def load(self, mapping):
+        '''Content of mapping, {} if there is none yet'''
+        raise NotImplementedError
+
+    def save(self, mapping, content):
+        '''Replace mapping with content, returns whether anything changed'''
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self):
+        '''Group per record changes so they apply all together or not at all'''
+        yield
+
+    def get_record(self, mapping, docid):
+        '''A single record, or None'''
+        return self.load(mapping).get(docid)
+
+    def put_record(self, mapping, docid, record):
+        '''Add or replace a single record'''
+        content = self.load(mapping)
+        content[docid] = record
+        self.save(mapping, content)
+
+    def delete_record(self, mapping, docid):
+        '''Remove a single record'''
+        content = self.load(mapping)
+        content.pop(docid, None)
+        self.save(mapping, content)
+
+    def find_freshdesk(self, mapping, freshdesk_id):
+        '''(DOCID, record) of the record with a Freshdesk ID, or None'''
+        for docid, record in self.load(mapping).items():
+            if (record.get('freshdesk') or {}).get('id') == freshdesk_id:
+                return docid, record
+        return None
+
+    def next_id(self, kind, current):
+        '''
+        Hand out the next DOCID for kind (category, folder or article),
+        current being the highest the caller knows of
+        '''
+        return current + 1
+
+class SnapshotCache:
+    '''
+    Parsed mapping files pickled next to the size, mtime and sha1 of the
+    YAML they came from, so unchanged files needn't be parsed again
+
+    A snapshot is used as is when the size and mtime of the file still
+    match. Otherwise the file is hashed, and if only the mtime changed (a
+    git checkout of the same content) the snapshot is still used and its
+    mtime brought up to date.
+    '''
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, yaml_path):
+        # One snapshot per mapping file, wherever the repository is
+        key = sha1(os.path.abspath(yaml_path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, '{}.pickle'.format(key))
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log.warning('Ignoring unreadable mapping snapshot %s: %s' % (path, e))
+            return None
+
+    def _write(self, path, snapshot):
+        atomic_write(path, pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL))
+
+    def load(self, yaml_path, parse):
+        '''Content of yaml_path, from its snapshot or else parse(data)'''
+        stat = os.stat(yaml_path)
+        path = self._path(yaml_path)
+        snapshot = self._read(path)
+        if snapshot is not None\
+        and snapshot['size'] == stat.st_size\
+        and snapshot['mtime'] == stat.st_mtime_ns:
+            self.hits += 1
+            return snapshot['content']
+
+        with open(yaml_path, 'rb') as f:
+            data = f.read()
+        digest = sha1(data).hexdigest()
+
+        if snapshot is not None and snapshot['sha1'] == digest:
+            self.hits += 1
+            content = snapshot['content']
+        else:
+            self.misses += 1
+            content = parse(data)
+
+        self.store(yaml_path, content, data, stat)
+        return content
+
+    def store(self, yaml_path, content, data, stat=None):
+        '''Snapshot content, parsed from (or dumped as) the bytes data'''
+        if stat is None:
+            stat = os.stat(yaml_path)
+        self._write(self._path(yaml_path), {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'sha1': sha1(data).hexdigest(),
+            'content': content,
+        })
+
+class YAMLMappingStore(MappingStore):
+    '''
+    Mappings as <mapping>.yaml files in a directory, the default
+
+    snapshot_dir is an optional directory for a SnapshotCache, skipping
+    the YAML parser for files that haven't changed since the last run.
+    '''
+
+    def __init__(self, mapping_dir, snapshot_dir=None):
+        self.mapping_dir = mapping_dir
+        self.snapshots = SnapshotCache(snapshot_dir) if snapshot_dir else None
+
+    def _path(self, mapping):
+        return '{}/{}.yaml'.format(self.mapping_dir, mapping)
+
+    @staticmethod
+    def _parse(data):
+        return yaml.load(data, Loader=Loader)
+
+    def load(self, mapping):
+        path = self._path(mapping)
+        try:
+            if self.snapshots:
+                content = self.snapshots.load(path, self._parse)
+            else:
+                with open(path, 'rb') as f:
+                    content = self._parse(f.read())
+        except FileNotFoundError:
+            # Only sync is optional
+            if mapping != 'sync':
+                raise
+            content = None
+        return content or {}
+
+    @staticmethod
+    def dump(content):
+        '''
+        YAML for content, always the same bytes for the same content so
+        repeated runs leave nothing for git to diff
+        '''
+        return yaml.dump(
+            content, Dumper=Dumper, default_flow_style=None, sort_keys=True
+        ).encode('utf-8')
+
+    def save(self, mapping, content):
+        data = self.dump(content)
+        path = self._path(mapping)
+        try:
+            with open(path, 'rb') as f:
+                unchanged = f.read() == data
+        except FileNotFoundError:
+            unchanged = False
+
+        if unchanged:
+            log.debug('%s unchanged, not rewriting it' % path)
+            return False
+
+        atomic_write(path, data)
+        if self.snapshots:
+            self.snapshots.store(path, content, data)
+        return True
+
+class SQLiteMappingStore(MappingStore):
+    '''
+    Mappings in a SQLite database, indexed by DOCID and Freshdesk ID, with
+    saves that only write the records that changed
+
+    If export_dir is given, the YAML files in it seed an empty database and
+    are rewritten whenever a save changes something, so there is still a
+    copy for people to review.
+    '''
+
+    schema = '''
+        CREATE TABLE IF NOT EXISTS records (
+            mapping TEXT NOT NULL,
+            docid INTEGER NOT NULL,
+            freshdesk_id INTEGER,
+            data TEXT NOT NULL,
+            PRIMARY KEY (mapping, docid)
+        );
+        CREATE INDEX IF NOT EXISTS records_freshdesk_id
+            ON records (mapping, freshdesk_id);
+        CREATE TABLE IF NOT EXISTS counters (
+            kind TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS state (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    '''
+
+    def __init__(self, path, export_dir=None):
+        self.path = path
+        self.export_dir = export_dir
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Autocommit, transactions are opened explicitly
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.executescript(self.schema)
+        self._depth = 0
+
+        if export_dir and self._empty():
+            self._import(YAMLMappingStore(export_dir))
+
+    def _empty(self):
+        return self.db.execute('SELECT COUNT(*) FROM counters').fetchone()[0] == 0
+
+    def _import(self, source):
+        '''Seed the database from another store'''
+        log.info('Importing mappings into %s' % self.path)
+        with self.transaction():
+            for mapping in RECORD_MAPPINGS + ['counters', 'sync']:
+                self._write(mapping, source.load(mapping))
+
+    @contextmanager
+    def transaction(self):
+        # Nested transactions join the outermost one
+        if self._depth == 0:
+            self.db.execute('BEGIN IMMEDIATE')
+        self._depth += 1
+        try:
+            yield
+        except:
+            self._depth -= 1
+            if self._depth == 0:
+                self.db.execute('ROLLBACK')
+            raise
+        else:
+            self._depth -= 1
+            if self._depth == 0:
+                self.db.execute('COMMIT')
+
+    @staticmethod
+    def _freshdesk_id(record):
+        return (record.get('freshdesk') or {}).get('id')
+
+    def load(self, mapping):
+        if mapping == 'counters':
+            rows = self.db.execute('SELECT kind, value FROM counters')
+            return {kind: value for kind, value in rows}
+        if mapping == 'sync':
+            rows = self.db.execute('SELECT key, value FROM state')
+            return {key: value for key, value in rows}
+
+        rows = self.db.execute(
+            'SELECT docid, data FROM records WHERE mapping = ?', (mapping,)
+        )
+        return {docid: json.loads(data) for docid, data in rows}
+
+    def save(self, mapping, content):
+        with self.transaction():
+            changed = self._write(mapping, content)
+
+        # next_id raises the counters in the database as it goes, leaving
+        # nothing to write here, so they are exported if they differ
+        if self.export_dir and (changed or mapping == 'counters'):
+            exported = YAMLMappingStore(self.export_dir)\
+                .save(mapping, self.load(mapping))
+            changed = changed or exported
+        return changed
+
+    def _write(self, mapping, content):
+        '''Write the differences between content and the database'''
+        if mapping == 'counters':
+            # Counters only ever go up, another bot may have allocated
+            # past what we loaded
+            stored = self.load(mapping)
+            rows = [
+                (kind, value) for kind, value in content.items()
+                if stored.get(kind) is None or value > stored[kind]
+            ]
+            self.db.executemany(
+                'INSERT INTO counters (kind, value) VALUES (?, ?) '
+                'ON CONFLICT (kind) DO UPDATE '
+                'SET value = MAX(value, excluded.value)',
+                rows
+            )
+            return len(rows)
+
+        if mapping == 'sync':
+            if self.load(mapping) == content:
+                return 0
+            self.db.execute('DELETE FROM state')
+            self.db.executemany(
+                'INSERT INTO state (key, value) VALUES (?, ?)', content.items()
+            )
+            return len(content)
+
+        stored = {
+            docid: data for docid, data in self.db.execute(
+                'SELECT docid, data FROM records WHERE mapping = ?', (mapping,)
+            )
+        }
+
+        rows = []
+        for docid, record in content.items():
+            data = json.dumps(record, sort_keys=True)
+            if stored.get(docid) != data:
+                rows.append((mapping, docid, self._freshdesk_id(record), data))
+        deleted = [(mapping, docid) for docid in stored if docid not in content]
+
+        self.db.executemany(
+            'INSERT OR REPLACE INTO records (mapping, docid, freshdesk_id, data) '
+            'VALUES (?, ?, ?, ?)',
+            rows
+        )
+        self.db.executemany(
+            'DELETE FROM records WHERE mapping = ? AND docid = ?', deleted
+        )
+        return len(rows) + len(deleted)
+
+    def get_record(self, mapping, docid):
+        row = self.db.execute(
+            'SELECT data FROM records WHERE mapping = ? AND docid = ?',
+            (mapping, docid)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_record(self, mapping, docid, record):
+        self.db.execute(
+            'INSERT OR REPLACE INTO records (mapping, docid, freshdesk_id, data) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                mapping, docid, self._freshdesk_id(record),
+                json.dumps(record, sort_keys=True)
+            )
+        )
+
+    def delete_record(self, mapping, docid):
+        self.db.execute(
+            'DELETE FROM records WHERE mapping = ? AND docid = ?',
+            (mapping, docid)
+        )
+
+    def find_freshdesk(self, mapping, freshdesk_id):
+        row = self.db.execute(
+            'SELECT docid, data FROM records '
+            'WHERE mapping = ? AND freshdesk_id = ?',
+            (mapping, freshdesk_id)
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def next_id(self, kind, current):
+        # Atomic across every bot sharing the database
+        with self.transaction():
+            self.db.execute(
+                'INSERT OR IGNORE INTO counters (kind, value) VALUES (?, ?)',
+                (kind, current)
+            )
+            self.db.execute(
+                'UPDATE counters SET value = MAX(value, ?) + 1 WHERE kind = ?',
+                (current, kind)
+            )
+            return self.db.execute(
+                'SELECT value FROM counters WHERE kind = ?', (kind,)
+            ).fetchone()[0]
+
+    def export_yaml(self, mapping_dir):
+        '''Write every mapping out as YAML for review'''
+        export = YAMLMappingStore(mapping_dir)
+        for mapping in RECORD_MAPPINGS + ['counters', 'sync']:
+            export.save(mapping, self.load(mapping))
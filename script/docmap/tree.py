@@ -0,0 +1,245 @@
+"""
+    docmap.tree
+    ~~~~~~~~~~~
+
+    Single pass index of the article directory
+
+    The article directory is laid out as
+
+        <article_dir>/<category>/<folder>/<article>.md
+
+    Anything deeper than the folder level (image directories and the like)
+    is never descended into.
+"""
+
+import os
+import re
+
+# Parse a single directory entry name (no path) into its title, DOCID and
+# extension in one go.
+name_re = re.compile(
+    r'''
+    ^(?P<title>.*?)                 # Parse out the title
+    (--DOCID(?P<docid>\d+))?        # Parse out internal DOCID if it exists
+    (?P<extension>\.[Mm][Dd])?$     # Get the extension (case is important)
+    ''',
+    re.VERBOSE
+)
+
+class TreeEntry:
+    '''A directory entry in the article tree with its parsed name'''
+
+    def __init__(self, parent_path, name):
+        self.parent_path = parent_path
+        self.name = name
+        parsed = name_re.match(name)
+        self.title = parsed.group('title')
+        self.extension = parsed.group('extension') or ''
+        self.docid = parsed.group('docid')
+        if self.docid is not None:
+            self.docid = int(self.docid)
+
+    @property
+    def path(self):
+        '''Full path of this entry'''
+        return '{}{}{}'.format(self.parent_path, os.sep, self.name)
+
+    def docid_name(self, docid):
+        '''Name of this entry once it has been given a DOCID'''
+        return '{title}--DOCID{docid}{extension}'.format(
+            title=self.title,
+            docid=docid,
+            extension=self.extension
+        )
+
+    def __repr__(self):
+        return '<{} {}>'.format(self.__class__.__name__, self.path)
+
+class ArticleFile(TreeEntry):
+    '''A markdown file inside a folder directory'''
+
+    def __init__(self, folder, name):
+        super().__init__(folder.path, name)
+        self.folder = folder
+
+class FolderDir(TreeEntry):
+    '''A folder directory inside a category directory'''
+
+    def __init__(self, category, name):
+        super().__init__(category.path, name)
+        self.category = category
+        self.articles = []
+
+class CategoryDir(TreeEntry):
+    '''A category directory directly under the article directory'''
+
+    def __init__(self, article_dir, name):
+        super().__init__(article_dir, name)
+        self.folders = []
+
+class ArticleTree:
+    '''
+    Category -> folder -> article index of the article directory, built
+    from one os.scandir pass per directory
+    '''
+
+    def __init__(self, article_dir):
+        self.article_dir = article_dir
+        self.categories = []
+        self.partial = False
+        self.removed = {'category': set(), 'folder': set(), 'article': set()}
+
+    def scan(self, paths=None):
+        '''
+        (Re)build the index from the filesystem
+
+        If paths (relative to the article directory, / separated) is
+        given, only the categories, folders and articles named in them are
+        indexed. The DOCIDs of named entries that no longer exist are kept
+        in removed so that deletions can still be found.
+        '''
+        self.categories = []
+        self.partial = paths is not None
+        self.removed = {'category': set(), 'folder': set(), 'article': set()}
+        wanted = None if paths is None else _wanted_entries(paths)
+
+        for entry in self._select(
+            _sorted_dirs(self.article_dir), wanted, 'category'
+        ):
+            category = CategoryDir(self.article_dir, entry.name)
+            self.categories.append(category)
+            wanted_folders = None if wanted is None else wanted[entry.name]
+
+            for folder_entry in self._select(
+                _sorted_dirs(category.path), wanted_folders, 'folder'
+            ):
+                folder = FolderDir(category, folder_entry.name)
+                category.folders.append(folder)
+                wanted_articles = None if wanted_folders is None\
+                    else wanted_folders[folder_entry.name]
+
+                for article_entry in self._select(
+                    _sorted_files(folder.path), wanted_articles, 'article'
+                ):
+                    article = ArticleFile(folder, article_entry.name)
+
+                    # Ignore any files that aren't Markdown and don't
+                    # carry a DOCID (.gitignore and friends)
+                    if article.extension or article.docid is not None:
+                        folder.articles.append(article)
+
+        return self
+
+    def _select(self, entries, wanted, kind):
+        '''
+        Limit entries to the wanted names (if any), recording the wanted
+        names that no longer exist as removed
+        '''
+        if wanted is None:
+            return entries
+
+        present = {e.name for e in entries}
+        for name in wanted:
+            if name not in present:
+                self._remove(kind, name, wanted)
+        return [e for e in entries if e.name in wanted]
+
+    def _remove(self, kind, name, wanted):
+        '''Record name, and everything wanted below it, as removed'''
+        docid = name_re.match(name).group('docid')
+        if docid is not None:
+            self.removed[kind].add(int(docid))
+
+        if kind == 'category':
+            for folder in wanted[name]:
+                self._remove('folder', folder, wanted[name])
+        elif kind == 'folder':
+            for article in wanted[name]:
+                self._remove('article', article, wanted[name])
+
+    def covers(self, kind, docid):
+        '''
+        Whether this tree would have seen docid of the given kind (category,
+        folder or article) had it still existed
+        '''
+        return not self.partial or docid in self.removed[kind]
+
+    def folders(self):
+        '''Iterate over all folders'''
+        for category in self.categories:
+            yield from category.folders
+
+    def articles(self):
+        '''Iterate over all articles'''
+        for folder in self.folders():
+            yield from folder.articles
+
+    def category_ids(self):
+        '''DOCIDs of all categories in the tree'''
+        return {c.docid for c in self.categories if c.docid is not None}
+
+    def folder_ids(self):
+        '''DOCIDs of all folders in the tree'''
+        return {f.docid for f in self.folders() if f.docid is not None}
+
+    def article_ids(self):
+        '''DOCIDs of all articles in the tree'''
+        return {a.docid for a in self.articles() if a.docid is not None}
+
+    def assign_docid(self, entry, docid):
+        '''
+        Rename an entry on disk so that it carries docid, and fix up the
+        paths of anything below it
+        '''
+        new_name = entry.docid_name(docid)
+        os.rename(entry.path, '{}{}{}'.format(entry.parent_path, os.sep, new_name))
+        entry.name = new_name
+        entry.docid = docid
+
+        if isinstance(entry, CategoryDir):
+            for folder in entry.folders:
+                folder.parent_path = entry.path
+                for article in folder.articles:
+                    article.parent_path = folder.path
+        elif isinstance(entry, FolderDir):
+            for article in entry.articles:
+                article.parent_path = entry.path
+
+def _sorted_dirs(path):
+    '''Sub directories of path, sorted by name'''
+    with os.scandir(path) as it:
+        return sorted(
+            (e for e in it if e.is_dir() and not e.name.startswith('.')),
+            key=lambda e: e.name
+        )
+
+def _sorted_files(path):
+    '''Files in path, sorted by name'''
+    with os.scandir(path) as it:
+        return sorted(
+            (e for e in it if e.is_file()),
+            key=lambda e: e.name
+        )
+
+def _wanted_entries(paths):
+    '''Turn relative paths into {category: {folder: {article, ...}}}'''
+    wanted = {}
+    for path in paths:
+        parts = path.split('/')
+        # Files at the top level are neither categories nor articles
+        if len(parts) < 2:
+            continue
+
+        folders = wanted.setdefault(parts[0], {})
+        if len(parts) < 3:
+            continue
+
+        articles = folders.setdefault(parts[1], set())
+        # Anything deeper than an article (images) only touches its folder
+        if len(parts) == 3:
+            articles.add(parts[2])
+    return wanted
+
+def scan_tree(article_dir, paths=None):
+    '''Build an ArticleTree for article_dir, see ArticleTree.scan'''
+    return ArticleTree(article_dir).scan(paths)
@@ -23,6 +23,7 @@ Configuration file is in yaml format, and is GPG encrypted.
 TODO: Add configuration file options
 '''
 
+import asyncio
 import time
 import io
 import os
@@ -41,6 +42,13 @@ import hmac
 import logging
 
 from docmap.freshdesk import FreshDeskDocumentMap
+from docmap.rendercache import RenderCache
+from docmap.store import YAMLMappingStore, SQLiteMappingStore
+from docmap.store import repository_cache_dir
+from docmap.session import make_session
+from docmap.ratelimit import RateLimiter
+from docmap.journal import Journal
+from docmap.remote import RemoteState
 from gerrit import GerritAPI
 
 
@@ -113,6 +121,125 @@ def parse_args():
         help='articles path relative to repopath'
     )
 
+    # Rendered HTML cache, can be shared between bots on the same host
+    parser.add_argument(
+        '--cachedir',
+        default=os.path.expanduser('~/.cache/nectar-doco-bot'),
+        help='Directory for caches shared between runs',
+        action=ExpandHomeAction
+    )
+
+    parser.add_argument(
+        '--cachesize',
+        default=256,
+        type=int,
+        help='Maximum size of the render cache in MB'
+    )
+
+    parser.add_argument(
+        '--renderworkers',
+        default=os.cpu_count() or 1,
+        type=int,
+        help='Number of processes to render articles in'
+    )
+
+    parser.add_argument(
+        '--renderer',
+        default='markdown',
+        choices=['markdown', 'commonmark'],
+        help='Markdown rendering backend, commonmark needs markdown-it-py'
+    )
+
+    parser.add_argument(
+        '--republishlimit',
+        default=20,
+        type=int,
+        help='Maximum number of articles republished per run when only '
+            'the renderer changed'
+    )
+
+    parser.add_argument(
+        '--store',
+        default='yaml',
+        choices=['yaml', 'sqlite'],
+        help='Where mappings are kept, sqlite still exports YAML into the '
+            'repository for review'
+    )
+
+    parser.add_argument(
+        '--storepath',
+        default=None,
+        help='SQLite mapping database, defaults to mappings.sqlite in the '
+            'repository\'s part of the cache directory',
+        action=ExpandHomeAction
+    )
+
+    parser.add_argument(
+        '--httppool',
+        default=10,
+        type=int,
+        help='Connections kept open per host for Freshdesk and Gerrit calls'
+    )
+
+    parser.add_argument(
+        '--httptimeout',
+        default=60,
+        type=float,
+        help='Seconds to wait for a Freshdesk or Gerrit response'
+    )
+
+    parser.add_argument(
+        '--pushworkers',
+        default=8,
+        type=int,
+        help='Freshdesk calls made at once, keep at most HTTPPOOL'
+    )
+
+    parser.add_argument(
+        '--ratelimit',
+        default=100,
+        type=int,
+        help='Freshdesk API calls allowed per minute, slowed down further '
+            'when Freshdesk says so'
+    )
+
+    parser.add_argument(
+        '--retries',
+        default=4,
+        type=int,
+        help='Times a Freshdesk call is retried after a timeout, connection '
+            'error, 5xx or 429 reply'
+    )
+
+    # Compare against what Freshdesk holds and fix what drifted
+    parser.add_argument(
+        '--reconcile',
+        action='store_true',
+        help='Read everything back from Freshdesk first and push whatever '
+            'was lost or edited there'
+    )
+
+    parser.add_argument(
+        '--asyncpush',
+        action='store_true',
+        help='Push to Freshdesk from an asyncio event loop instead of '
+            'threads, PUSHWORKERS calls at once (needs aiohttp)'
+    )
+
+    parser.add_argument(
+        '--nokeepalive',
+        action='store_true',
+        help='Close HTTP connections after every request'
+    )
+
+    # Always rescan everything instead of only what changed in git
+    parser.add_argument(
+        '--fullsync',
+        action='store_true',
+        help='Scan and render all articles, not just the ones changed '
+            'since the last synchronised commit'
+    )
+
     parser.add_argument(
         '-l',
         '--loglevel',
@@ -145,7 +272,7 @@ def parse_args():
 
     return args
 
-def configure_flask_server(args, config_dict):
+def configure_flask_server(args, config_dict, session, limiter):
     """Set up flask server"""
     endpoint = Flask(__name__)
 
@@ -176,7 +303,10 @@ def configure_flask_server(args, config_dict):
             abort(406)
 
         # Spawn a thread to process the request, and return OK immediately
-        t = threading.Thread(target=process_update, args=(args,config_dict))
+        t = threading.Thread(
+            target=process_update,
+            args=(args, config_dict, session, limiter)
+        )
         t.start()
 
         return 'OK'
@@ -184,7 +314,7 @@ def configure_flask_server(args, config_dict):
     # Return our endpoint
     return endpoint
 
-def process_update(args, config):
+def process_update(args, config, session, limiter):
 
         # Rebase the current branch
         subprocess.call(['git', 'checkout', 'master'])
@@ -202,13 +332,44 @@ def process_update(args, config):
         if not os.path.exists(article_dir):
             os.makedirs(article_dir)
 
+        # The cache directory may be shared with bots for other
+        # repositories, what is about these mappings alone goes in here
+        repo_cache_dir = repository_cache_dir(args.cachedir, mapping_dir)
+
+        if args.store == 'sqlite':
+            store = SQLiteMappingStore(
+                args.storepath
+                or os.path.join(repo_cache_dir, 'mappings.sqlite'),
+                export_dir=mapping_dir
+            )
+        else:
+            store = YAMLMappingStore(
+                mapping_dir,
+                snapshot_dir=os.path.join(args.cachedir, 'mappings')
+            )
+
         # Documentation map between directory/files and
         # Categories/Folders/Articles
         docmap = FreshDeskDocumentMap(
             mapping_dir,
             article_dir,
             config['freshdesk_config']['api_url'],
-            config['freshdesk_config']['api_token']
+            config['freshdesk_config']['api_token'],
+            render_cache=RenderCache(
+                os.path.join(args.cachedir, 'render'),
+                args.cachesize * 1024 * 1024
+            ),
+            render_workers=args.renderworkers,
+            renderer=args.renderer,
+            republish_limit=args.republishlimit,
+            store=store,
+            session=session,
+            timeout=args.httptimeout,
+            push_workers=args.pushworkers,
+            limiter=limiter,
+            retries=args.retries,
+            journal=Journal(os.path.join(repo_cache_dir, 'journal.jsonl')),
+            remote=RemoteState(os.path.join(repo_cache_dir, 'remote.json'))
         )
 
         # Set up gerrit interface
@@ -216,14 +377,23 @@ def process_update(args, config):
             config['gerrit_config']['gerrit_url'],
             config['gerrit_config']['project_name'],
             config['gerrit_config']['web_username'],
-            config['gerrit_config']['web_password']
+            config['gerrit_config']['web_password'],
+            session=session,
+            timeout=args.httptimeout
         )
 
-        # Reparse the filesystem
-        docmap.update_articles()
+        # Reparse the filesystem, only looking at what changed in git since
+        # the last sync unless told otherwise
+        docmap.update_articles(incremental=not args.fullsync)
+
+        if args.reconcile:
+            docmap.reconcile_freshdesk()
 
         # Push the changes into Freshdesk
-        docmap.synchronize_freshdesk()
+        if args.asyncpush:
+            asyncio.run(docmap.synchronize_freshdesk_async(args.pushworkers))
+        else:
+            docmap.synchronize_freshdesk()
 
         # Write out the updated information
         docmap.save_categories()
@@ -231,11 +401,17 @@ def process_update(args, config):
         docmap.save_articles()
         docmap.save_counters()
 
+        # Freshdesk and the mappings agree again
+        docmap.clear_journal()
+
         # Check if we need to make a new change
         log.debug('Checking if we need a change: {}'.format(
             docmap.require_change
         ))
         if docmap.require_change:
+            # Record the commit we synchronised from along with the change
+            docmap.save_sync_state()
+
             # Assumes we are in the repo directory
             # Create a branch
             change_title = 'brokerupdate-{}'.format(
@@ -318,8 +494,14 @@ if __name__ == '__main__':
     # Change into the repo directory
     os.chdir(args.repopath)
 
+    # One pool of HTTP connections for every update
+    session = make_session(args.httppool, keep_alive=not args.nokeepalive)
+
+    # One Freshdesk quota, however many updates run at once
+    limiter = RateLimiter(args.ratelimit)
+
     # Configure the endpoint
-    endpoint = configure_flask_server(args, config)
+    endpoint = configure_flask_server(args, config, session, limiter)
     endpoint.run(config['flask_config']['listen_address'])
 
 
@@ -5,13 +5,27 @@ import json
 import re
 from pprint import pformat
 
+from docmap.session import make_session, DEFAULT_TIMEOUT
+
 log = logging.getLogger()
 
 class GerritAPI:
     '''Interacts with the NeCTAR Gerrit'''
 
-    def __init__(self, gerrit_url, project_name, username, password):
-        '''Get auth and project information'''
+    def __init__(self, gerrit_url, project_name, username, password,
+                 session=None, timeout=DEFAULT_TIMEOUT,
+                 submit_timeout=(DEFAULT_TIMEOUT[0], None)):
+        '''
+        Get auth and project information
+
+        session is the requests.Session calls go through, by default a
+        new pooled one, and timeout is the requests timeout for each call.
+        Submitting waits for the merge, so it gets submit_timeout instead,
+        by default with no read timeout.
+        '''
+        self.session = session if session is not None else make_session()
+        self.timeout = timeout
+        self.submit_timeout = submit_timeout
         self.gerrit_url = gerrit_url
         self.project_name = project_name
         self.username = username
@@ -33,9 +47,10 @@ class GerritAPI:
             "status": "DRAFT"
         }
         log.debug(pformat(change_info))
-        reply = requests.post(
+        reply = self.session.post(
             url,
             auth=self.auth,
+            timeout=self.timeout,
             headers=self.headers,
             data=json.dumps(change_info)
         )
@@ -60,9 +75,10 @@ class GerritAPI:
         params = {
             'o': 'CURRENT_REVISION'
         }
-        reply = requests.get(
+        reply = self.session.get(
             url,
             auth=self.auth,
+            timeout=self.timeout,
             headers=self.headers,
             params=params
         )
@@ -87,9 +103,10 @@ class GerritAPI:
             }
         }
 
-        reply = requests.post(
+        reply = self.session.post(
             review_url,
             auth=self.auth,
+            timeout=self.timeout,
             headers=self.headers,
             data=json.dumps(params)
         )
@@ -108,9 +125,10 @@ class GerritAPI:
             'wait_for_merge': True
         }
 
-        reply = requests.post(
+        reply = self.session.post(
             submit_url,
             auth=self.auth,
+            timeout=self.submit_timeout,
             headers=self.headers,
             data=json.dumps(params)
         )
@@ -132,11 +150,19 @@ class GerritAPI:
         )
 
         log.debug('URL: {}'.format(url))
-        # Send request
-        reply = requests.get(
-            url,
-            auth=self.auth,
-        )
+        # Send request, a call that didn't go through is asked again on
+        # the next poll
+        try:
+            reply = self.session.get(
+                url,
+                auth=self.auth,
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            log.warning('Could not check {} is verified: {}'.format(
+                long_change_id, e
+            ))
+            return(False)
 
         if reply.status_code == requests.codes.ok:
             log.debug('Status OK\nGot the following {}'.format(reply.text))
@@ -0,0 +1,171 @@
+from sys import path
+path.append('..')
+
+import json
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from docmap.aiofreshdesk import AsyncFreshDesk, aiohttp
+from docmap.blobstore import BlobStore
+from docmap.freshdesk import FreshDesk, FreshDeskError
+from docmap.records import Category, Article
+from test_freshdesk_calls import MemoryFreshDeskDocumentMap
+
+class StubHandler(BaseHTTPRequestHandler):
+    '''Answers like the Freshdesk solutions API, handing out IDs from 101'''
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, content=None):
+        body = json.dumps(content).encode() if content is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with server.lock:
+            server.calls.append(('POST', self.path, payload))
+            server.next_id += 1
+            new_id = server.next_id
+            fail = server.fail
+            if fail:
+                server.fail -= 1
+        if fail:
+            return self.reply(503)
+
+        parts = self.path.split('/')
+        if self.path.endswith('/articles.json'):
+            self.reply(201, {'article': {
+                'id': new_id, 'folder_id': int(parts[-2]),
+                'folder': {'category_id': int(parts[-4])},
+            }})
+        elif self.path.endswith('/folders.json'):
+            self.reply(201, {'folder': {
+                'id': new_id, 'category_id': int(parts[-2])
+            }})
+        else:
+            self.reply(201, {'category': {'id': new_id}})
+
+    def do_GET(self):
+        # Nothing to adopt
+        if self.path == '/solution/categories.json':
+            self.reply(200, [])
+        elif '/folders/' in self.path:
+            self.reply(200, {'folder': {'articles': []}})
+        else:
+            self.reply(200, {'category': {'folders': []}})
+
+    def do_PUT(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            self.server.calls.append(('PUT', self.path, None))
+        self.reply(200, {})
+
+    def do_DELETE(self):
+        with self.server.lock:
+            self.server.calls.append(('DELETE', self.path, None))
+        self.reply(200)
+
+@unittest.skipIf(aiohttp is None, 'needs aiohttp')
+class TestAsyncFreshDesk(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.calls = []
+        self.server.next_id = 100
+        self.server.fail = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.api_url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.blobs = BlobStore(self.tmp.name)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp.cleanup()
+
+    def client(self, **kwargs):
+        fd = AsyncFreshDesk(self.api_url, 'api_token', self.blobs, **kwargs)
+        fd.backoff = 0
+        return fd
+
+    async def test_methods(self):
+        async with self.client() as fd:
+            reply = await fd.create_category(Category('cat'))
+            self.assertEqual(reply, {'category': {'id': 101}})
+            article = Article(
+                'art', sha1=self.blobs.put('<p>body</p>'),
+                fd_id=3, fd_folder_id=2, fd_category_id=1
+            )
+            self.assertEqual(await fd.update_article(article), {})
+            self.assertTrue(await fd.delete_article(article))
+
+        self.assertEqual(self.server.calls, [
+            ('POST', '/solution/categories.json',
+             {'solution_category': {'name': 'cat', 'description': 'cat'}}),
+            ('PUT', '/solution/categories/1/folders/2/articles/3.json', None),
+            ('DELETE', '/solution/categories/1/folders/2/articles/3.json', None),
+        ])
+
+    async def test_retry(self):
+        self.server.fail = 2
+        async with self.client() as fd:
+            reply = await fd.create_category(Category('cat'))
+        self.assertEqual(reply, {'category': {'id': 103}})
+        self.assertEqual(fd.retried, 2)
+
+    async def test_gives_up(self):
+        # Nothing listens on port 1
+        self.api_url = 'http://127.0.0.1:1'
+        async with self.client(retries=1) as fd:
+            with self.assertRaises(FreshDeskError):
+                await fd.delete_category(Category('cat', fd_id=1))
+        self.assertEqual(fd.retried, 1)
+
+    async def test_synchronize(self):
+        mappings = {
+            'categories': {1: {'title': 'Cat'}},
+            'folders': {1: {'title': 'Folder', 'parent': 1}},
+            'articles': {},
+            'counters': {},
+        }
+        for aid in range(1, 21):
+            mappings['articles'][aid] = {
+                'title': 'Article {}'.format(aid), 'parent': 1,
+                'sha1': self.blobs.put('<p>{}</p>'.format(aid)),
+            }
+        dm = MemoryFreshDeskDocumentMap(mappings)
+        dm.fdapi = FreshDesk(self.api_url, 'api_token', self.blobs)
+        await dm.synchronize_freshdesk_async(concurrency=5)
+
+        self.assertEqual(dm.categories[1].fd_id, 101)
+        self.assertEqual(dm.folders[1].fd_category_id, 101)
+        self.assertEqual(
+            sorted(dm.articles[aid].fd_id for aid in range(1, 21)),
+            list(range(103, 123))
+        )
+        for aid in range(1, 21):
+            self.assertEqual(dm.articles[aid].fd_folder_id, 102)
+            self.assertEqual(dm.articles[aid].fd_category_id, 101)
+        self.assertTrue(dm.require_change)
+
+        # Parents are created before children
+        paths = [path for method, path, payload in self.server.calls]
+        self.assertEqual(paths[:2], [
+            '/solution/categories.json',
+            '/solution/categories/101/folders.json',
+        ])
+        self.assertEqual(
+            set(paths[2:]),
+            {'/solution/categories/101/folders/102/articles.json'}
+        )
+
+if __name__ == '__main__':
+    unittest.main()
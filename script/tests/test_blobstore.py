@@ -0,0 +1,39 @@
+from sys import path
+path.append('..')
+
+import os
+import tempfile
+import unittest
+from hashlib import sha1
+
+from docmap.blobstore import BlobStore, BlobStoreError
+
+class TestBlobStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.blobs = BlobStore(os.path.join(self.tmp.name, 'html'))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_get(self):
+        html = '<p>Café\r\n</p>'
+        digest = self.blobs.put(html)
+        self.assertEqual(digest, sha1(html.encode('utf-8')).hexdigest())
+        self.assertIn(digest, self.blobs)
+        self.assertEqual(self.blobs.get(digest), html)
+        self.assertEqual(self.blobs.put(html), digest)
+
+    def test_missing(self):
+        with self.assertRaises(BlobStoreError):
+            self.blobs.get('0' * 40)
+
+    def test_prune(self):
+        keep = self.blobs.put('<p>keep</p>')
+        drop = self.blobs.put('<p>drop</p>')
+        self.assertEqual(self.blobs.prune({keep}), 1)
+        self.assertIn(keep, self.blobs)
+        self.assertNotIn(drop, self.blobs)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,18 @@
 from sys import path
 path.append('..')
 
+import os
+import copy
+import tempfile
 import unittest
+from hashlib import sha1
 from unittest.mock import patch
 from unittest.mock import create_autospec
 
 from docmap import DocumentMap
 from docmap.freshdesk import FreshDeskDocumentMap
+from docmap.fingerprint import Fingerprints, FIELDS, changed_fields, flag_update
+from docmap.records import from_dicts
 
 class TestDocMapDef(unittest.TestCase):
     def setUp(self):
@@ -35,15 +41,16 @@ class TestDocMap(unittest.TestCase):
         self.assertTrue(dm.categories)
         self.assertTrue(dm.counters)
 
-        # contents of orginal and copy should be equal
-        self.assertEqual(dm.orig_articles, dm.articles)
-        self.assertEqual(dm.orig_folders, dm.folders)
-        self.assertEqual(dm.orig_categories, dm.categories)
+        # fingerprints of the originals should match the records
+        self.assertEqual(dm.orig_articles.changed(dm.articles), set())
+        self.assertEqual(dm.orig_folders.changed(dm.folders), set())
+        self.assertEqual(dm.orig_categories.changed(dm.categories), set())
+        self.assertEqual(len(dm.orig_articles), len(dm.articles))
 
-        # contents of orginal and copy should have different mem allocations
-        self.assertNotEqual(id(dm.orig_articles), id(dm.articles))
-        self.assertNotEqual(id(dm.orig_folders), id(dm.folders))
-        self.assertNotEqual(id(dm.orig_categories), id(dm.categories))
+        # and not change along with them
+        fid = next(iter(dm.folders))
+        dm.folders[fid].parent = 'moved'
+        self.assertEqual(dm.orig_folders.changed(dm.folders), {fid})
 
         # content of mapping should not be empty and has right keys
         self.assertTrue(dm.counters['article'] in dm.articles.keys())
@@ -51,5 +58,158 @@ class TestDocMap(unittest.TestCase):
         self.assertTrue(dm.counters['category'] in dm.categories.keys())
         self.assertEqual(frozenset(dm.counters.keys()), frozenset(['folder', 'article', 'category']))
 
+class MemoryDocumentMap(DocumentMap):
+    '''DocumentMap with its mappings given up front instead of loaded'''
+    def __init__(self, mappings, mapping_dir, article_dir, **kwargs):
+        self.mappings = mappings
+        super().__init__(mapping_dir, article_dir, **kwargs)
+
+    def load_mappings(self):
+        for mapping, content in self.mappings.items():
+            self._save_origin(mapping, copy.deepcopy(content))
+        self.sync_state = {}
+
+class TestRendererRepublish(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mapping_dir = os.path.join(self.tmp.name, 'mappings')
+        self.article_dir = os.path.join(self.tmp.name, 'articles')
+        folder = os.path.join(self.article_dir, 'Cat--DOCID1', 'Folder--DOCID1')
+        os.makedirs(folder)
+
+        self.sources = {}
+        articles = {}
+        for aid in range(1, 5):
+            self.sources[aid] = '# Article {}'.format(aid)
+            with open(os.path.join(folder, 'A{0}--DOCID{0}.md'.format(aid)), 'w') as f:
+                f.write(self.sources[aid])
+            articles[aid] = {
+                'title': 'A{}'.format(aid),
+                'parent': 1,
+                'sha1': 'old sha1',
+                'source_sha1': sha1(self.sources[aid].encode('utf-8')).hexdigest(),
+                'renderer': 'old renderer',
+            }
+
+        # Article 4 was also edited
+        with open(os.path.join(folder, 'A4--DOCID4.md'), 'w') as f:
+            f.write('# Edited')
+
+        self.mappings = {
+            'articles': articles,
+            'folders': {1: {'title': 'Folder', 'parent': 1}},
+            'categories': {1: {'title': 'Cat'}},
+            'counters': {'article': 4, 'folder': 1, 'category': 1},
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_throttled(self):
+        dm = MemoryDocumentMap(
+            self.mappings, self.mapping_dir, self.article_dir, republish_limit=2
+        )
+        dm.update_articles()
+
+        # Content change goes out at once, renderer only changes are capped
+        self.assertEqual(sorted(dm.article_updates), [1, 2, 4])
+        self.assertEqual(dm.republish_pending, 1)
+        self.assertEqual(dm.articles[3].renderer, 'old renderer')
+        self.assertEqual(dm.articles[3].sha1, 'old sha1')
+        self.assertEqual(dm.articles[1].renderer, dm.render_config)
+
+        # The next run picks up what was left over
+        dm = MemoryDocumentMap(
+            {k: dm.mapping_content(k) for k in self.mappings},
+            self.mapping_dir,
+            self.article_dir,
+            republish_limit=2
+        )
+        dm.update_articles()
+        self.assertEqual(sorted(dm.article_updates), [3])
+        self.assertEqual(dm.republish_pending, 0)
+
+    def test_unlimited(self):
+        dm = MemoryDocumentMap(self.mappings, self.mapping_dir, self.article_dir)
+        dm.update_articles()
+        self.assertEqual(sorted(dm.article_updates), [1, 2, 3, 4])
+
+        # Only the hash is kept in the record, the HTML is in the store
+        self.assertNotIn('html', dm.mapping_content('articles')[4])
+        self.assertEqual(dm.blobs.get(dm.articles[4].sha1), '<h1>Edited</h1>')
+
+    def test_same_html(self):
+        # Published as it renders now
+        dm = MemoryDocumentMap(self.mappings, self.mapping_dir, self.article_dir)
+        dm.update_articles()
+        mappings = {k: dm.mapping_content(k) for k in self.mappings}
+
+        dm = MemoryDocumentMap(mappings, self.mapping_dir, self.article_dir)
+        dm.update_articles()
+        self.assertFalse(dm.require_change)
+
+        # A trailing newline renders to the same HTML
+        path = os.path.join(
+            self.article_dir, 'Cat--DOCID1', 'Folder--DOCID1', 'A1--DOCID1.md'
+        )
+        with open(path, 'a') as f:
+            f.write('\n')
+        dm = MemoryDocumentMap(mappings, self.mapping_dir, self.article_dir)
+        dm.update_articles()
+        self.assertEqual(dm.article_updates, {})
+        self.assertEqual(dm.articles[1].sha1, mappings['articles'][1]['sha1'])
+        # but the mappings change, so they are committed
+        self.assertNotEqual(
+            dm.articles[1].source_sha1, mappings['articles'][1]['source_sha1']
+        )
+        self.assertTrue(dm.require_change)
+
+class TestFindChanges(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mapping_dir = os.path.join(self.tmp.name, 'mappings')
+        self.article_dir = os.path.join(self.tmp.name, 'articles')
+        # Folder 2 has moved from category 1 to category 2
+        os.makedirs(os.path.join(self.article_dir, 'Cat--DOCID1', 'Folder--DOCID1'))
+        os.makedirs(os.path.join(self.article_dir, 'Other--DOCID2', 'Moved--DOCID2'))
+        self.mappings = {
+            'articles': {},
+            'folders': {
+                1: {'title': 'Folder', 'parent': 1},
+                2: {'title': 'Moved', 'parent': 1},
+            },
+            'categories': {1: {'title': 'Cat'}, 2: {'title': 'Old title'}},
+            'counters': {'article': 0, 'folder': 2, 'category': 2},
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_updates(self):
+        dm = MemoryDocumentMap(self.mappings, self.mapping_dir, self.article_dir)
+        dm.update_articles()
+        self.assertEqual(dm.category_updates, {2: {'title'}})
+        self.assertEqual(dm.folder_updates, {2: {'parent'}})
+        self.assertEqual(dm.folders[2].parent, 2)
+
+    def test_update_fields(self):
+        records = from_dicts('articles', {
+            1: {'title': 'Art', 'parent': 1, 'sha1': 'a'},
+        })
+        origin = Fingerprints(FIELDS['articles'], records)
+        records[1].sha1 = 'b'
+        records[1].renderer = 'other'
+        self.assertEqual(changed_fields(origin, 1, records[1]), ['body'])
+        records[2] = records[1]
+        self.assertIs(changed_fields(origin, 2, records[2]), True)
+
+        updates = {}
+        flag_update(updates, 1, ['title'])
+        flag_update(updates, 1, ['body'])
+        self.assertEqual(updates, {1: {'title', 'body'}})
+        flag_update(updates, 1, True)
+        flag_update(updates, 1, ['parent'])
+        self.assertEqual(updates, {1: True})
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
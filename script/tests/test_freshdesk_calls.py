@@ -1,12 +1,26 @@
 from sys import path
 path.append('..')
 
+import copy
+import json
 import logging
+import os
+import tempfile
+import threading
+import time
 
 import unittest
 from unittest.mock import patch
 
-from docmap.freshdesk import FreshDesk
+import requests
+
+from docmap.blobstore import BlobStore
+from docmap.freshdesk import FreshDesk, FreshDeskDocumentMap, FreshDeskError
+from docmap.freshdesk import compact_category, compact_folder, compact_article
+from docmap.records import Category, Folder, Article, to_dicts
+from docmap.session import make_session, DEFAULT_TIMEOUT
+from docmap.ratelimit import RateLimiter
+from docmap.journal import Journal
 from mock import Response
 
 logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=logging.DEBUG)
@@ -14,23 +28,616 @@ logging.basicConfig(format='%(asctime)s %(levelname)s %(message)s', level=loggin
 class TestFreshDesk(unittest.TestCase):
     def setUp(self):
         self.fd = FreshDesk('api_url', 'api_token')
+        # Don't wait between retries
+        self.fd.sleep = lambda seconds: None
 
     def test_get_solution_categories(self):
-        with patch('requests.get') as patched_get:
+        with patch('requests.Session.get') as patched_get:
+            patched_get.return_value = Response(200)
             self.fd.get_solution_categories()
-            patched_get.assert_called_with('api_url/solution/categories.json', auth=('api_token', 'X'))
+            patched_get.assert_called_with(
+                'api_url/solution/categories.json',
+                auth=('api_token', 'X'),
+                timeout=DEFAULT_TIMEOUT
+            )
 
     def test_create_category_successful(self):
-        with patch('requests.post') as patched_post:
+        with patch('requests.Session.post') as patched_post:
             patched_post.return_value = Response(201)
-            self.fd.create_category({'title':'cat'})
+            self.fd.create_category(Category('cat'))
             assert patched_post.called
 
     def test_create_category_failed(self):
-        with patch('requests.post') as patched_post:
+        with patch('requests.Session.post') as patched_post:
             patched_post.return_value = Response(500)
-            self.fd.create_category({'title':'cat'})
+            self.fd.create_category(Category('cat'))
             assert patched_post.called
 
+    def test_create_article_loads_html(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.fd.blobs = BlobStore(tmp)
+            article = Article('art', sha1=self.fd.blobs.put('<p>body</p>'))
+            with patch('requests.Session.post') as patched_post:
+                patched_post.return_value = Response(201)
+                self.fd.create_article(article, 1, 2)
+                payload = json.loads(patched_post.call_args[1]['data'])
+                self.assertEqual(
+                    payload['solution_article']['description'], '<p>body</p>'
+                )
+
+    def test_update_article_url(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.fd.blobs = BlobStore(tmp)
+            article = Article.from_dict({
+                'title': 'art',
+                'sha1': self.fd.blobs.put('<p>body</p>'),
+                'freshdesk': {'id': 3, 'folder_id': 2, 'category_id': 1},
+            })
+            with patch('requests.Session.put') as patched_put:
+                patched_put.return_value = Response(200)
+                self.fd.update_article(article)
+                self.assertEqual(
+                    patched_put.call_args[0][0],
+                    'api_url/solution/categories/1/folders/2/articles/3.json'
+                )
+
+    def test_update_fields(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.fd.blobs = BlobStore(tmp)
+            article = Article(
+                'art', sha1=self.fd.blobs.put('<p>{}</p>'.format('x' * 1000)),
+                fd_id=3, fd_folder_id=2, fd_category_id=1
+            )
+            with patch('requests.Session.put') as patched_put,\
+                 patch.object(self.fd, 'article_body') as article_body:
+                patched_put.return_value = Response(200)
+                self.fd.update_article(article, fields={'title'})
+                # The body isn't even read
+                self.assertFalse(article_body.called)
+            payload = json.loads(patched_put.call_args[1]['data'])
+            self.assertEqual(payload, {'solution_article': {'title': 'art'}})
+            self.assertEqual(
+                self.fd.saved_bytes, len(', "description": "<p></p>"') + 1000
+            )
+
+            with patch('requests.Session.put') as patched_put:
+                patched_put.return_value = Response(200)
+                self.fd.update_article(article, fields={'body'})
+            payload = json.loads(patched_put.call_args[1]['data'])
+            self.assertEqual(list(payload['solution_article']), ['description'])
+
+        folder = Folder('folder', fd_id=2, fd_category_id=1)
+        with patch('requests.Session.put') as patched_put:
+            patched_put.return_value = Response(200)
+            self.fd.update_folder(folder, 4, fields={'parent'})
+        payload = json.loads(patched_put.call_args[1]['data'])
+        self.assertEqual(payload, {'solution_folder': {'category_id': 4}})
+
+    def test_move_article(self):
+        article = Article(
+            'art', fd_id=3, fd_folder_id=2, fd_category_id=1, sha1='x'
+        )
+        with patch('requests.Session.put') as patched_put,\
+             patch.object(self.fd, 'article_body', return_value='body'):
+            patched_put.return_value = Response(200)
+            self.fd.update_article(article, 5)
+        # Found where it was, sent where it goes
+        self.assertEqual(
+            patched_put.call_args[0][0],
+            'api_url/solution/categories/1/folders/2/articles/3.json'
+        )
+        payload = json.loads(patched_put.call_args[1]['data'])
+        self.assertEqual(payload['solution_article']['folder_id'], 5)
+
+    def test_move_folder(self):
+        folder = Folder('folder', fd_id=2, fd_category_id=1)
+        with patch('requests.Session.put') as patched_put:
+            patched_put.return_value = Response(200)
+            self.fd.update_folder(folder, 4)
+        self.assertEqual(
+            patched_put.call_args[0][0],
+            'api_url/solution/categories/1/folders/2.json'
+        )
+        payload = json.loads(patched_put.call_args[1]['data'])
+        self.assertEqual(payload, {'solution_folder': {
+            'name': 'folder', 'description': 'folder', 'visibility': 1,
+            'category_id': 4,
+        }})
+
+class TestRateLimit(unittest.TestCase):
+    def test_headers(self):
+        limiter = RateLimiter(60, clock=lambda: 0.0, sleep=lambda s: None)
+        fd = FreshDesk('api_url', 'api_token', limiter=limiter, retries=0)
+        reply = Response(429)
+        reply.headers = {'Retry-After': '30', 'X-RateLimit-Remaining': '0'}
+        with patch('requests.Session.post') as patched_post:
+            patched_post.return_value = reply
+            fd.create_category(Category('cat'))
+            fd.create_category(Category('cat'))
+        self.assertEqual(limiter.throttled, 30)
+
+class TestRetry(unittest.TestCase):
+    def setUp(self):
+        self.fd = FreshDesk('api_url', 'api_token')
+        self.sleeps = []
+        self.fd.sleep = self.sleeps.append
+
+    def test_transient(self):
+        with patch('requests.Session.post') as patched_post:
+            patched_post.side_effect = [
+                requests.ConnectTimeout(), Response(503), Response(201)
+            ]
+            self.fd.create_category(Category('cat'))
+        self.assertEqual(patched_post.call_count, 3)
+        self.assertEqual(self.fd.retried, 2)
+        # Jittered, and the ceiling doubles each retry
+        self.assertTrue(0 <= self.sleeps[0] <= 1)
+        self.assertTrue(0 <= self.sleeps[1] <= 2)
+
+    def test_client_error(self):
+        with patch('requests.Session.put') as patched_put:
+            patched_put.return_value = Response(400)
+            article = Article('art', fd_id=1)
+            with patch.object(self.fd, 'article_body', return_value=''):
+                self.assertIsNone(self.fd.update_article(article))
+        self.assertEqual(patched_put.call_count, 1)
+        self.assertEqual(self.fd.retried, 0)
+
+    def test_retry_after(self):
+        reply = Response(429)
+        reply.headers = {'Retry-After': '0'}
+        with patch('requests.Session.delete') as patched_delete:
+            patched_delete.side_effect = [reply, Response(200)]
+            self.fd.delete_category(Category('cat', fd_id=1))
+        self.assertEqual(patched_delete.call_count, 2)
+        # Waiting is left to the rate limiter
+        self.assertEqual(self.sleeps, [0])
+
+    def test_gives_up(self):
+        with patch('requests.Session.put') as patched_put:
+            patched_put.side_effect = requests.ConnectionError()
+            with self.assertRaises(FreshDeskError):
+                self.fd.update_category(Category('cat', fd_id=1))
+        self.assertEqual(patched_put.call_count, 5)
+
+        # A create may have gone through before its reply timed out
+        with patch('requests.Session.post') as patched_post:
+            patched_post.side_effect = requests.ReadTimeout()
+            with self.assertRaises(FreshDeskError):
+                self.fd.create_category(Category('cat'))
+        self.assertEqual(patched_post.call_count, 1)
+
+class TestCompactRecords(unittest.TestCase):
+    def test_compact_category(self):
+        reply = {'category': {'id': 1, 'name': 'cat', 'position': 4}}
+        self.assertEqual(compact_category(reply), {'id': 1})
+
+    def test_compact_folder(self):
+        reply = {'folder': {'id': 2, 'category_id': 1, 'updated_at': 'now'}}
+        self.assertEqual(compact_folder(reply), {'id': 2, 'category_id': 1})
+
+    def test_compact_article(self):
+        reply = {'article': {
+            'id': 3, 'folder_id': 2, 'desc_un_html': 'body',
+            'folder': {'id': 2, 'category_id': 1, 'parent_id': 2},
+        }}
+        expected = {'id': 3, 'folder_id': 2, 'category_id': 1}
+        self.assertEqual(compact_article(reply), expected)
+
+        del reply['article']['folder']
+        self.assertEqual(compact_article(reply, 1), expected)
+
+class TestSession(unittest.TestCase):
+    def test_shared_session(self):
+        session = make_session(pool_size=4)
+        fd = FreshDesk('api_url', 'api_token', session=session, timeout=5)
+        self.assertIs(fd.session, session)
+        self.assertEqual(session.get_adapter('https://x')._pool_maxsize, 4)
+        with patch.object(session, 'delete') as patched_delete:
+            patched_delete.return_value = Response(200)
+            fd.delete_category(Category.from_dict({'title': 'cat', 'freshdesk': {'id': 1}}))
+            self.assertEqual(patched_delete.call_args[1]['timeout'], 5)
+
+    def test_no_keep_alive(self):
+        self.assertEqual(make_session(keep_alive=False).headers['Connection'], 'close')
+
+class MemoryFreshDeskDocumentMap(FreshDeskDocumentMap):
+    '''FreshDeskDocumentMap with its mappings given up front'''
+    def __init__(self, mappings, **kwargs):
+        self.mappings = mappings
+        super().__init__('mappings', 'articles', 'api_url', 'api_token', **kwargs)
+
+    def load_mappings(self):
+        for mapping, content in self.mappings.items():
+            self._save_origin(mapping, copy.deepcopy(content))
+        self.sync_state = {}
+
+class FakeFreshDesk:
+    '''Records calls, handing out IDs from 101 up'''
+    def __init__(self, fail=()):
+        self.calls = []
+        self.listed = []
+        self.threads = set()
+        self.fail = fail
+        self.lock = threading.Lock()
+        self.next_id = 100
+        self.limiter = RateLimiter()
+        self.retried = 0
+        self.saved_bytes = 0
+
+    def _call(self, name, record, reply_key=None, **reply):
+        time.sleep(0.01)
+        with self.lock:
+            self.calls.append((name, record.title))
+            self.threads.add(threading.get_ident())
+            if record.title in self.fail:
+                return None
+            if reply_key is None:
+                return {}
+            self.next_id += 1
+            return {reply_key: dict(reply, id=self.next_id)}
+
+    def create_category(self, category):
+        return self._call('create_category', category, 'category')
+
+    def create_folder(self, folder, cid):
+        return self._call('create_folder', folder, 'folder', category_id=cid)
+
+    def create_article(self, article, cid, fid):
+        return self._call('create_article', article, 'article', folder_id=fid)
+
+    def update_category(self, category):
+        return self._call('update_category', category)
+
+    def update_folder(self, folder, cid=None, fields=None):
+        if cid is not None:
+            return self._call('move_folder', folder)
+        return self._call('update_folder', folder)
+
+    def update_article(self, article, fid=None, fields=None):
+        if fid is not None:
+            return self._call('move_article', article)
+        return self._call('update_article', article)
+
+    def delete_category(self, category):
+        return self._call('delete_category', category)
+
+    def delete_article(self, article):
+        return self._call('delete_article', article)
+
+    def delete_folder(self, folder):
+        return self._call('delete_folder', folder)
+
+    def get_solution_categories(self):
+        self.listed.append('categories')
+        return []
+
+    def get_solution_category(self, category_id):
+        self.listed.append(category_id)
+        return {'category': {'id': category_id, 'folders': []}}
+
+    def get_solutions_in_folder(self, folder):
+        self.listed.append(folder['id'])
+        return {'folder': dict(folder, articles=[])}
+
+class TestSynchronize(unittest.TestCase):
+    def setUp(self):
+        self.mappings = {
+            'categories': {
+                1: {'title': 'New cat'},
+                2: {'title': 'Old cat', 'freshdesk': {'id': 20}},
+            },
+            'folders': {
+                1: {'title': 'New folder', 'parent': 1},
+                2: {'title': 'Old folder', 'parent': 2,
+                    'freshdesk': {'id': 30, 'category_id': 20}},
+            },
+            'articles': {},
+            'counters': {},
+        }
+        articles = self.mappings['articles']
+        for aid in range(1, 9):
+            articles[aid] = {'title': 'New {}'.format(aid), 'parent': 1}
+        articles[9] = {
+            'title': 'Edited', 'parent': 2,
+            'freshdesk': {'id': 40, 'folder_id': 30, 'category_id': 20},
+        }
+        articles[10] = {
+            'title': 'Broken', 'parent': 2,
+            'freshdesk': {'id': 41, 'folder_id': 30, 'category_id': 20},
+        }
+
+    def synchronize(self, push_workers, journal=None):
+        dm = MemoryFreshDeskDocumentMap(
+            self.mappings, push_workers=push_workers, journal=journal
+        )
+        dm.fdapi = FakeFreshDesk(fail=['Broken'])
+        dm.article_updates = {9: True, 10: True}
+        dm.article_deletions = {9: True}
+        dm.folder_deletions = {2: True}
+        dm.synchronize_freshdesk()
+        return dm
+
+    def test_concurrent(self):
+        dm = self.synchronize(4)
+        self.assertGreater(len(dm.fdapi.threads), 1)
+
+        # Parents are created before children, and the article goes
+        # along with its folder
+        names = [name for name, title in dm.fdapi.calls]
+        self.assertEqual(names[:2], ['create_category', 'create_folder'])
+        self.assertEqual(set(names[2:12]), {'create_article', 'update_article'})
+        self.assertEqual(names[12:], ['delete_folder'])
+
+        # Replies are merged into the right records
+        self.assertEqual(dm.categories[1].fd_id, 101)
+        self.assertEqual(dm.folders[1].fd_id, 102)
+        self.assertEqual(dm.folders[1].fd_category_id, 101)
+        self.assertEqual(
+            sorted(dm.articles[aid].fd_id for aid in range(1, 9)),
+            list(range(103, 111))
+        )
+        for aid in range(1, 9):
+            self.assertEqual(dm.articles[aid].fd_folder_id, 102)
+            self.assertEqual(dm.articles[aid].fd_category_id, 101)
+        # Broken is still in Freshdesk, and gets updated next time
+        self.assertEqual(dm.articles[10].fd_id, 41)
+        self.assertTrue(dm.articles[10].pending)
+        self.assertNotIn(9, dm.articles)
+        self.assertNotIn(2, dm.folders)
+
+        # What we created is known to be empty
+        self.assertEqual(dm.fdapi.listed, ['categories'])
+
+    def test_serial(self):
+        dm = self.synchronize(1)
+        self.assertEqual(len(dm.fdapi.threads), 1)
+        self.assertEqual(
+            [dm.articles[aid].fd_id for aid in range(1, 9)],
+            list(range(103, 111))
+        )
+
+    def cascade_mappings(self):
+        mappings = {
+            'categories': {
+                1: {'title': 'Gone', 'freshdesk': {'id': 20}},
+                2: {'title': 'Kept', 'freshdesk': {'id': 21}},
+            },
+            'folders': {
+                1: {'title': 'Gone 1', 'parent': 1,
+                    'freshdesk': {'id': 30, 'category_id': 20}},
+                2: {'title': 'Gone 2', 'parent': 1,
+                    'freshdesk': {'id': 31, 'category_id': 20}},
+                3: {'title': 'Kept', 'parent': 2,
+                    'freshdesk': {'id': 32, 'category_id': 21}},
+            },
+            'articles': {},
+            'counters': {},
+        }
+        for aid in range(1, 8):
+            fid = (aid - 1) // 3 + 1
+            mappings['articles'][aid] = {
+                'title': 'Article {}'.format(aid), 'parent': fid,
+                'freshdesk': {'id': 40 + aid, 'folder_id': 29 + fid,
+                              'category_id': 20 if fid < 3 else 21},
+            }
+        return mappings
+
+    def delete_gone(self, dm):
+        dm.category_deletions = {1: True}
+        dm.folder_deletions = {1: True, 2: True}
+        dm.article_deletions = {aid: True for aid in range(1, 8)}
+        dm.synchronize_freshdesk()
+
+    def test_cascade(self):
+        mappings = self.cascade_mappings()
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = Journal(os.path.join(tmp, 'journal.jsonl'))
+            dm = MemoryFreshDeskDocumentMap(mappings, journal=journal)
+            dm.fdapi = FakeFreshDesk()
+            self.delete_gone(dm)
+
+            # One call for the category, the rest goes with it
+            self.assertEqual(dm.fdapi.calls, [
+                ('delete_article', 'Article 7'), ('delete_category', 'Gone')
+            ])
+            self.assertEqual(list(dm.categories), [2])
+            self.assertEqual(list(dm.folders), [3])
+            self.assertEqual(dm.articles, {})
+            self.assertEqual(
+                sorted((e['mapping'], e['docid']) for e in journal.entries()),
+                [('articles', aid) for aid in range(1, 8)] +
+                [('categories', 1), ('folders', 1), ('folders', 2)]
+            )
+
+    def test_cascade_failed(self):
+        dm = MemoryFreshDeskDocumentMap(self.cascade_mappings())
+        dm.fdapi = FakeFreshDesk(fail=['Gone'])
+        self.delete_gone(dm)
+
+        # What was to go with the category is deleted on its own
+        self.assertEqual(dm.fdapi.calls[:2], [
+            ('delete_article', 'Article 7'), ('delete_category', 'Gone')
+        ])
+        self.assertEqual(
+            sorted(dm.fdapi.calls[2:8]),
+            [('delete_article', 'Article {}'.format(aid)) for aid in range(1, 7)]
+        )
+        self.assertEqual(
+            sorted(dm.fdapi.calls[8:]),
+            [('delete_folder', 'Gone 1'), ('delete_folder', 'Gone 2')]
+        )
+        self.assertEqual(list(dm.categories), [2])
+        self.assertEqual(dm.articles, {})
+
+    def test_move(self):
+        mappings = {
+            'categories': {
+                1: {'title': 'Cat 1', 'freshdesk': {'id': 20}},
+                2: {'title': 'Cat 2', 'freshdesk': {'id': 21}},
+            },
+            'folders': {
+                # Moved to Cat 2
+                1: {'title': 'Folder 1', 'parent': 2,
+                    'freshdesk': {'id': 30, 'category_id': 20}},
+                2: {'title': 'Folder 2', 'parent': 1,
+                    'freshdesk': {'id': 31, 'category_id': 20}},
+            },
+            'articles': {
+                # Moved to Folder 2
+                1: {'title': 'Moved', 'parent': 2,
+                    'freshdesk': {'id': 40, 'folder_id': 30, 'category_id': 20}},
+                # Went along with Folder 1
+                2: {'title': 'Stayed', 'parent': 1,
+                    'freshdesk': {'id': 41, 'folder_id': 30, 'category_id': 20}},
+            },
+            'counters': {},
+        }
+        dm = MemoryFreshDeskDocumentMap(mappings)
+        dm.fdapi = FakeFreshDesk()
+        dm.folder_updates = {1: True}
+        dm.article_updates = {1: True}
+        dm.synchronize_freshdesk()
+
+        self.assertEqual(dm.fdapi.calls, [
+            ('move_folder', 'Folder 1'), ('move_article', 'Moved')
+        ])
+        self.assertEqual(dm.folders[1].fd_id, 30)
+        self.assertEqual(dm.folders[1].fd_category_id, 21)
+        self.assertEqual(dm.articles[1].fd_id, 40)
+        self.assertEqual(dm.articles[1].fd_folder_id, 31)
+        self.assertEqual(dm.articles[1].fd_category_id, 20)
+        self.assertEqual(dm.articles[2].fd_folder_id, 30)
+        self.assertEqual(dm.articles[2].fd_category_id, 21)
+        self.assertEqual(dm.moves, {})
+
+        # A move that fails keeps the IDs, and is made again next time
+        mappings = {
+            mapping: to_dicts(getattr(dm, mapping))
+            for mapping in ['categories', 'folders', 'articles']
+        }
+        mappings['counters'] = {}
+        mappings['articles'][1]['parent'] = 1
+        dm = MemoryFreshDeskDocumentMap(mappings)
+        dm.fdapi = FakeFreshDesk(fail=['Moved'])
+        dm.article_updates = {1: True}
+        dm.synchronize_freshdesk()
+        self.assertEqual(dm.fdapi.calls, [('move_article', 'Moved')])
+        self.assertEqual(dm.articles[1].fd_id, 40)
+        self.assertEqual(dm.articles[1].fd_folder_id, 31)
+        self.assertTrue(dm.articles[1].pending)
+        self.assertTrue(dm.require_change)
+
+        mappings['articles'] = to_dicts(dm.articles)
+        dm = MemoryFreshDeskDocumentMap(mappings)
+        dm.fdapi = FakeFreshDesk()
+        dm.synchronize_freshdesk()
+        self.assertEqual(dm.fdapi.calls, [('move_article', 'Moved')])
+        self.assertEqual(dm.articles[1].fd_folder_id, 30)
+        self.assertFalse(dm.articles[1].pending)
+        self.assertNotIn('freshdesk', dm.articles[1].extra or {})
+
+    def test_move_to_new_folder(self):
+        # Old folder is in Freshdesk, New folder's create fails
+        self.mappings['articles'][9]['parent'] = 1
+        dm = MemoryFreshDeskDocumentMap(self.mappings)
+        dm.fdapi = FakeFreshDesk(fail=['New folder'])
+        dm.article_updates = {9: {'parent'}}
+        dm.synchronize_freshdesk()
+        self.assertNotIn(('move_article', 'Edited'), dm.fdapi.calls)
+        self.assertEqual(dm.articles[9].fd_folder_id, 30)
+
+        # Moved once the folder is there, with nothing in the updates
+        mappings = {
+            mapping: to_dicts(getattr(dm, mapping))
+            for mapping in ['categories', 'folders', 'articles']
+        }
+        mappings['counters'] = {}
+        dm = MemoryFreshDeskDocumentMap(mappings)
+        dm.fdapi = FakeFreshDesk()
+        dm.synchronize_freshdesk()
+        self.assertIn(('move_article', 'Edited'), dm.fdapi.calls)
+        self.assertEqual(dm.articles[9].fd_folder_id, dm.folders[1].fd_id)
+
+    def test_update_fields(self):
+        dm = MemoryFreshDeskDocumentMap(self.mappings)
+        dm.fdapi = FakeFreshDesk()
+        dm.article_updates = {9: {'title'}, 10: {'parent'}}
+        dm.folder_updates = {2: {'parent'}}
+        dm.synchronize_freshdesk()
+        # Nothing Freshdesk holds changed for Broken or Old folder
+        self.assertEqual(
+            [call for call in dm.fdapi.calls if call[0].startswith('update')],
+            [('update_article', 'Edited')]
+        )
+
+    def test_adopt(self):
+        dm = MemoryFreshDeskDocumentMap(self.mappings)
+        dm.fdapi = FakeFreshDesk()
+        dm.fdapi.get_solution_categories = lambda: [
+            {'category': {'id': 50, 'name': 'New cat'}}
+        ]
+        dm.fdapi.get_solution_category = lambda cid: {'category': {
+            'folders': [{'id': 60, 'name': 'New folder'}]
+        }}
+        # 40 is already Edited
+        dm.fdapi.get_solutions_in_folder = lambda folder: {'folder': {
+            'articles': [{'id': 70, 'title': 'New 1'}, {'id': 40, 'title': 'New 2'}]
+        }}
+        dm.synchronize_freshdesk()
+
+        # The adopted article gets our body
+        self.assertEqual(
+            sorted(dm.fdapi.calls),
+            [('create_article', 'New {}'.format(aid)) for aid in range(2, 9)]
+            + [('update_article', 'New 1')]
+        )
+        self.assertEqual(dm.adopted, 3)
+        self.assertEqual(dm.categories[1].fd_id, 50)
+        self.assertEqual(dm.folders[1].fd_id, 60)
+        self.assertEqual(dm.folders[1].fd_category_id, 50)
+        self.assertEqual(dm.articles[1].fd_id, 70)
+        self.assertEqual(dm.articles[1].fd_folder_id, 60)
+        self.assertEqual(dm.articles[1].fd_category_id, 50)
+        self.assertNotEqual(dm.articles[2].fd_id, 40)
+        self.assertTrue(dm.require_change)
+
+    def test_nothing_to_do(self):
+        for mapping in ['categories', 'folders', 'articles']:
+            for docid, record in list(self.mappings[mapping].items()):
+                if 'freshdesk' not in record:
+                    del self.mappings[mapping][docid]
+        dm = MemoryFreshDeskDocumentMap(self.mappings)
+        dm.fdapi = FakeFreshDesk()
+        dm.synchronize_freshdesk()
+        self.assertEqual(dm.fdapi.calls, [])
+        self.assertEqual(dm.fdapi.listed, [])
+
+    def test_journal_replay(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = Journal(os.path.join(tmp, 'journal.jsonl'))
+            pushed = self.synchronize(4, journal)
+
+            # The mappings never got saved, a new run starts from the old
+            self.mappings['counters'] = {'article': 6}
+            dm = MemoryFreshDeskDocumentMap(self.mappings, journal=journal)
+            self.assertEqual(dm.categories, pushed.categories)
+            self.assertEqual(dm.folders, pushed.folders)
+            # Bar the update that failed, which isn't journalled
+            del pushed.articles[10]
+            self.assertEqual(dm.articles.pop(10).fd_id, 41)
+            self.assertEqual(dm.articles, pushed.articles)
+            self.assertEqual(dm.counters['article'], 9)
+            self.assertTrue(dm.require_change)
+
+            # Nothing is pushed again
+            self.assertEqual(dm.orig_articles.changed(dm.articles), set())
+            dm.fdapi = FakeFreshDesk()
+            dm.synchronize_freshdesk()
+            self.assertEqual(dm.fdapi.calls, [])
+
+            dm.clear_journal()
+            self.assertEqual(journal.entries(), [])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
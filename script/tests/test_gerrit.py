@@ -3,6 +3,7 @@ path.append('..')
 
 import logging
 
+import requests
 import unittest
 from unittest.mock import patch
 
@@ -16,18 +17,37 @@ class TestGerritAPI(unittest.TestCase):
         self.gerrit = GerritAPI('gerrit_url', 'project_name', 'username', 'password')
 
     def test_create_change_successful(self):
-        with patch('requests.post') as patched_post:
+        with patch('requests.Session.post') as patched_post:
             patched_post.return_value = Response(201)
             rv = self.gerrit.create_change('change_subject')
             assert patched_post.called
             self.assertIsInstance(rv, tuple)
 
     def test_create_change_failed(self):
-        with patch('requests.post') as patched_post:
+        with patch('requests.Session.post') as patched_post:
             patched_post.return_value = Response(500)
             rv = self.gerrit.create_change('change_subject')
             assert patched_post.called
             self.assertIsInstance(rv, tuple)
 
+    def test_verified_timeout(self):
+        with patch('requests.Session.get') as patched_get:
+            patched_get.side_effect = requests.Timeout('read timed out')
+            self.assertFalse(self.gerrit.verified('long_change_id'))
+
+    def test_submit_timeout(self):
+        with patch('requests.Session.get') as patched_get, \
+             patch('requests.Session.post') as patched_post:
+            patched_get.return_value = Response(200)
+            patched_get.return_value.text = '{"current_revision": "abc"}'
+            patched_post.return_value = Response(200)
+            patched_post.return_value.text = '{}'
+            self.gerrit.self_approve_change('long_change_id')
+            timeouts = [
+                call[1]['timeout'] for call in patched_post.call_args_list
+            ]
+            # No read timeout waiting for the merge
+            self.assertEqual(timeouts, [(10, 60), (10, None)])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,79 @@
+from sys import path
+path.append('..')
+
+import os
+import subprocess
+import tempfile
+import unittest
+
+from docmap.gitdiff import parse_name_status, changed_paths, head_commit
+
+class TestParseNameStatus(unittest.TestCase):
+    def test_parse(self):
+        output = 'M\0a/b/c.md\0R087\0a/b/old.md\0a/c/new.md\0D\0x/y/z.md\0'
+        self.assertEqual(
+            parse_name_status(output),
+            [
+                ('M', 'a/b/c.md', 'a/b/c.md'),
+                ('R', 'a/b/old.md', 'a/c/new.md'),
+                ('D', 'x/y/z.md', 'x/y/z.md'),
+            ]
+        )
+
+    def test_parse_empty(self):
+        self.assertEqual(parse_name_status(''), [])
+
+class TestChangedPaths(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.repo = self.tmp.name
+        self.article_dir = os.path.join(self.repo, 'articles')
+        os.makedirs(os.path.join(self.article_dir, 'Cat--DOCID1', 'Folder--DOCID2'))
+        self.git('init', '-q')
+        self.write('Cat--DOCID1/Folder--DOCID2/Article--DOCID3.md', 'Some text\n' * 10)
+        self.write('Cat--DOCID1/Folder--DOCID2/Other--DOCID4.md', 'Other text\n')
+        self.commit()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def git(self, *args):
+        subprocess.check_call(
+            ['git', '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+            + list(args),
+            cwd=self.repo
+        )
+
+    def write(self, name, text):
+        with open(os.path.join(self.article_dir, name), 'w') as f:
+            f.write(text)
+
+    def commit(self):
+        self.git('add', '--all')
+        self.git('commit', '-q', '-m', 'commit')
+
+    def test_changed_paths(self):
+        since = head_commit(self.article_dir)
+        os.rename(
+            os.path.join(self.article_dir, 'Cat--DOCID1/Folder--DOCID2/Article--DOCID3.md'),
+            os.path.join(self.article_dir, 'Cat--DOCID1/Folder--DOCID2/Renamed--DOCID3.md')
+        )
+        self.write('Cat--DOCID1/Folder--DOCID2/Other--DOCID4.md', 'Changed text\n')
+        self.commit()
+
+        self.assertEqual(
+            sorted(changed_paths(self.article_dir, since)),
+            [
+                ('M', 'Cat--DOCID1/Folder--DOCID2/Other--DOCID4.md',
+                    'Cat--DOCID1/Folder--DOCID2/Other--DOCID4.md'),
+                ('R', 'Cat--DOCID1/Folder--DOCID2/Article--DOCID3.md',
+                    'Cat--DOCID1/Folder--DOCID2/Renamed--DOCID3.md'),
+            ]
+        )
+
+    def test_unknown_commit(self):
+        with self.assertRaises(subprocess.CalledProcessError):
+            changed_paths(self.article_dir, '0' * 40)
+
+if __name__ == '__main__':
+    unittest.main()
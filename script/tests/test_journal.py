@@ -0,0 +1,47 @@
+from sys import path
+path.append('..')
+
+import os
+import tempfile
+import unittest
+
+from docmap.journal import Journal
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'cache', 'journal.jsonl')
+        self.journal = Journal(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_empty(self):
+        self.assertEqual(self.journal.entries(), [])
+
+    def test_record(self):
+        self.journal.record('categories', 'create', 1,
+                            {'title': 'Cat', 'freshdesk': {'id': 10}})
+        self.journal.record('articles', 'delete', 2)
+        self.assertEqual(self.journal.entries(), [
+            {'mapping': 'categories', 'action': 'create', 'docid': 1,
+             'record': {'title': 'Cat', 'freshdesk': {'id': 10}}},
+            {'mapping': 'articles', 'action': 'delete', 'docid': 2,
+             'record': None},
+        ])
+
+    def test_torn_entry(self):
+        self.journal.record('articles', 'delete', 2)
+        with open(self.path, 'a') as f:
+            f.write('{"mapping": "artic')
+        self.assertEqual(len(self.journal.entries()), 1)
+
+    def test_clear(self):
+        self.journal.record('articles', 'delete', 2)
+        self.journal.clear()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.journal.entries(), [])
+        self.journal.clear()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+from sys import path
+path.append('..')
+
+import unittest
+
+from docmap.ratelimit import RateLimiter, retry_seconds
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter(60, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_budget(self):
+        for i in range(60):
+            self.assertEqual(self.limiter.acquire(), 0)
+        # Out of tokens, one call a second from here
+        self.assertAlmostEqual(self.limiter.acquire(), 1.0)
+        self.assertAlmostEqual(self.limiter.acquire(), 1.0)
+        self.assertAlmostEqual(self.limiter.throttled, 2.0)
+
+        # Idle time refills the bucket, up to the budget
+        self.clock.now += 600
+        for i in range(60):
+            self.assertEqual(self.limiter.acquire(), 0)
+        self.assertGreater(self.limiter.acquire(), 0)
+
+    def test_remaining(self):
+        self.limiter.update({'X-RateLimit-Remaining': '2'})
+        self.assertEqual(self.limiter.acquire(), 0)
+        self.assertEqual(self.limiter.acquire(), 0)
+        self.assertAlmostEqual(self.limiter.acquire(), 1.0)
+
+    def test_retry_after(self):
+        self.limiter.update({'Retry-After': '10'})
+        self.assertAlmostEqual(self.limiter.acquire(), 10.0)
+        self.assertEqual(self.clock.sleeps, [10.0])
+
+    def test_retry_seconds(self):
+        self.assertEqual(retry_seconds('5'), 5.0)
+        self.assertEqual(retry_seconds('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        self.assertIsNone(retry_seconds('soon'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+from sys import path
+path.append('..')
+
+import unittest
+
+from docmap.records import Category, Folder, Article, from_dicts, to_dicts
+from docmap.store import YAMLMappingStore
+
+class TestRecords(unittest.TestCase):
+    def test_round_trip(self):
+        store = YAMLMappingStore('../../mappings')
+        for mapping in ['articles', 'folders', 'categories']:
+            content = store.load(mapping)
+            records = from_dicts(mapping, content)
+            self.assertEqual(to_dicts(records), content)
+
+    def test_fields(self):
+        article = Article.from_dict({
+            'title': 'Launch',
+            'parent': 2,
+            'sha1': 'abc',
+            'freshdesk': {'id': 30, 'folder_id': 20, 'category_id': 10},
+        })
+        self.assertEqual(article.parent, 2)
+        self.assertEqual(article.sha1, 'abc')
+        self.assertIsNone(article.renderer)
+        self.assertEqual(
+            (article.fd_id, article.fd_folder_id, article.fd_category_id),
+            (30, 20, 10)
+        )
+        self.assertFalse(hasattr(article, '__dict__'))
+
+    def test_unknown_keys(self):
+        content = {
+            'title': 'Cat',
+            'colour': 'blue',
+            'freshdesk': {'id': 1, 'position': 4},
+        }
+        category = Category.from_dict(content)
+        self.assertEqual(category.fd_id, 1)
+        self.assertEqual(category.to_dict(), content)
+
+        category.clear_freshdesk()
+        self.assertEqual(category.to_dict(), {'title': 'Cat', 'colour': 'blue'})
+
+    def test_freshdesk(self):
+        folder = Folder('Folder', parent=1)
+        self.assertFalse(folder.freshdesk)
+        self.assertEqual(folder.to_dict(), {'title': 'Folder', 'parent': 1})
+
+        folder.set_freshdesk({'id': 2, 'category_id': 1})
+        self.assertTrue(folder.freshdesk)
+        self.assertEqual(folder, Folder.from_dict(folder.to_dict()))
+        self.assertEqual(
+            folder.to_dict()['freshdesk'], {'id': 2, 'category_id': 1}
+        )
+
+        with self.assertRaises(TypeError):
+            Folder('Folder', sha1='abc')
+
+    def test_pending(self):
+        folder = Folder('Folder', parent=1, fd_id=2, fd_category_id=1)
+        folder.set_pending(True)
+        self.assertTrue(Folder.from_dict(folder.to_dict()).pending)
+        self.assertEqual(
+            folder.to_dict()['freshdesk'],
+            {'id': 2, 'category_id': 1, 'pending': True}
+        )
+
+        folder.set_pending(False)
+        self.assertFalse(folder.pending)
+        self.assertEqual(folder, Folder('Folder', parent=1, fd_id=2, fd_category_id=1))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+from sys import path
+path.append('..')
+
+import os
+import tempfile
+import unittest
+
+from docmap.freshdesk import FreshDeskError
+from docmap.remote import RemoteState, fetch_snapshot
+from test_freshdesk_calls import MemoryFreshDeskDocumentMap, FakeFreshDesk
+
+class RemoteFreshDesk(FakeFreshDesk):
+    '''FakeFreshDesk holding a category, two folders and two articles'''
+    def __init__(self):
+        super().__init__()
+        self.fetched = []
+        self.categories = [{'category': {
+            'id': 20, 'name': 'Cat', 'updated_at': 'c1',
+            'folders': [
+                {'id': 30, 'name': 'Folder', 'updated_at': 'f1'},
+                {'id': 31, 'name': 'Renamed', 'updated_at': 'f2'},
+            ],
+        }}]
+        self.articles = {
+            30: [{'id': 40, 'title': 'Article', 'updated_at': 'a2'}],
+            31: [{'id': 41, 'title': 'Stray', 'updated_at': 'a1'}],
+        }
+
+    def get_solution_categories(self):
+        return self.categories
+
+    def get_solution_category(self, category_id):
+        return self.categories[0]
+
+    def get_solutions_in_folder(self, folder):
+        self.fetched.append(folder['id'])
+        return {'folder': {'articles': self.articles[folder['id']]}}
+
+class TestRemoteState(unittest.TestCase):
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            state = RemoteState(os.path.join(tmp, 'cache', 'remote.json'))
+            self.assertIsNone(state.get('articles', 1))
+            state.seen('articles', 1, 'then')
+            state.seen('folders', 2, 'now')
+            state.forget('folders', 2)
+            state.save()
+
+            state = RemoteState(os.path.join(tmp, 'cache', 'remote.json'))
+            self.assertEqual(state.get('articles', 1), 'then')
+            self.assertIsNone(state.get('folders', 2))
+            self.assertFalse(state.changed)
+
+class TestSnapshot(unittest.TestCase):
+    def test_fetch(self):
+        fdapi = RemoteFreshDesk()
+        snapshot = fetch_snapshot(fdapi, workers=2)
+        self.assertEqual(
+            snapshot['categories'],
+            {20: {'title': 'Cat', 'parent': None, 'updated_at': 'c1'}}
+        )
+        self.assertEqual(
+            snapshot['folders'][31],
+            {'title': 'Renamed', 'parent': 20, 'updated_at': 'f2'}
+        )
+        self.assertEqual(
+            snapshot['articles'][40],
+            {'title': 'Article', 'parent': 30, 'updated_at': 'a2'}
+        )
+        self.assertEqual(sorted(fdapi.fetched), [30, 31])
+        self.assertEqual(
+            snapshot['unlisted'], {'categories': set(), 'folders': set()}
+        )
+
+    def test_fetch_folders(self):
+        fdapi = RemoteFreshDesk()
+        folders = fdapi.categories[0]['category'].pop('folders')
+        fdapi.get_solution_category = \
+            lambda cid: {'category': {'id': cid, 'folders': folders}}
+        self.assertEqual(len(fetch_snapshot(fdapi)['folders']), 2)
+
+    def test_unlisted(self):
+        fdapi = RemoteFreshDesk()
+        fdapi.categories[0]['category'].pop('folders')
+        fdapi.get_solution_category = lambda cid: None
+        snapshot = fetch_snapshot(fdapi)
+        self.assertEqual(snapshot['folders'], {})
+        self.assertEqual(snapshot['unlisted']['categories'], {20})
+
+        fdapi.get_solution_categories = lambda: None
+        with self.assertRaises(FreshDeskError):
+            fetch_snapshot(fdapi)
+
+class TestReconcile(unittest.TestCase):
+    def setUp(self):
+        self.mappings = {
+            'categories': {1: {'title': 'Cat', 'freshdesk': {'id': 20}}},
+            'folders': {
+                1: {'title': 'Folder', 'parent': 1,
+                    'freshdesk': {'id': 30, 'category_id': 20}},
+                2: {'title': 'Folder 2', 'parent': 1,
+                    'freshdesk': {'id': 31, 'category_id': 20}},
+            },
+            'articles': {
+                1: {'title': 'Article', 'parent': 1,
+                    'freshdesk': {'id': 40, 'folder_id': 30, 'category_id': 20}},
+                2: {'title': 'Lost', 'parent': 1,
+                    'freshdesk': {'id': 42, 'folder_id': 30, 'category_id': 20}},
+            },
+            'counters': {},
+        }
+
+    def test_drift(self):
+        mappings = self.mappings
+        with tempfile.TemporaryDirectory() as tmp:
+            remote = RemoteState(os.path.join(tmp, 'remote.json'))
+            remote.seen('articles', 40, 'a1')
+            remote.seen('categories', 20, 'c1')
+            dm = MemoryFreshDeskDocumentMap(mappings, remote=remote)
+            dm.fdapi = RemoteFreshDesk()
+
+            self.assertEqual(dm.reconcile_freshdesk(), 3)
+            # Renamed in Freshdesk
+            self.assertEqual(dm.folder_updates, {2: True})
+            # Edited in Freshdesk since we pushed it
+            self.assertEqual(dm.article_updates, {1: True})
+            # Gone, so created again
+            self.assertFalse(dm.articles[2].freshdesk)
+            self.assertEqual(remote.get('articles', 40), 'a2')
+            self.assertEqual(remote.get('articles', 41), 'a1')
+
+            dm.synchronize_freshdesk()
+            self.assertEqual(sorted(dm.fdapi.calls), [
+                ('create_article', 'Lost'),
+                ('update_article', 'Article'),
+                ('update_folder', 'Folder 2'),
+            ])
+            self.assertEqual(dm.articles[2].fd_id, 101)
+
+            # Saved with the push, our own updates gave no updated_at
+            saved = RemoteState(remote.path)
+            self.assertEqual(saved.get('articles', 41), 'a1')
+            self.assertIsNone(saved.get('folders', 31))
+
+    def test_categories_unlisted(self):
+        dm = MemoryFreshDeskDocumentMap(self.mappings)
+        dm.fdapi = RemoteFreshDesk()
+        dm.fdapi.get_solution_categories = lambda: None
+        self.assertEqual(dm.reconcile_freshdesk(), 0)
+        self.assertTrue(all(
+            record.freshdesk for mapping in ['categories', 'folders', 'articles']
+            for record in getattr(dm, mapping).values()
+        ))
+
+        dm.synchronize_freshdesk()
+        self.assertEqual(dm.fdapi.calls, [])
+
+    def test_folder_unlisted(self):
+        dm = MemoryFreshDeskDocumentMap(self.mappings)
+        dm.fdapi = RemoteFreshDesk()
+        listed = dm.fdapi.get_solutions_in_folder
+        def get_solutions_in_folder(folder):
+            if folder['id'] == 30:
+                raise FreshDeskError('GET failed after 5 retries')
+            return listed(folder)
+        dm.fdapi.get_solutions_in_folder = get_solutions_in_folder
+
+        # Only the renamed folder, Lost may well still be there
+        self.assertEqual(dm.reconcile_freshdesk(), 1)
+        self.assertEqual(dm.articles[2].fd_id, 42)
+        self.assertNotIn(('articles', (30,)), dm.listings)
+
+        dm.synchronize_freshdesk()
+        self.assertEqual(dm.fdapi.calls, [('update_folder', 'Folder 2')])
+
+    def test_moved(self):
+        dm = MemoryFreshDeskDocumentMap(self.mappings)
+        dm.fdapi = RemoteFreshDesk()
+        dm.fdapi.articles = {30: [], 31: [
+            {'id': 40, 'title': 'Article', 'updated_at': 'a1'},
+            {'id': 42, 'title': 'Lost', 'updated_at': 'a1'},
+        ]}
+        moved = []
+        dm.fdapi.update_article = lambda article, fid=None, fields=None: \
+            moved.append((article.fd_folder_id, fid)) or {}
+
+        self.assertEqual(dm.reconcile_freshdesk(), 3)
+        self.assertEqual(dm.articles[1].fd_folder_id, 31)
+
+        # Moved back from where Freshdesk has them
+        dm.synchronize_freshdesk()
+        self.assertEqual(moved, [(31, 30), (31, 30)])
+        self.assertEqual(dm.articles[1].fd_folder_id, 30)
+        self.assertEqual(dm.articles[2].fd_folder_id, 30)
+
+if __name__ == '__main__':
+    unittest.main()
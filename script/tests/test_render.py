@@ -0,0 +1,138 @@
+from sys import path
+path.append('..')
+
+import os
+import subprocess
+import sys
+import unittest
+from html.parser import HTMLParser
+from unittest.mock import patch
+
+from docmap.render import render_markdown, render_all, Renderer, RenderTimings
+from docmap.render import markdown_it
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+class HTMLNormaliser(HTMLParser):
+    '''
+    Reduce HTML to a list of tags (with sorted attributes) and text with
+    collapsed whitespace, so that equivalent markup from different
+    renderers compares equal
+    '''
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.events = []
+
+    def handle_starttag(self, tag, attrs):
+        self.events.append(('start', tag, tuple(sorted(attrs))))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        self.events.append(('end', tag))
+
+    def handle_data(self, data):
+        text = ' '.join(data.split())
+        if text:
+            self.events.append(('text', text))
+
+def normalise_html(html):
+    parser = HTMLNormaliser()
+    parser.feed(html)
+    parser.close()
+    return parser.events
+
+SOURCE = '''# Launching {n}
+
+![Launch](images/launch.png)
+
+| Flavour | Cores |
+|---------|-------|
+| m1.small | {n} |
+'''
+
+class TestRender(unittest.TestCase):
+    def test_render_markdown(self):
+        html = render_markdown(SOURCE.format(n=1), 'articles/Cat/Folder')
+        self.assertIn('<h1>Launching 1</h1>', html)
+        self.assertIn(
+            'src="https://github.com/NeCTAR-RC/nectarcloud-tier0doco/blob/'
+            'master/articles/Cat/Folder/images/launch.png?raw=true"',
+            html
+        )
+        self.assertIn('<table>', html)
+
+    def test_renderer_reuse(self):
+        renderer = Renderer()
+        first = renderer.render('![a](images/a.png)\n\n[r]: images/r.png', 'articles/A')
+        second = renderer.render('![b](images/b.png)', 'articles/B')
+        self.assertIn('articles/A/images/a.png', first)
+        self.assertIn('articles/B/images/b.png', second)
+        self.assertNotIn('articles/A', second)
+
+        # Same output as a fresh pipeline
+        self.assertEqual(second, Renderer().render('![b](images/b.png)', 'articles/B'))
+        self.assertEqual(renderer.timings.count, 2)
+
+    def test_parallel_matches_serial(self):
+        jobs = [
+            (SOURCE.format(n=n), 'articles/Cat/Folder{}'.format(n))
+            for n in range(20)
+        ]
+        serial = render_all(jobs)
+        self.assertEqual(len(serial), 20)
+        timings = RenderTimings()
+        self.assertEqual(render_all(jobs, workers=3, timings=timings), serial)
+        self.assertEqual(timings.count, 20)
+
+    def test_small_batch_serial(self):
+        jobs = [(SOURCE.format(n=n), 'articles/Cat') for n in range(3)]
+        with patch('docmap.render.ProcessPoolExecutor') as pool:
+            self.assertEqual(render_all(jobs, workers=8), render_all(jobs))
+        self.assertFalse(pool.called)
+
+@unittest.skipIf(markdown_it is None, 'markdown-it-py is not installed')
+class TestBackendEquivalence(unittest.TestCase):
+    '''Every backend must produce equivalent HTML for our articles'''
+
+    def test_corpus(self):
+        names = sorted(os.listdir(CORPUS_DIR))
+        self.assertTrue(names)
+        for name in names:
+            with open(os.path.join(CORPUS_DIR, name), 'r') as f:
+                source = f.read()
+            with self.subTest(article=name):
+                expected = render_markdown(source, 'articles/Cat--DOCID1/Folder--DOCID2')
+                actual = render_markdown(
+                    source, 'articles/Cat--DOCID1/Folder--DOCID2', 'commonmark'
+                )
+                self.assertEqual(normalise_html(actual), normalise_html(expected))
+
+    def test_image_rewrite(self):
+        html = render_markdown(
+            '![a](images/a.png)\n\n![b][b]\n\n[b]: image/b.png',
+            'articles/Cat',
+            'commonmark'
+        )
+        self.assertIn(
+            'src="https://github.com/NeCTAR-RC/nectarcloud-tier0doco/blob/'
+            'master/articles/Cat/images/a.png?raw=true"',
+            html
+        )
+        self.assertIn('articles/Cat/image/b.png?raw=true', html)
+
+    def test_without_python_markdown(self):
+        # None in sys.modules makes importing markdown fail
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys; sys.modules["markdown"] = None\n'
+            'from docmap.render import render_markdown, backend_config\n'
+            'backend_config("commonmark")\n'
+            'print(render_markdown("![a](images/a.png)", "articles/Cat", '
+            '"commonmark"))'
+        ], cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertIn(b'articles/Cat/images/a.png?raw=true', output)
+
+if __name__ == '__main__':
+    unittest.main()
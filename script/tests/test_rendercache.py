@@ -0,0 +1,53 @@
+from sys import path
+path.append('..')
+
+import os
+import tempfile
+import time
+import unittest
+
+from docmap.rendercache import RenderCache
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = RenderCache(self.tmp.name, max_bytes=100)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key(self):
+        key = RenderCache.key('# Title', 'articles/a', 'config')
+        self.assertEqual(key, RenderCache.key('# Title', 'articles/a', 'config'))
+        self.assertNotEqual(key, RenderCache.key('# Title', 'articles/b', 'config'))
+        self.assertNotEqual(key, RenderCache.key('# Title', 'articles/a', 'other'))
+        self.assertNotEqual(key, RenderCache.key('# Other', 'articles/a', 'config'))
+
+    def test_get_put(self):
+        key = RenderCache.key('# Title', 'articles/a', 'config')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, '<h1>Title</h1>')
+        self.assertEqual(self.cache.get(key), '<h1>Title</h1>')
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        # Shared with another instance on the same directory
+        self.assertEqual(RenderCache(self.tmp.name).get(key), '<h1>Title</h1>')
+
+    def test_prune(self):
+        keys = [RenderCache.key(str(i), '', '') for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, 'x' * 40)
+            os.utime(self.cache._path(key), (time.time() + i, time.time() + i))
+
+        # Using the oldest entry makes it the most recent
+        self.cache.get(keys[0])
+        os.utime(self.cache._path(keys[0]), (time.time() + 10, time.time() + 10))
+
+        self.assertEqual(self.cache.prune(), 1)
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+        self.assertEqual(self.cache.prune(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
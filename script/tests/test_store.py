@@ -0,0 +1,191 @@
+from sys import path
+path.append('..')
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from docmap.store import YAMLMappingStore, SQLiteMappingStore
+from docmap.store import repository_cache_dir
+
+MAPPINGS = {
+    'articles': {
+        3: {
+            'title': 'Launch', 'parent': 2, 'sha1': 'abc',
+            'freshdesk': {'id': 30, 'folder_id': 20, 'category_id': 10},
+        },
+    },
+    'folders': {
+        2: {'title': 'Launching', 'parent': 1, 'freshdesk': {'id': 20, 'category_id': 10}},
+    },
+    'categories': {
+        1: {'title': 'Basics', 'freshdesk': {'id': 10}},
+    },
+    'counters': {'category': 1, 'folder': 2, 'article': 3},
+}
+
+class TestYAMLMappingStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = YAMLMappingStore(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        for mapping, content in MAPPINGS.items():
+            self.store.save(mapping, content)
+            self.assertEqual(self.store.load(mapping), content)
+        self.assertEqual(self.store.find_freshdesk('folders', 20)[0], 2)
+
+    def test_save_unchanged(self):
+        self.assertTrue(self.store.save('articles', MAPPINGS['articles']))
+        path = os.path.join(self.tmp.name, 'articles.yaml')
+        os.utime(path, ns=(0, 0))
+        self.assertFalse(self.store.save('articles', MAPPINGS['articles']))
+        self.assertEqual(os.stat(path).st_mtime_ns, 0)
+
+    def test_save_deterministic(self):
+        self.store.save('counters', {'folder': 2, 'article': 3, 'category': 1})
+        with open(os.path.join(self.tmp.name, 'counters.yaml'), 'rb') as f:
+            data = f.read()
+        self.assertEqual(data, b'{article: 3, category: 1, folder: 2}\n')
+        self.assertEqual(data, self.store.dump(MAPPINGS['counters']))
+
+    def test_save_atomic(self):
+        self.store.save('articles', MAPPINGS['articles'])
+        with patch('docmap.store.os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.store.save('articles', {})
+        self.assertEqual(self.store.load('articles'), MAPPINGS['articles'])
+        self.assertEqual(os.listdir(self.tmp.name), ['articles.yaml'])
+
+    def test_missing(self):
+        self.assertEqual(self.store.load('sync'), {})
+        with self.assertRaises(FileNotFoundError):
+            self.store.load('articles')
+
+class TestRepositoryCacheDir(unittest.TestCase):
+    def test_per_repository(self):
+        first = repository_cache_dir('cache', 'one/mappings')
+        self.assertEqual(first, repository_cache_dir('cache', 'one/./mappings'))
+        self.assertNotEqual(first, repository_cache_dir('cache', 'two/mappings'))
+        self.assertTrue(first.startswith('cache'))
+
+class TestSnapshotCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.mapping_dir = os.path.join(self.tmp.name, 'mappings')
+        os.makedirs(self.mapping_dir)
+        YAMLMappingStore(self.mapping_dir).save('articles', MAPPINGS['articles'])
+        self.store = YAMLMappingStore(
+            self.mapping_dir, os.path.join(self.tmp.name, 'snapshots')
+        )
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_unchanged(self):
+        self.assertEqual(self.store.load('articles'), MAPPINGS['articles'])
+        self.assertEqual(self.store.snapshots.misses, 1)
+        self.assertEqual(self.store.load('articles'), MAPPINGS['articles'])
+        self.assertEqual(self.store.snapshots.hits, 1)
+
+        # Same content with a new mtime still comes from the snapshot
+        path = os.path.join(self.mapping_dir, 'articles.yaml')
+        os.utime(path, ns=(0, 0))
+        self.assertEqual(self.store.load('articles'), MAPPINGS['articles'])
+        self.assertEqual(self.store.snapshots.hits, 2)
+
+    def test_changed(self):
+        self.store.load('articles')
+        YAMLMappingStore(self.mapping_dir).save('articles', {})
+        os.utime(os.path.join(self.mapping_dir, 'articles.yaml'), ns=(0, 0))
+        self.assertEqual(self.store.load('articles'), {})
+        self.assertEqual(self.store.snapshots.misses, 2)
+
+    def test_save(self):
+        self.store.save('folders', MAPPINGS['folders'])
+        self.assertEqual(self.store.load('folders'), MAPPINGS['folders'])
+        self.assertEqual(self.store.snapshots.misses, 0)
+
+class TestSQLiteMappingStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.export_dir = os.path.join(self.tmp.name, 'mappings')
+        os.makedirs(self.export_dir)
+        seed = YAMLMappingStore(self.export_dir)
+        for mapping, content in MAPPINGS.items():
+            seed.save(mapping, content)
+        self.db_path = os.path.join(self.tmp.name, 'mappings.sqlite')
+        self.store = SQLiteMappingStore(self.db_path, self.export_dir)
+
+    def tearDown(self):
+        self.store.db.close()
+        self.tmp.cleanup()
+
+    def test_import(self):
+        for mapping, content in MAPPINGS.items():
+            self.assertEqual(self.store.load(mapping), content)
+        self.assertEqual(self.store.load('sync'), {})
+
+    def test_records(self):
+        self.assertEqual(self.store.get_record('categories', 1)['title'], 'Basics')
+        self.assertIsNone(self.store.get_record('categories', 5))
+        docid, record = self.store.find_freshdesk('articles', 30)
+        self.assertEqual(docid, 3)
+        self.assertIsNone(self.store.find_freshdesk('articles', 20))
+
+        self.store.put_record('categories', 5, {'title': 'New'})
+        self.store.delete_record('articles', 3)
+        self.assertEqual(sorted(self.store.load('categories')), [1, 5])
+        self.assertEqual(self.store.load('articles'), {})
+
+    def test_transaction(self):
+        with self.assertRaises(RuntimeError):
+            with self.store.transaction():
+                self.store.put_record('categories', 5, {'title': 'New'})
+                self.store.delete_record('categories', 1)
+                raise RuntimeError()
+        self.assertEqual(self.store.load('categories'), MAPPINGS['categories'])
+
+    def test_save_changes_only(self):
+        self.assertEqual(self.store.save('articles', MAPPINGS['articles']), 0)
+
+        articles = {3: dict(MAPPINGS['articles'][3], title='Renamed')}
+        self.assertEqual(self.store.save('articles', articles), 1)
+        self.assertEqual(self.store.save('folders', {}), 1)
+
+        # Changes are exported for review
+        exported = YAMLMappingStore(self.export_dir)
+        self.assertEqual(exported.load('articles')[3]['title'], 'Renamed')
+        self.assertEqual(exported.load('folders'), {})
+
+    def test_next_id(self):
+        self.assertEqual(self.store.next_id('article', 3), 4)
+
+        # A second bot sharing the database never gets the same ID
+        other = SQLiteMappingStore(self.db_path)
+        self.assertEqual(other.next_id('article', 3), 5)
+        other.db.close()
+
+        self.assertEqual(self.store.next_id('article', 4), 6)
+        self.assertEqual(self.store.next_id('folder', 7), 8)
+
+        # Saving stale counters doesn't hand out IDs again
+        self.store.save('counters', MAPPINGS['counters'])
+        self.assertEqual(self.store.load('counters')['article'], 6)
+
+    def test_export_counters(self):
+        self.assertFalse(self.store.save('counters', MAPPINGS['counters']))
+
+        # next_id already wrote the counter, it still gets exported
+        counters = dict(MAPPINGS['counters'])
+        counters['article'] = self.store.next_id('article', counters['article'])
+        self.assertTrue(self.store.save('counters', counters))
+        exported = YAMLMappingStore(self.export_dir)
+        self.assertEqual(exported.load('counters'), counters)
+
+if __name__ == '__main__':
+    unittest.main()
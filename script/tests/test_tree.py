@@ -0,0 +1,81 @@
+from sys import path
+path.append('..')
+
+import os
+import tempfile
+import unittest
+
+from docmap.tree import scan_tree, CategoryDir, FolderDir, ArticleFile
+
+class TestArticleTree(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.article_dir = self.tmp.name
+        folder = os.path.join(self.article_dir, 'Basics--DOCID1', 'Launching--DOCID2')
+        os.makedirs(os.path.join(folder, 'images'))
+        os.makedirs(os.path.join(self.article_dir, 'New category', 'New folder'))
+        for name in ['Launch--DOCID3.md', 'Draft.md', '.gitignore']:
+            open(os.path.join(folder, name), 'w').close()
+        # Files below the folder level are never articles
+        open(os.path.join(folder, 'images', 'Nested.md'), 'w').close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_scan(self):
+        tree = scan_tree(self.article_dir)
+        self.assertEqual(
+            [c.title for c in tree.categories],
+            ['Basics', 'New category']
+        )
+        self.assertIsInstance(tree.categories[0], CategoryDir)
+        self.assertIsInstance(tree.categories[0].folders[0], FolderDir)
+        self.assertEqual(tree.category_ids(), {1})
+        self.assertEqual(tree.folder_ids(), {2})
+        self.assertEqual(tree.article_ids(), {3})
+
+        articles = list(tree.articles())
+        self.assertEqual([a.name for a in articles], ['Draft.md', 'Launch--DOCID3.md'])
+        self.assertIsInstance(articles[0], ArticleFile)
+        self.assertIsNone(articles[0].docid)
+        self.assertEqual(articles[1].folder.category.docid, 1)
+
+    def test_assign_docid(self):
+        tree = scan_tree(self.article_dir)
+        category = tree.categories[0]
+        tree.assign_docid(category, 7)
+
+        draft = category.folders[0].articles[0]
+        tree.assign_docid(draft, 9)
+
+        self.assertTrue(os.path.isfile(draft.path))
+        self.assertEqual(draft.name, 'Draft--DOCID9.md')
+        self.assertEqual(
+            draft.path,
+            os.path.join(self.article_dir, 'Basics--DOCID7', 'Launching--DOCID2', 'Draft--DOCID9.md')
+        )
+        self.assertEqual(scan_tree(self.article_dir).article_ids(), {3, 9})
+
+    def test_partial_scan(self):
+        tree = scan_tree(self.article_dir, [
+            'Basics--DOCID1/Launching--DOCID2/Launch--DOCID3.md',
+            'Basics--DOCID1/Launching--DOCID2/Gone--DOCID5.md',
+            'Basics--DOCID1/Removed--DOCID6/Article--DOCID7.md',
+            'Old--DOCID8/Folder--DOCID9/Article--DOCID10.md',
+        ])
+        self.assertEqual(tree.category_ids(), {1})
+        self.assertEqual(tree.folder_ids(), {2})
+        self.assertEqual(tree.article_ids(), {3})
+        self.assertEqual(tree.removed, {
+            'category': {8},
+            'folder': {6, 9},
+            'article': {5, 7, 10},
+        })
+
+        # Only removed entries are deletion candidates in a partial scan
+        self.assertTrue(tree.covers('article', 5))
+        self.assertFalse(tree.covers('article', 11))
+        self.assertTrue(scan_tree(self.article_dir).covers('article', 11))
+
+if __name__ == '__main__':
+    unittest.main()